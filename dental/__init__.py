@@ -0,0 +1,4 @@
+"""
+Dental Mobile Application core package
+Data layer and services shared by the Kivy app and headless tools
+"""
@@ -0,0 +1,247 @@
+"""
+Treatment analytics
+Typed column store over the treatments collection with cached grouped aggregates
+"""
+
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import date
+from itertools import islice
+from operator import le, methodcaller
+
+from dental.money import parse_cents
+from dental.archive import shared_archive
+from dental.storage import ADDED
+
+
+def _month_ordinal(year, month):
+    return date(year, month, 1).toordinal()
+
+
+def _date_ordinal(text):
+    try:
+        return date.fromisoformat(str(text).strip()).toordinal()
+    except ValueError:
+        return 0
+
+
+def _cents(cost):
+    return parse_cents(cost) or 0
+
+
+def month_starts(first, last):
+    """Ordinals of the first day of every month from first's month to last's, inclusive"""
+    first, last = date.fromordinal(first), date.fromordinal(last)
+    year, month = first.year, first.month
+    starts = []
+    while (year, month) <= (last.year, last.month):
+        starts.append(_month_ordinal(year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return starts
+
+
+class TreatmentColumns:
+    """Treatments as parallel typed arrays, sorted by date
+
+    dates holds date ordinals (0 when the date does not parse, which
+    sorts those rows first), cents holds costs in integer cents (0 when
+    the cost does not parse), and procedures and patients hold indexes
+    into the procedure_names and patient_ids dictionaries. Procedures are
+    grouped case-insensitively under the first spelling seen.
+
+    Because rows are sorted by date, a date range is a pair of bisects and
+    per-period totals are sums over array slices, which run in C; only
+    grouping by procedure or patient loops over the rows in range.
+    """
+
+    def __init__(self, treatments):
+        records = list(treatments.values())
+        self.procedure_names = []
+        self.patient_ids = []
+        self._procedure_codes = {}
+        self._patient_codes = {}
+
+        # Each column is built in two C-level passes: pull the field out of
+        # every record, then map it through a memo of its distinct values.
+        # Parsing and encoding therefore run once per distinct value.
+        dates = self._encode(records, 'date', _date_ordinal)
+        cents = self._encode(records, 'cost', _cents)
+        procedures = self._encode(records, 'procedure', self._procedure_code)
+        patients = self._encode(records, 'patient_id', self._patient_code)
+
+        # Treatments are normally recorded in date order, in which case
+        # the permutation can be skipped.
+        if not all(map(le, dates, islice(dates, 1, None))):
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            dates, cents, procedures, patients = (
+                list(map(column.__getitem__, order)) for column in (dates, cents, procedures, patients))
+        self.dates = array('l', dates)
+        self.cents = array('q', cents)
+        self.procedures = array('l', procedures)
+        self.patients = array('l', patients)
+
+    @staticmethod
+    def _encode(records, field, convert):
+        values = list(map(methodcaller('get', field), records))
+        memo = {}
+        for value in dict.fromkeys(values):
+            memo[value] = convert(value)
+        return list(map(memo.__getitem__, values))
+
+    def _procedure_code(self, name):
+        name = str(name or '').strip()
+        code = self._procedure_codes.get(name.casefold())
+        if code is None:
+            code = self._procedure_codes[name.casefold()] = len(self.procedure_names)
+            self.procedure_names.append(name)
+        return code
+
+    def _patient_code(self, patient_id):
+        patient_id = patient_id or ''
+        code = self._patient_codes.get(patient_id)
+        if code is None:
+            code = self._patient_codes[patient_id] = len(self.patient_ids)
+            self.patient_ids.append(patient_id)
+        return code
+
+    def __len__(self):
+        return len(self.dates)
+
+    def append(self, treatment):
+        """Add one treatment in O(1) if it sorts last; returns False if it would need a rebuild"""
+        ordinal = _date_ordinal(treatment.get('date'))
+        if self.dates and ordinal < self.dates[-1]:
+            return False
+        self.dates.append(ordinal)
+        self.cents.append(_cents(treatment.get('cost')))
+        self.procedures.append(self._procedure_code(treatment.get('procedure')))
+        self.patients.append(self._patient_code(treatment.get('patient_id')))
+        return True
+
+    def span(self, start=None, end=None):
+        """Row range [lo, hi) of treatments dated in [start, end); None leaves that side open"""
+        lo = bisect_left(self.dates, start.toordinal()) if start else 0
+        hi = bisect_left(self.dates, end.toordinal()) if end else len(self.dates)
+        return lo, max(lo, hi)
+
+    def total(self, start=None, end=None):
+        lo, hi = self.span(start, end)
+        return sum(self.cents[lo:hi]), hi - lo
+
+    def by_month(self, start=None, end=None):
+        """[(YYYY-MM, cents, count)] for every month in range, including empty months"""
+        lo, hi = self.span(start, end)
+        # Undated rows (ordinal 0) sort first and belong to no month.
+        lo = max(lo, bisect_left(self.dates, 1))
+        if lo >= hi:
+            return []
+        dates, cents = self.dates, self.cents
+        rows = []
+        for month_start in month_starts(dates[lo], dates[hi - 1]):
+            first = max(lo, bisect_left(dates, month_start))
+            month = date.fromordinal(month_start)
+            following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            last = min(hi, bisect_left(dates, following.toordinal(), first))
+            rows.append((month.strftime('%Y-%m'), sum(cents[first:last]), last - first))
+        return rows
+
+    def _grouped(self, codes, start, end):
+        lo, hi = self.span(start, end)
+        counts = Counter(codes[lo:hi])
+        totals = dict.fromkeys(counts, 0)
+        for code, value in zip(codes[lo:hi], self.cents[lo:hi]):
+            totals[code] += value
+        return [(code, totals[code], counts[code])
+                for code in sorted(totals, key=lambda code: (-totals[code], -counts[code]))]
+
+    def by_procedure(self, start=None, end=None, limit=None):
+        """[(procedure, cents, count)], highest revenue first"""
+        rows = self._grouped(self.procedures, start, end)[:limit]
+        return [(self.procedure_names[code], cents, count) for code, cents, count in rows]
+
+    def by_patient(self, start=None, end=None, limit=None):
+        """[(patient_id, cents, count)], highest revenue first"""
+        rows = self._grouped(self.patients, start, end)[:limit]
+        return [(self.patient_ids[code], cents, count) for code, cents, count in rows]
+
+
+class TreatmentAnalytics:
+    """Cached reports over the treatments collection
+
+    The columns are built on first use. A newly added treatment dated on
+    or after the latest one (the usual case: today's work) is appended to
+    them in place; any other change bumps the data version and the columns
+    are rebuilt on the next report. Each report's result is cached under
+    its arguments until the next change, so reopening a report costs a
+    dictionary lookup.
+
+    Reports that start before the archive horizon (including all-time
+    ones) run over a second set of columns that also holds the archived
+    treatments; the rest never open the archive.
+    """
+
+    def __init__(self, data_mgr):
+        self.data_mgr = data_mgr
+        self.archive = shared_archive(data_mgr)
+        self.version = 0
+        # archive version (None: collection file only) -> (data version, columns)
+        self._columns = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        data_mgr.subscribe(data_mgr.treatments_file, self._on_change)
+
+    def _on_change(self, event, treatment_id, treatment):
+        with self._lock:
+            self._results.clear()
+            self.version += 1
+            for archived, (version, columns) in list(self._columns.items()):
+                if event == ADDED and version == self.version - 1 and columns.append(treatment):
+                    self._columns[archived] = (self.version, columns)
+                else:
+                    del self._columns[archived]
+
+    def _archived(self, start):
+        return self.archive.version if self.archive.covers(start) else None
+
+    def columns(self, start=None):
+        """The columns a report starting at start (None: all time) runs over"""
+        archived = self._archived(start)
+        with self._lock:
+            cached = self._columns.get(archived)
+            if cached is None or cached[0] != self.version:
+                treatments = self.data_mgr.get_treatments()
+                if archived is not None:
+                    treatments = {**self.archive.records_between('treatments'), **treatments}
+                # Columns over an older archive are no longer needed
+                self._columns = {key: value for key, value in self._columns.items()
+                                 if key is None}
+                cached = self._columns[archived] = (self.version, TreatmentColumns(treatments))
+            return cached[1]
+
+    def _report(self, name, *args):
+        start = args[0]
+        key = (name, self._archived(start)) + args
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+            version = self.version
+        result = getattr(self.columns(start), name)(*args)
+        with self._lock:
+            if version == self.version:
+                self._results[key] = result
+        return result
+
+    def total(self, start=None, end=None):
+        """(cents, count) of treatments dated in [start, end)"""
+        return self._report('total', start, end)
+
+    def revenue_by_month(self, start=None, end=None):
+        return self._report('by_month', start, end)
+
+    def revenue_by_procedure(self, start=None, end=None, limit=None):
+        return self._report('by_procedure', start, end, limit)
+
+    def revenue_by_patient(self, start=None, end=None, limit=None):
+        return self._report('by_patient', start, end, limit)
@@ -0,0 +1,309 @@
+"""
+Record archive
+Moves appointments and treatments older than a horizon into compressed monthly segments
+
+    dental archive --days 730
+    DENTAL_ARCHIVE_DAYS=730 python main.py
+"""
+
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import lru_cache
+
+from dental.ids import id_sort_key
+from dental.locking import file_lock
+from dental.schedule import parse_date
+from dental.storage import UPDATE_RETRIES, StaleDataError, _sync_directory
+
+ARCHIVED_COLLECTIONS = ('appointments', 'treatments')
+DEFAULT_HORIZON_DAYS = 730
+ARCHIVE_DIR = 'archive'
+MANIFEST_FILE = 'manifest.json'
+INDEX_FILE = 'index.json.gz'
+SEGMENT_SUFFIX = '.json.gz'
+# Decoded segments kept in memory; a patient's history or a year's report
+# touches a handful of months
+SEGMENT_CACHE_SIZE = 24
+
+
+@lru_cache(maxsize=8192)
+def _dated(text):
+    """(date, YYYY-MM) for a stored date, or None if it does not parse; dates repeat, so cached"""
+    try:
+        day = parse_date(text)
+    except ValueError:
+        return None
+    return day, f'{day.year:04d}-{day.month:02d}'
+
+
+def record_date(record):
+    """(date, YYYY-MM segment) of a record, or None if its date does not parse"""
+    text = record.get('date')
+    return _dated(text) if isinstance(text, str) else None
+
+
+def horizon(days, today=None):
+    """The first date kept in the collection files when archiving records older than days"""
+    return (today or date.today()) - timedelta(days=days)
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_gzip_json(path):
+    with gzip.open(path, 'rb') as f:
+        return json.loads(f.read())
+
+
+def _write_atomic(path, payload):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _sync_directory(path)
+
+
+def _write_gzip_json(path, data):
+    payload = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    _write_atomic(path, gzip.compress(payload, compresslevel=6))
+
+
+class Archive:
+    """Archived records of one data directory, read on demand
+
+    Each collection's archived records live in one gzip-compressed JSON
+    segment per month of their date (archive/treatments/2021-03.json.gz),
+    beside an index of record ID -> [month, patient ID]. manifest.json
+    records the horizon: every record dated before it is in either the
+    collection file or the archive, and nothing on or after it is
+    archived, so only reads that reach back before it need the archive.
+
+    Segments are opened lazily and the decoded ones kept in a small LRU
+    cache, checked against the file so other processes' archive runs are
+    noticed. A record in both the collection file and the archive (after
+    an interrupted run, or an archived ID saved again) is read from the
+    collection file.
+    """
+
+    def __init__(self, data_dir='data'):
+        self.root = os.path.join(data_dir, ARCHIVE_DIR)
+        self.manifest_path = os.path.join(self.root, MANIFEST_FILE)
+        self.lock_path = os.path.join(self.root, 'archive.lock')
+        self._manifest = (None, {})
+        self._indexes = {}
+        self._segments = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _path(self, collection, name):
+        return os.path.join(self.root, collection, name)
+
+    def manifest(self):
+        """{'before': YYYY-MM-DD, 'collections': {collection: {month: count}}}, or {} before the first run"""
+        signature = _signature(self.manifest_path)
+        with self._lock:
+            if signature != self._manifest[0]:
+                try:
+                    with open(self.manifest_path, 'r') as f:
+                        manifest = json.load(f)
+                except FileNotFoundError:
+                    manifest = {}
+                self._manifest = (signature, manifest)
+            return self._manifest[1]
+
+    @property
+    def version(self):
+        """An opaque token that changes whenever an archive run completes"""
+        return _signature(self.manifest_path)
+
+    @property
+    def before(self):
+        """The archive horizon as a date, or None if nothing was ever archived"""
+        before = self.manifest().get('before')
+        return parse_date(before) if before else None
+
+    def covers(self, start):
+        """True if records dated on or after start (None: all of them) may be in the archive"""
+        before = self.before
+        return before is not None and (start is None or start < before)
+
+    def _index(self, collection):
+        """Return ({record_id: [month, patient_id]}, {patient_id: {month}}) for collection"""
+        path = self._path(collection, INDEX_FILE)
+        signature = _signature(path)
+        with self._lock:
+            cached = self._indexes.get(collection)
+            if cached is not None and cached[0] == signature:
+                return cached[1], cached[2]
+        entries = _read_gzip_json(path) if signature is not None else {}
+        by_patient = {}
+        for period, patient_id in entries.values():
+            by_patient.setdefault(patient_id, set()).add(period)
+        with self._lock:
+            self._indexes[collection] = (signature, entries, by_patient)
+        return entries, by_patient
+
+    def segment(self, collection, period):
+        """Return the {record_id: record} archived for one month (shared; treat as read-only)"""
+        path = self._path(collection, period + SEGMENT_SUFFIX)
+        signature = _signature(path)
+        if signature is None:
+            return {}
+        with self._lock:
+            cached = self._segments.get(path)
+            if cached is not None and cached[0] == signature:
+                self._segments.move_to_end(path)
+                return cached[1]
+        records = _read_gzip_json(path)
+        with self._lock:
+            self._segments[path] = (signature, records)
+            self._segments.move_to_end(path)
+            while len(self._segments) > SEGMENT_CACHE_SIZE:
+                self._segments.popitem(last=False)
+        return records
+
+    def periods(self, collection):
+        return sorted(self.manifest().get('collections', {}).get(collection, {}))
+
+    def record_ids(self, collection):
+        """IDs of every archived record of collection, from the index alone"""
+        return list(self._index(collection)[0])
+
+    def get(self, collection, record_id):
+        """Return one archived record, or None"""
+        entry = self._index(collection)[0].get(record_id)
+        if entry is None:
+            return None
+        return self.segment(collection, entry[0]).get(record_id)
+
+    def patient_records(self, collection, patient_id):
+        """Return {record_id: record} of one patient's archived records, opening only their months"""
+        records = {}
+        for period in sorted(self._index(collection)[1].get(patient_id, ())):
+            for record_id, record in self.segment(collection, period).items():
+                if record.get('patient_id') == patient_id:
+                    records[record_id] = record
+        return records
+
+    def records_between(self, collection, start=None, end=None):
+        """Return {record_id: record} of archived records dated in [start, end); None leaves that side open"""
+        first = start.strftime('%Y-%m') if start else None
+        last = end.strftime('%Y-%m') if end else None
+        records = {}
+        for period in self.periods(collection):
+            if (first and period < first) or (last and period > last):
+                continue
+            segment = self.segment(collection, period)
+            if (start and period == first) or (end and period == last):
+                segment = {record_id: record for record_id, record in segment.items()
+                           if (start is None or record_date(record)[0] >= start)
+                           and (end is None or record_date(record)[0] < end)}
+            records.update(segment)
+        return records
+
+    def archive(self, data_mgr, before, collections=ARCHIVED_COLLECTIONS):
+        """Move the records dated before before out of the collection files
+
+        before is capped at today, so upcoming appointments always stay.
+        Records are written to their segments (merged with what is there,
+        so running again, or after an interrupted run, is harmless) and
+        to the index before they are dropped from the collection file, so
+        a crash leaves them in both places rather than in neither.
+        Returns {collection: records archived}.
+        """
+        before = min(before, date.today())
+        counts = {}
+        os.makedirs(self.root, exist_ok=True)
+        with file_lock(self.lock_path):
+            manifest = dict(self.manifest())
+            manifest.setdefault('collections', {})
+            for collection in collections:
+                counts[collection] = self._archive_collection(data_mgr, collection, before, manifest)
+            previous = manifest.get('before')
+            if previous is None or parse_date(previous) < before:
+                manifest['before'] = before.isoformat()
+            tmp_path = self.manifest_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.manifest_path)
+        return counts
+
+    def _archive_collection(self, data_mgr, collection, before, manifest):
+        filename = data_mgr.file_for(collection)
+        for attempt in range(UPDATE_RETRIES + 1):
+            data, version = data_mgr.load_versioned(filename)
+            by_period = {}
+            for record_id, record in data.items():
+                dated = record_date(record)
+                if dated is not None and dated[0] < before:
+                    by_period.setdefault(dated[1], {})[record_id] = record
+            if not by_period:
+                return 0
+            self._write_segments(collection, by_period, manifest)
+            archived = [record_id for records in by_period.values() for record_id in records]
+            # IDs of archived records must never be handed out again
+            data_mgr.reserve_id(collection, max(archived, key=id_sort_key))
+            try:
+                return data_mgr.archive_records(filename, archived, expected_version=version)
+            except StaleDataError:
+                if attempt == UPDATE_RETRIES:
+                    raise
+
+    def _write_segments(self, collection, by_period, manifest):
+        os.makedirs(os.path.join(self.root, collection), exist_ok=True)
+        entries = dict(self._index(collection)[0])
+        counts = manifest['collections'].setdefault(collection, {})
+        for period, records in sorted(by_period.items()):
+            segment = dict(self.segment(collection, period))
+            segment.update(records)
+            _write_gzip_json(self._path(collection, period + SEGMENT_SUFFIX), segment)
+            counts[period] = len(segment)
+            for record_id, record in records.items():
+                previous = entries.get(record_id)
+                if previous is not None and previous[0] != period:
+                    # Re-archived after its date was changed: one copy only
+                    self._drop(collection, previous[0], record_id, counts)
+                entries[record_id] = [period, record.get('patient_id')]
+        _write_gzip_json(self._path(collection, INDEX_FILE), entries)
+
+    def _drop(self, collection, period, record_id, counts):
+        segment = dict(self.segment(collection, period))
+        if segment.pop(record_id, None) is not None:
+            _write_gzip_json(self._path(collection, period + SEGMENT_SUFFIX), segment)
+            counts[period] = len(segment)
+
+    def status(self):
+        """Return (horizon date or None, {collection: (records, segments, bytes on disk)})"""
+        collections = {}
+        for collection, periods in self.manifest().get('collections', {}).items():
+            size = sum(os.path.getsize(self._path(collection, period + SEGMENT_SUFFIX))
+                       for period in periods
+                       if os.path.exists(self._path(collection, period + SEGMENT_SUFFIX)))
+            collections[collection] = (sum(periods.values()), len(periods), size)
+        return self.before, collections
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_archive(data_mgr):
+    """Return the process-wide Archive for data_mgr's data directory"""
+    key = os.path.abspath(data_mgr.data_dir)
+    with _shared_lock:
+        archive = _shared.get(key)
+        if archive is None:
+            archive = _shared[key] = Archive(data_mgr.data_dir)
+        return archive
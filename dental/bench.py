@@ -0,0 +1,671 @@
+"""
+Benchmarks
+Times the data layer, screen builds and app startup on seeded synthetic data
+
+    python -m dental.bench run --scales 1k,10k --backends json,sqlite
+    python -m dental.bench run --format compact --backends json,journal
+    python -m dental.bench compare bench_results/old.json bench_results/new.json
+
+Each scale, backend and group of cases runs in its own process, so caches
+start cold and the process's peak RSS belongs to that batch. Results are
+written as JSON together with the commit they were measured on.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+from operator import attrgetter
+
+from dental import compact
+from dental.ids import format_id
+from dental.storage import ChangeNotifier, DataManager, DataStore, JsonFileBackend, create_backend
+from dental.synthetic import counts_for, parse_scale, populate, scale_name
+
+RESULTS_FORMAT = 1
+BACKENDS = ('json', 'journal', 'sqlite')
+GROUPS = ('data', 'ui', 'startup')
+DEFAULT_SCALES = '1k,10k'
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 10.0  # percent
+INSERTS = 10  # records added per run of the insert case
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {}
+
+
+def case(name, group):
+    """Register a benchmark
+
+    The decorated function takes a BenchContext, does any setup, and
+    returns (run, ops): run is timed, and ops is the number of records or
+    operations one run handles, used for per-operation figures.
+    """
+    def register(fn):
+        CASES[name] = (group, fn)
+        return fn
+    return register
+
+
+class BenchContext:
+    def __init__(self, data_dir, backend, size):
+        self.data_dir = data_dir
+        self.backend = backend
+        self.size = size
+        self.counts = counts_for(size)
+        self.total = sum(self.counts.values())
+
+    def fresh_backend(self):
+        """A backend instance with nothing cached"""
+        if self.backend == 'json':
+            return JsonFileBackend(DataStore())
+        return create_backend(self.backend)
+
+    def data_manager(self, backend=None):
+        return DataManager(self.data_dir, backend=backend or self.fresh_backend(),
+                           notifier=ChangeNotifier())
+
+
+# Data layer -----------------------------------------------------------------
+
+@case('load', 'data')
+def bench_load(ctx):
+    """Read every collection with a cold cache"""
+    def run():
+        data_mgr = ctx.data_manager()
+        try:
+            for collection in ctx.counts:
+                data_mgr.load_data(data_mgr.file_for(collection))
+        finally:
+            data_mgr.backend.close()
+    return run, ctx.total
+
+
+@case('load-cached', 'data')
+def bench_load_cached(ctx):
+    """Read every collection again once it is cached"""
+    data_mgr = ctx.data_manager()
+    files = [data_mgr.file_for(collection) for collection in ctx.counts]
+    for filename in files:
+        data_mgr.load_data(filename)
+
+    def run():
+        for filename in files:
+            data_mgr.load_data(filename)
+    return run, ctx.total
+
+
+@case('get-record', 'data')
+def bench_get_record(ctx):
+    """Look up a few patients with a cold cache, as opening a patient's details does"""
+    count = ctx.counts['patients']
+    patient_ids = [format_id('patients', number) for number in (1, count // 2 or 1, count)]
+
+    def run():
+        data_mgr = ctx.data_manager()
+        try:
+            for patient_id in patient_ids:
+                data_mgr.get_patient(patient_id)
+        finally:
+            data_mgr.backend.close()
+    # The first lookup after a write rebuilds the JSON backend's offset index
+    run()
+    return run, len(patient_ids)
+
+
+@case('iterate', 'data')
+def bench_iterate(ctx):
+    """Stream every appointment with a cold cache"""
+    def run():
+        data_mgr = ctx.data_manager()
+        try:
+            for _ in data_mgr.iter_records(data_mgr.appointments_file):
+                pass
+        finally:
+            data_mgr.backend.close()
+    run()
+    return run, ctx.counts['appointments']
+
+
+@case('save', 'data')
+def bench_save(ctx):
+    """Write the whole patients collection"""
+    data_mgr = ctx.data_manager()
+    patients = data_mgr.get_patients()
+    return lambda: data_mgr.save_patients(patients), len(patients)
+
+
+@case('dashboard', 'data')
+def bench_dashboard(ctx):
+    """Build the dashboard counters and read today's figures"""
+    from dental.stats import PracticeStats
+    data_mgr = ctx.data_manager()
+    for collection in ctx.counts:
+        data_mgr.load_data(data_mgr.file_for(collection))
+    today = date.today().isoformat()
+
+    def run():
+        stats = PracticeStats(data_mgr)
+        return stats.patients_total, stats.appointments_on(today), stats.revenue_on(today)
+    return run, ctx.total
+
+
+@case('search-index', 'data')
+def bench_search_index(ctx):
+    """Index every patient for search and run a query"""
+    from dental.search import PatientSearchIndex
+    data_mgr = ctx.data_manager()
+    data_mgr.get_patients()
+    return lambda: PatientSearchIndex(data_mgr).search('smith'), ctx.counts['patients']
+
+
+@case('schedule', 'data')
+def bench_schedule(ctx):
+    """Build the appointment interval index"""
+    from dental.schedule import AppointmentSchedule
+    data_mgr = ctx.data_manager()
+    data_mgr.get_appointments()
+    return lambda: AppointmentSchedule(data_mgr), ctx.counts['appointments']
+
+
+@case('reports', 'data')
+def bench_reports(ctx):
+    """Build the treatment columns and every all-time report"""
+    from dental.analytics import TreatmentAnalytics
+    data_mgr = ctx.data_manager()
+    data_mgr.get_treatments()
+
+    def run():
+        analytics = TreatmentAnalytics(data_mgr)
+        analytics.total()
+        analytics.revenue_by_month()
+        analytics.revenue_by_procedure()
+        analytics.revenue_by_patient(limit=10)
+    return run, ctx.counts['treatments']
+
+
+@case('records', 'data')
+def bench_records(ctx):
+    """Convert every collection to typed records from a warm cache"""
+    data_mgr = ctx.data_manager()
+    for collection in ctx.counts:
+        data_mgr.load_data(data_mgr.file_for(collection))
+    return lambda: [data_mgr.load_records(collection) for collection in ctx.counts], ctx.total
+
+
+@case('sort-records', 'data')
+def bench_sort_records(ctx):
+    """Sort every appointment and treatment as their lists do"""
+    data_mgr = ctx.data_manager()
+    appointments = data_mgr.load_records('appointments')
+    treatments = data_mgr.load_records('treatments')
+
+    def run():
+        sorted(appointments, key=attrgetter('sort_key'))
+        sorted(treatments, key=attrgetter('sort_key'), reverse=True)
+    return run, len(appointments) + len(treatments)
+
+
+@case('load-archived', 'data')
+def bench_load_archived(ctx):
+    """Read every collection and a few patients' full histories after archiving all but the last year"""
+    from dental.archive import ARCHIVED_COLLECTIONS, Archive, horizon
+    data_dir = ctx.data_dir + '-archived'
+    shutil.rmtree(data_dir, ignore_errors=True)
+    shutil.copytree(ctx.data_dir, data_dir)
+    data_mgr = DataManager(data_dir, backend=ctx.fresh_backend(), notifier=ChangeNotifier())
+    Archive(data_dir).archive(data_mgr, horizon(365))
+    data_mgr.backend.close()
+    count = ctx.counts['patients']
+    patient_ids = [format_id('patients', number) for number in (1, count // 2 or 1, count)]
+
+    def run():
+        data_mgr = DataManager(data_dir, backend=ctx.fresh_backend(), notifier=ChangeNotifier())
+        try:
+            for collection in ctx.counts:
+                data_mgr.load_data(data_mgr.file_for(collection))
+        finally:
+            data_mgr.backend.close()
+        archive = Archive(data_dir)
+        for patient_id in patient_ids:
+            for collection in ARCHIVED_COLLECTIONS:
+                archive.patient_records(collection, patient_id)
+    return run, ctx.total
+
+
+@case('insert', 'data')
+def bench_insert(ctx):
+    """Add patients one at a time, as the patient dialog does"""
+    data_mgr = ctx.data_manager()
+    data_mgr.get_patients()
+    patient = {'name': 'Bench Patient', 'phone': '555-000-0000', 'email': '', 'dob': '',
+               'created_at': '2024-01-01 00:00:00'}
+
+    def run():
+        for _ in range(INSERTS):
+            data_mgr.put_patient(data_mgr.next_patient_id(), patient)
+    return run, INSERTS
+
+
+# Screens --------------------------------------------------------------------
+
+def _settle(timeout=600):
+    """Run frames until the I/O worker and the callbacks it scheduled are done
+
+    Returns the time at which the app first went quiet, so the trailing
+    frames that confirm it is quiet are not counted.
+    """
+    from kivy.base import EventLoop
+    from main import io_worker
+    deadline = time.perf_counter() + timeout
+    quiet_since, quiet_frames = None, 0
+    while quiet_frames < 3:
+        if time.perf_counter() > deadline:
+            raise TimeoutError('screen did not settle')
+        EventLoop.idle()
+        if io_worker.is_idle():
+            quiet_since = quiet_since or time.perf_counter()
+            quiet_frames += 1
+        else:
+            io_worker.wait_idle(0.05)
+            quiet_since, quiet_frames = None, 0
+    return quiet_since
+
+
+def _screen_case(name, factory_name, rebuild=False):
+    def bench(ctx):
+        import main
+        from kivy.core.window import Window
+        factory = getattr(main, factory_name)
+        screen = None
+        if rebuild:
+            screen = factory()
+            Window.add_widget(screen)
+            _settle()
+
+        def run():
+            nonlocal screen
+            started = time.perf_counter()
+            if rebuild:
+                screen.build_ui()
+            else:
+                if screen is not None:
+                    Window.remove_widget(screen)
+                screen = factory()
+                Window.add_widget(screen)
+            return _settle() - started
+        return run, 1
+    bench.__doc__ = f"{'Rebuild' if rebuild else 'Open'} the {name} screen until its data is shown"
+    return bench
+
+
+for _name, _factory in (('home', 'HomeScreen'), ('patients', 'PatientsScreen'),
+                        ('appointments', 'AppointmentsScreen'), ('treatments', 'TreatmentsScreen'),
+                        ('reports', 'ReportsScreen')):
+    case(f'screen-{_name}', 'ui')(_screen_case(_name, _factory))
+for _name, _factory in (('patients', 'PatientsScreen'), ('appointments', 'AppointmentsScreen'),
+                        ('treatments', 'TreatmentsScreen')):
+    case(f'rebuild-{_name}', 'ui')(_screen_case(_name, _factory, rebuild=True))
+
+
+# App startup ----------------------------------------------------------------
+
+_STARTUP_SCRIPT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import main
+from kivy.clock import Clock
+from kivy.core.window import Window
+app = main.DentalApp()
+def first_frame(*args):
+    Window.unbind(on_flip=first_frame)
+    seconds = time.perf_counter() - started
+    json.dump({'seconds': seconds, 'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss},
+              sys.__stderr__)
+    Clock.schedule_once(lambda dt: app.stop())
+app.bind(on_start=lambda *args: Window.bind(on_flip=first_frame))
+app.run()
+'''
+
+
+@case('startup', 'startup')
+def bench_startup(ctx):
+    """Start the app in a new process and wait for its first frame"""
+    env = dict(_headless_env(), DENTAL_STORAGE=ctx.backend, DENTAL_PREWARM='0',
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    peaks = []
+
+    def run():
+        result = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT], env=env,
+                                cwd=os.path.dirname(ctx.data_dir), capture_output=True, text=True)
+        report = result.stderr.strip().rsplit('\n', 1)[-1]
+        if result.returncode != 0 or not report.startswith('{'):
+            raise RuntimeError(f"app failed to start:\n{result.stderr}")
+        report = json.loads(report)
+        peaks.append(report['rss_kb'])
+        return report['seconds']
+    run.peak_rss = peaks
+    return run, 1
+
+
+# Running --------------------------------------------------------------------
+
+def _headless_env():
+    """Environment that lets Kivy open its window without a display"""
+    env = {'KIVY_NO_ARGS': '1', 'KIVY_NO_CONSOLELOG': '1', 'KIVY_NO_FILELOG': '1'}
+    if not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')):
+        env['SDL_VIDEODRIVER'] = 'offscreen'
+    return dict(env, **os.environ)
+
+
+def _prepare_headless():
+    """Open Kivy's window headless and without throttling frames"""
+    os.environ.update(_headless_env())
+    from kivy.config import Config
+    Config.set('graphics', 'maxfps', '0')
+
+
+def _max_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def measure(name, ctx, repeat, trace_memory=True):
+    """Time one case; returns its result dict"""
+    group, bench = CASES[name]
+    run, ops = bench(ctx)
+    times = []
+    for _ in range(repeat):
+        # Start every run without garbage left over from the previous one.
+        gc.collect()
+        started = time.perf_counter()
+        reported = run()
+        elapsed = time.perf_counter() - started
+        # Screen and startup runs report their own end-to-end time.
+        times.append(reported if isinstance(reported, float) else elapsed)
+
+    peak_kb = None
+    if trace_memory and group != 'startup':
+        tracemalloc.start()
+        try:
+            run()
+            peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+
+    median = statistics.median(times)
+    rss = getattr(run, 'peak_rss', None)
+    return {
+        'case': name,
+        'group': group,
+        'scale': scale_name(ctx.size),
+        'size': ctx.size,
+        'backend': ctx.backend,
+        'ops': ops,
+        'runs': len(times),
+        'times': times,
+        'min': min(times),
+        'median': median,
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'per_op_us': median / ops * 1e6 if ops else None,
+        'peak_kb': peak_kb,
+        'rss_kb': max(rss) if rss else _max_rss_kb(),
+    }
+
+
+def run_child(spec):
+    """Run one (scale, backend, group) batch of cases; called in a fresh process"""
+    os.environ['DENTAL_STORAGE'] = spec['backend']
+    os.environ['DENTAL_FORMAT'] = spec['file_format']
+    if spec['group'] == 'ui':
+        _prepare_headless()
+    data_dir = spec['data_dir']
+    os.chdir(os.path.dirname(data_dir))
+    ctx = BenchContext(data_dir, spec['backend'], spec['size'])
+    results = [measure(name, ctx, spec['repeat'], spec['trace_memory']) for name in spec['cases']]
+    if spec['group'] == 'ui':
+        from main import io_worker
+        io_worker.stop()
+    with open(spec['output'], 'w') as f:
+        json.dump(results, f)
+
+
+def dataset(workdir, size, seed, backend, file_format='json'):
+    """Return the data directory of a generated dataset, generating it if needed
+
+    Datasets are generated once per scale and seed with the JSON backend,
+    then copied per storage backend and file format so writes made by one
+    backend's runs never reach another's.
+    """
+    base = os.path.join(workdir, f'{scale_name(size)}-seed{seed}', 'json', 'data')
+    manifest = os.path.join(base, 'synthetic.json')
+    if not os.path.exists(manifest):
+        shutil.rmtree(os.path.dirname(base), ignore_errors=True)
+        started = time.perf_counter()
+        counts = populate(DataManager(base, backend=JsonFileBackend(DataStore('json')),
+                                      notifier=ChangeNotifier()), size, seed)
+        print(f"generated {scale_name(size)} (seed {seed}) in {time.perf_counter() - started:.1f}s",
+              file=sys.stderr)
+        with open(manifest, 'w') as f:
+            json.dump({'size': size, 'seed': seed, 'today': date.today().isoformat(),
+                       'counts': counts}, f)
+    copy = backend if file_format == 'json' else f'{backend}-{file_format}'
+    data_dir = os.path.join(workdir, f'{scale_name(size)}-seed{seed}', copy, 'data')
+    # Runs modify their copy (inserts), so every invocation starts from a fresh one.
+    if data_dir != base:
+        shutil.rmtree(os.path.dirname(data_dir), ignore_errors=True)
+        shutil.copytree(base, data_dir)
+        if file_format != 'json':
+            compact.convert(data_dir, file_format)
+    if backend == 'sqlite':
+        # Opening the database imports the JSON files; do it outside the timings.
+        backend_instance = create_backend('sqlite')
+        DataManager(data_dir, backend=backend_instance).get_patients()
+        backend_instance.close()
+    return data_dir
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    try:
+        return git('rev-parse', 'HEAD'), bool(git('status', '--porcelain', '--untracked-files=no'))
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run_benchmarks(scales, backends, cases, repeat, seed, workdir, trace_memory=True,
+                   file_format='json'):
+    results = []
+    for size in scales:
+        for backend in backends:
+            data_dir = dataset(workdir, size, seed, backend, file_format)
+            for group in GROUPS:
+                names = [name for name in cases if CASES[name][0] == group]
+                if not names:
+                    continue
+                print(f"{scale_name(size)} {backend} {group}: {', '.join(names)}", file=sys.stderr)
+                output = os.path.join(workdir, 'results.json')
+                spec = {'data_dir': data_dir, 'backend': backend, 'file_format': file_format,
+                        'size': size, 'group': group, 'cases': names, 'repeat': repeat,
+                        'trace_memory': trace_memory, 'output': output}
+                env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+                    filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+                subprocess.run([sys.executable, '-m', 'dental.bench', '_child', json.dumps(spec)],
+                               env=env, check=True)
+                with open(output) as f:
+                    results.extend(json.load(f))
+    return results
+
+
+def format_results(results):
+    lines = [f"{'case':<22} {'scale':>6} {'backend':<8} {'median':>10} {'min':>10} "
+             f"{'per op':>10} {'peak':>9} {'rss':>9}"]
+    for result in results:
+        per_op = result['per_op_us'] if result['ops'] > 1 else None
+        peak = result['peak_kb']
+        lines.append(
+            f"{result['case']:<22} {result['scale']:>6} {result['backend']:<8} "
+            f"{result['median'] * 1000:>8.1f}ms {result['min'] * 1000:>8.1f}ms "
+            f"{f'{per_op:.2f}us' if per_op is not None else '-':>10} "
+            f"{f'{peak / 1024:.1f}M' if peak is not None else '-':>9} "
+            f"{result['rss_kb'] / 1024:>8.1f}M")
+    return '\n'.join(lines)
+
+
+def compare(base, new, threshold=DEFAULT_THRESHOLD, stat='median'):
+    """Return (report lines, regressions) comparing two results files on stat (median or min)"""
+    def keyed(document):
+        return {(r['case'], r['scale'], r['backend']): r for r in document['results']}
+
+    old, current = keyed(base), keyed(new)
+    lines = [f"{(base.get('commit') or 'base')[:10]} -> {(new.get('commit') or 'new')[:10]}",
+             f"{'case':<22} {'scale':>6} {'backend':<8} {'before':>10} {'after':>10} {'change':>8}"
+             f" {'peak':>8}"]
+    regressions = []
+    for key in sorted(old.keys() & current.keys()):
+        before, after = old[key][stat], current[key][stat]
+        change = (after - before) / before * 100 if before else 0.0
+        peak_change = ''
+        if old[key]['peak_kb'] and current[key]['peak_kb'] is not None:
+            peak_change = f"{(current[key]['peak_kb'] - old[key]['peak_kb']) / old[key]['peak_kb']:+.0%}"
+        flag = ''
+        if change > threshold:
+            flag = '  slower'
+            regressions.append(key)
+        elif change < -threshold:
+            flag = '  faster'
+        lines.append(f"{key[0]:<22} {key[1]:>6} {key[2]:<8} {before * 1000:>8.1f}ms "
+                     f"{after * 1000:>8.1f}ms {change:>+7.1f}% {peak_change:>8}{flag}")
+    for key in sorted(old.keys() ^ current.keys()):
+        lines.append(f"{key[0]:<22} {key[1]:>6} {key[2]:<8} only in "
+                     f"{'base' if key in old else 'new'}")
+    return lines, regressions
+
+
+def cmd_run(args):
+    try:
+        scales = [parse_scale(scale) for scale in args.scales.split(',')]
+    except ValueError as error:
+        raise SystemExit(str(error))
+    backends = args.backends.split(',')
+    for backend in backends:
+        if backend not in BACKENDS:
+            raise SystemExit(f"unknown backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    groups = args.groups.split(',')
+    cases = [name for name, (group, _) in CASES.items() if group in groups]
+    if args.cases:
+        wanted = args.cases.split(',')
+        unknown = [name for name in wanted if name not in CASES]
+        if unknown:
+            raise SystemExit(f"unknown case {', '.join(unknown)}; choose from {', '.join(CASES)}")
+        cases = [name for name in cases if name in wanted]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='dental-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = run_benchmarks(scales, backends, cases, args.repeat, args.seed,
+                                 os.path.abspath(workdir), trace_memory=not args.no_memory,
+                                 file_format=args.format)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    commit, dirty = git_revision()
+    document = {
+        'format': RESULTS_FORMAT,
+        'commit': commit,
+        'dirty': dirty,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'file_format': args.format,
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join('bench_results', f"{stamp}-{(commit or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(format_results(results))
+    print(f"results written to {output}")
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    lines, regressions = compare(base, new, args.threshold, args.stat)
+    print('\n'.join(lines))
+    if regressions:
+        print(f"{len(regressions)} case(s) slower by more than {args.threshold:g}%")
+        return 1
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m dental.bench',
+                                     description='Dental Practice Manager benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runner = commands.add_parser('run', help='run benchmarks and write a results file')
+    runner.add_argument('--scales', default=DEFAULT_SCALES,
+                        help=f'comma-separated scales, e.g. 1k,10k,100k,1m (default: {DEFAULT_SCALES})')
+    runner.add_argument('--backends', default='json',
+                        help=f"comma-separated storage backends: {', '.join(BACKENDS)} (default: json)")
+    runner.add_argument('--format', choices=compact.FORMATS, default='json',
+                        help='data file format the collections are stored in (default: json)')
+    runner.add_argument('--groups', default=','.join(GROUPS),
+                        help=f"comma-separated case groups: {', '.join(GROUPS)} (default: all)")
+    runner.add_argument('--cases', help='comma-separated case names (default: every case in the groups)')
+    runner.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f'timed runs per case (default: {DEFAULT_REPEAT})')
+    runner.add_argument('--seed', type=int, default=0, help='synthetic data seed (default: 0)')
+    runner.add_argument('--workdir',
+                        help='keep generated datasets here and reuse them (default: a temporary directory)')
+    runner.add_argument('--output', help='results file (default: bench_results/<time>-<commit>.json)')
+    runner.add_argument('--no-memory', action='store_true',
+                        help='skip the extra traced run that measures peak allocations')
+    runner.set_defaults(handler=cmd_run)
+
+    comparer = commands.add_parser('compare', help='compare two results files')
+    comparer.add_argument('base')
+    comparer.add_argument('new')
+    comparer.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                          help=f'percent change reported as a regression (default: {DEFAULT_THRESHOLD:g})')
+    comparer.add_argument('--stat', choices=('median', 'min'), default='median',
+                          help='statistic to compare; min is steadier on noisy machines (default: median)')
+    comparer.set_defaults(handler=cmd_compare)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['_child']:
+        run_child(json.loads(argv[1]))
+        return 0
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
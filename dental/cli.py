@@ -0,0 +1,261 @@
+"""
+Command-line interface
+Headless bulk import/export, plus a launcher for the app
+
+    dental import patients clinic.csv
+    dental export treatments treatments.jsonl
+    dental generate --scale 10k
+    dental convert compact
+    dental archive --days 730
+    dental sync-server --port 8765
+    dental sync --server http://192.168.1.10:8765
+    dental run
+"""
+
+import argparse
+import os
+import sys
+
+from dental import archive, compact
+from dental.schedule import parse_date
+from dental.storage import DataManager
+from dental.synthetic import SCALES, counts_for, parse_scale, populate
+from dental.transfer import (
+    COLLECTIONS, DEFAULT_BATCH_SIZE, FORMATS, Importer, export_records, format_for, read_rows
+)
+
+
+def _open(path, mode):
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def cmd_import(args):
+    data_mgr = DataManager(args.data_dir)
+    importer = Importer(data_mgr, args.collection, batch_size=args.batch_size,
+                        update=args.update, dry_run=args.dry_run)
+    f = _open(args.file, 'r')
+    try:
+        importer.run(read_rows(f, format_for(args.file, args.format)))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+        importer.close()
+        data_mgr.backend.close()
+
+    for line_no, message in importer.errors:
+        print(f"{args.file}:{line_no}: {message}", file=sys.stderr)
+    verb = 'would import' if args.dry_run else 'imported'
+    print(f"{args.collection}: {verb} {importer.imported}, updated {importer.updated}, "
+          f"skipped {importer.duplicates} duplicates, rejected {len(importer.errors)}")
+    return 1 if importer.errors else 0
+
+
+def cmd_export(args):
+    data_mgr = DataManager(args.data_dir)
+    f = _open(args.file, 'w')
+    try:
+        count = export_records(data_mgr, args.collection, f, format_for(args.file, args.format),
+                               include_archive=args.include_archive)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+        data_mgr.backend.close()
+    if args.file != '-':
+        print(f"{args.collection}: exported {count} records to {args.file}")
+    return 0
+
+
+def _scale(text):
+    try:
+        return parse_scale(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def cmd_generate(args):
+    size = args.scale
+    data_mgr = DataManager(args.data_dir)
+    try:
+        if not args.replace and any(data_mgr.load_data(data_mgr.file_for(collection))
+                                    for collection in counts_for(size)):
+            print(f"{args.data_dir} already has records; pass --replace to overwrite them",
+                  file=sys.stderr)
+            return 1
+        counts = populate(data_mgr, size, seed=args.seed)
+    finally:
+        data_mgr.backend.close()
+    print(', '.join(f"{count} {collection}" for collection, count in counts.items())
+          + f" generated in {args.data_dir} (seed {args.seed})")
+    return 0
+
+
+def cmd_convert(args):
+    sizes = compact.convert(args.data_dir, args.format)
+    if not sizes:
+        print(f"{args.data_dir} has no collection files to convert", file=sys.stderr)
+        return 1
+    for collection, (before, after) in sizes.items():
+        print(f"{collection}: {before} -> {after} bytes")
+    return 0
+
+
+def _date(text):
+    try:
+        return parse_date(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"use YYYY-MM-DD, not {text!r}")
+
+
+def cmd_archive(args):
+    data_mgr = DataManager(args.data_dir)
+    records = archive.Archive(args.data_dir)
+    try:
+        if not args.status:
+            before = args.before or archive.horizon(args.days)
+            counts = records.archive(data_mgr, before)
+            print(', '.join(f"{count} {collection}" for collection, count in counts.items())
+                  + f" archived from before {records.before}")
+    finally:
+        data_mgr.backend.close()
+    before, collections = records.status()
+    if before is None:
+        print(f"{args.data_dir} has no archive")
+        return 0
+    for collection, (count, segments, size) in collections.items():
+        print(f"{collection}: {count} records in {segments} segments, {size} bytes")
+    return 0
+
+
+def cmd_sync_server(args):
+    # Only the sync commands need the sync server and client
+    from dental import sync
+    host = args.host or sync.DEFAULT_HOST
+    port = sync.DEFAULT_PORT if args.port is None else args.port
+    server = sync.SyncServer(args.state_dir)
+    try:
+        http_server = sync.make_http_server(server, host, port, token=args.token)
+    except ValueError as error:
+        server.close()
+        print(error, file=sys.stderr)
+        return 1
+    print(f"sync server listening on {host}:{http_server.server_address[1]}")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        server.close()
+    return 0
+
+
+def cmd_sync(args):
+    from dental import sync
+    client = sync.SyncClient(DataManager(args.data_dir),
+                             sync.HttpTransport(args.server, token=args.token))
+    try:
+        if args.seed:
+            print(f"queued {client.seed()} existing records")
+        result = client.sync()
+    except sync.SyncError as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+    print(f"pushed {result['pushed']}, pulled {result['pulled']}, "
+          f"resolved {result['conflicts']} conflicts, renamed {result['renamed']}")
+    return 0
+
+
+def cmd_run(args):
+    from main import DentalApp
+    DentalApp().run()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='dental', description='Dental Practice Manager')
+    parser.add_argument('--data-dir', default='data', help='data directory (default: data)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help='import records from a CSV or JSONL file')
+    importer.add_argument('collection', choices=COLLECTIONS)
+    importer.add_argument('file', help="file to read, or - for stdin")
+    importer.add_argument('--format', choices=FORMATS,
+                          help='file format (default: from the extension, else csv)')
+    importer.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                          help=f'records written per batch (default: {DEFAULT_BATCH_SIZE})')
+    importer.add_argument('--update', action='store_true',
+                          help='replace existing records whose ID appears in the file')
+    importer.add_argument('--dry-run', action='store_true', help='validate without writing')
+    importer.set_defaults(handler=cmd_import)
+
+    exporter = commands.add_parser('export', help='export records to a CSV or JSONL file')
+    exporter.add_argument('collection', choices=COLLECTIONS)
+    exporter.add_argument('file', nargs='?', default='-', help='file to write (default: stdout)')
+    exporter.add_argument('--format', choices=FORMATS,
+                          help='file format (default: from the extension, else csv)')
+    exporter.add_argument('--include-archive', action='store_true',
+                          help='also export archived appointments or treatments')
+    exporter.set_defaults(handler=cmd_export)
+
+    generator = commands.add_parser('generate', help='fill the data directory with synthetic records')
+    generator.add_argument('--scale', type=_scale, default='1k',
+                           help=f"appointments and treatments to generate, e.g. {', '.join(SCALES)} "
+                                "or a number; patients are a quarter of that (default: 1k)")
+    generator.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    generator.add_argument('--replace', action='store_true', help='overwrite existing records')
+    generator.set_defaults(handler=cmd_generate)
+
+    converter = commands.add_parser('convert', help='rewrite the data files in another format')
+    converter.add_argument('format', choices=compact.FORMATS)
+    converter.set_defaults(handler=cmd_convert)
+
+    archiver = commands.add_parser('archive', help='move old appointments and treatments '
+                                                   'into compressed archive segments')
+    horizon = archiver.add_mutually_exclusive_group()
+    horizon.add_argument('--days', type=int, default=archive.DEFAULT_HORIZON_DAYS,
+                         help='archive records dated more than this many days ago '
+                              f'(default: {archive.DEFAULT_HORIZON_DAYS})')
+    horizon.add_argument('--before', type=_date, help='archive records dated before YYYY-MM-DD')
+    horizon.add_argument('--status', action='store_true', help='only show what is archived')
+    archiver.set_defaults(handler=cmd_archive)
+
+    token = os.environ.get('DENTAL_SYNC_TOKEN')
+    server = commands.add_parser('sync-server', help='serve sync requests from other devices')
+    server.add_argument('--host',
+                        help='address to bind (default: 127.0.0.1, this device only); other '
+                             'devices can only reach the server on a LAN address such as '
+                             '0.0.0.0, which requires --token')
+    server.add_argument('--port', type=int,
+                        help='port to listen on (default: 8765)')
+    server.add_argument('--state-dir', default='sync_server',
+                        help='where the server keeps its records (default: sync_server)')
+    server.add_argument('--token', default=token,
+                        help='shared secret clients must send (default: $DENTAL_SYNC_TOKEN)')
+    server.set_defaults(handler=cmd_sync_server)
+
+    syncer = commands.add_parser('sync', help='exchange changes with a sync server')
+    syncer.add_argument('--server', default=os.environ.get('DENTAL_SYNC_URL'),
+                        required='DENTAL_SYNC_URL' not in os.environ,
+                        help='server URL (default: $DENTAL_SYNC_URL)')
+    syncer.add_argument('--token', default=token,
+                        help='shared secret (default: $DENTAL_SYNC_TOKEN)')
+    syncer.add_argument('--seed', action='store_true',
+                        help='also push every existing record (first sync of a populated device)')
+    syncer.set_defaults(handler=cmd_sync)
+
+    runner = commands.add_parser('run', help='start the app')
+    runner.set_defaults(handler=cmd_run)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
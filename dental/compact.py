@@ -0,0 +1,259 @@
+"""
+Compact data file format
+Schema-based, length-prefixed binary encoding of a collection with interned field names and pooled strings
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate, repeat
+
+from dental.ids import ID_PREFIXES
+
+MAGIC = b'DNTC'
+VERSION = 1
+FORMATS = ('json', 'compact')
+SEPARATOR = '\x00'
+
+_LENGTH = struct.Struct('<Q')
+_INDEX_TYPES = ('B', 'H', 'I', 'Q')
+
+
+class CompactFormatError(ValueError):
+    """A compact data file that cannot be decoded"""
+
+
+def is_compact(prefix):
+    return prefix[:len(MAGIC)] == MAGIC
+
+
+def _index_type(largest):
+    for typecode in _INDEX_TYPES:
+        if largest < 1 << (8 * array(typecode).itemsize):
+            return typecode
+    raise ValueError('too many values to index')
+
+
+def _section(parts, payload):
+    parts.append(_LENGTH.pack(len(payload)))
+    parts.append(payload)
+
+
+def _column(parts, header, values):
+    typecode = _index_type(max(values, default=0))
+    header['columns'].append(typecode)
+    _section(parts, array(typecode, values).tobytes())
+
+
+def dumps(data):
+    """Encode a {record_id: record} collection of flat records
+
+    Layout after MAGIC and the version byte, each part prefixed with its
+    length: a JSON header (shapes, value counts, column types), the
+    pooled strings as one UTF-8 blob (separated by NUL, or preceded by
+    the character length of each string when one contains NUL), the
+    record IDs, each record's shape, then for every shape
+    one column per field of indexes into the value pool.
+
+    Every distinct value is stored once: strings in the pool, any other
+    value (numbers, booleans, null, nested lists or objects) as JSON after
+    it. A shape is one ordered tuple of field names, so field names are
+    stored once per shape rather than once per record.
+    """
+    strings = {}
+    others = {}
+    encoded_others = []
+    shapes = {}
+    shape_rows = []
+    ids = []
+    record_shapes = []
+
+    def intern_value(value):
+        if type(value) is str:
+            index = strings.get(value)
+            if index is None:
+                index = strings[value] = len(strings)
+            return index
+        # bool and int compare equal, so the type is part of the key
+        key = (type(value), value) if not isinstance(value, (list, dict)) else \
+            json.dumps(value, sort_keys=True, separators=(',', ':'))
+        index = others.get(key)
+        if index is None:
+            index = others[key] = ~len(others)
+            encoded_others.append(json.dumps(value, separators=(',', ':')))
+        return index
+
+    for record_id, record in data.items():
+        ids.append(intern_value(str(record_id)))
+        fields = tuple(record)
+        shape = shapes.get(fields)
+        if shape is None:
+            shape = shapes[fields] = len(shapes)
+            shape_rows.append([[] for _ in fields])
+        record_shapes.append(shape)
+        for column, value in zip(shape_rows[shape], record.values()):
+            column.append(intern_value(value))
+
+    # Non-string values are indexed after the strings.
+    offset = len(strings)
+
+    def resolve(column):
+        return [index if index >= 0 else offset + ~index for index in column]
+
+    header = {
+        'count': len(data),
+        'strings': len(strings),
+        'others': encoded_others,
+        'shapes': [list(fields) for fields in shapes],
+        'columns': [],
+        'byteorder': sys.byteorder,
+    }
+    parts = []
+    pool = list(strings)
+    if any(SEPARATOR in text for text in pool):
+        _column(parts, header, [len(text) for text in pool])
+        _section(parts, ''.join(pool).encode('utf-8'))
+    else:
+        header['separated'] = True
+        _section(parts, SEPARATOR.join(pool).encode('utf-8'))
+    _column(parts, header, resolve(ids))
+    _column(parts, header, record_shapes)
+    for columns in shape_rows:
+        for column in columns:
+            _column(parts, header, resolve(column))
+
+    encoded_header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return b''.join([MAGIC, bytes([VERSION]), _LENGTH.pack(len(encoded_header)), encoded_header]
+                    + parts)
+
+
+class _Reader:
+    def __init__(self, raw):
+        self.raw = memoryview(raw)
+        self.position = len(MAGIC) + 1
+
+    def section(self):
+        (length,) = _LENGTH.unpack_from(self.raw, self.position)
+        start = self.position + _LENGTH.size
+        self.position = start + length
+        return self.raw[start:self.position]
+
+    def column(self, typecode, swap):
+        values = array(typecode)
+        values.frombytes(self.section())
+        if swap:
+            values.byteswap()
+        return values
+
+
+def loads(raw):
+    """Decode bytes written by dumps() back into the {record_id: record} dict"""
+    if not is_compact(raw):
+        raise CompactFormatError('not a compact data file')
+    try:
+        return _decode(raw)
+    except (IndexError, KeyError, TypeError, ValueError, struct.error, StopIteration) as error:
+        if isinstance(error, CompactFormatError):
+            raise
+        raise CompactFormatError(f"corrupt compact data file: {error}") from error
+
+
+def _decode(raw):
+    if raw[len(MAGIC)] != VERSION:
+        raise CompactFormatError(f"unsupported compact format version {raw[len(MAGIC)]}")
+    reader = _Reader(raw)
+    header = json.loads(bytes(reader.section()))
+    swap = header['byteorder'] != sys.byteorder
+    typecodes = iter(header['columns'])
+
+    # Every decoding step below maps, splits or slices with builtins, so
+    # the per-record work runs in C.
+    if header.get('separated'):
+        text = str(reader.section(), 'utf-8')
+        values = text.split(SEPARATOR) if header['strings'] else []
+    else:
+        ends = list(accumulate(reader.column(next(typecodes), swap)))
+        text = str(reader.section(), 'utf-8')
+        values = list(map(text.__getitem__, map(slice, [0] + ends[:-1], ends)))
+    values.extend(map(json.loads, header['others']))
+
+    ids = map(values.__getitem__, reader.column(next(typecodes), swap))
+    record_shapes = reader.column(next(typecodes), swap)
+    by_shape = []
+    for shape, fields in enumerate(header['shapes']):
+        fields = tuple(map(sys.intern, fields))
+        columns = [map(values.__getitem__, reader.column(next(typecodes), swap)) for _ in fields]
+        if fields:
+            by_shape.append(map(dict, map(zip, repeat(fields), zip(*columns))))
+        else:
+            by_shape.append(map(dict, repeat((), record_shapes.count(shape))))
+    if len(by_shape) == 1:
+        records = by_shape[0]
+    else:
+        records = map(next, map(by_shape.__getitem__, record_shapes))
+    data = dict(zip(ids, records))
+    # zip() and map() stop at the shortest column, so a truncated file
+    # shows up as missing records
+    if len(data) != header['count']:
+        raise CompactFormatError(f"expected {header['count']} records, decoded {len(data)}")
+    return data
+
+
+def load(f):
+    """Read a collection from a binary file object, in either format"""
+    raw = f.read()
+    if is_compact(raw):
+        return loads(raw)
+    return json.loads(raw)
+
+
+def read_file(path):
+    """Read a collection file written as JSON or in the compact format
+
+    Raises ValueError (json.JSONDecodeError or CompactFormatError) when
+    the file cannot be decoded.
+    """
+    with open(path, 'rb') as f:
+        return load(f)
+
+
+def write(f, data, file_format):
+    """Write a collection to a binary file object as 'json' or 'compact'"""
+    if file_format == 'compact':
+        f.write(dumps(data))
+    elif file_format == 'json':
+        f.write(json.dumps(data, indent=2).encode('utf-8'))
+    else:
+        raise ValueError(f"Unknown data file format: {file_format}")
+
+
+def default_format():
+    """The format collection files are written in, chosen by the DENTAL_FORMAT variable"""
+    file_format = os.environ.get('DENTAL_FORMAT', 'json')
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown data file format: {file_format}")
+    return file_format
+
+
+def convert(data_dir, file_format):
+    """Rewrite the collection files in data_dir in file_format
+
+    Returns {collection: (bytes before, bytes after)} for the files that
+    exist. Run it while the app is closed.
+    """
+    sizes = {}
+    for collection in ID_PREFIXES:
+        path = os.path.join(data_dir, f'{collection}.json')
+        try:
+            data = read_file(path)
+        except FileNotFoundError:
+            continue
+        before = os.path.getsize(path)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            write(f, data, file_format)
+        os.replace(tmp_path, path)
+        sizes[collection] = (before, os.path.getsize(path))
+    return sizes
@@ -0,0 +1,168 @@
+"""
+Dialog forms
+Declarative field lists for the add/edit dialogs and validation that works on plain text
+"""
+
+import re
+
+from dental.money import parse_cents
+from dental.schedule import DEFAULT_CHAIR, DEFAULT_DURATION, parse_date, parse_time
+from dental.teeth import TOOTH_COUNT, parse_surfaces, parse_tooth
+
+_PHONE_CHARACTERS = re.compile(r'[\d\s()+.\-]+')
+MIN_PHONE_DIGITS = 6
+MAX_PHONE_DIGITS = 15
+
+
+def validate_date(text):
+    """Return the date as YYYY-MM-DD"""
+    try:
+        return parse_date(text).isoformat()
+    except ValueError:
+        raise ValueError('Use YYYY-MM-DD for the date') from None
+
+
+def validate_time(text):
+    """Return the time as HH:MM; accepts 9:30 AM and similar"""
+    try:
+        return parse_time(text).strftime('%H:%M')
+    except ValueError:
+        raise ValueError('Use HH:MM for the time') from None
+
+
+def validate_cost(text):
+    """Keep the cost as typed once it parses as a non-negative amount"""
+    cents = parse_cents(text)
+    if cents is None or cents < 0:
+        raise ValueError('Enter the cost as an amount, e.g. 150 or 99.50')
+    return text.strip()
+
+
+def validate_phone(text):
+    text = text.strip()
+    digits = sum(character.isdigit() for character in text)
+    if not _PHONE_CHARACTERS.fullmatch(text) or not MIN_PHONE_DIGITS <= digits <= MAX_PHONE_DIGITS:
+        raise ValueError('Enter a phone number of digits, spaces, +, - or brackets')
+    return text
+
+
+def validate_duration(text):
+    try:
+        minutes = int(text)
+    except ValueError:
+        raise ValueError('Enter the duration in minutes') from None
+    if minutes <= 0:
+        raise ValueError('The duration must be at least one minute')
+    return minutes
+
+
+def validate_tooth(text):
+    try:
+        return parse_tooth(text)
+    except ValueError:
+        raise ValueError(f'The tooth number must be between 1 and {TOOTH_COUNT}') from None
+
+
+def validate_surfaces(text):
+    return ''.join(parse_surfaces(text))
+
+
+class Field:
+    """One text input of a form
+
+    validate turns the stripped text into the value handed to the form's
+    submit handler, raising ValueError with a message for the user. Empty
+    optional fields skip validation and give the default.
+    """
+
+    def __init__(self, name, label, required=False, validate=None, hint='', default='',
+                 multiline=False, input_filter=None):
+        self.name = name
+        self.label = label
+        self.required = required
+        self.validate = validate
+        self.hint = hint
+        self.default = default
+        self.multiline = multiline
+        self.input_filter = input_filter
+
+    def clean(self, text):
+        text = text.strip()
+        if not text:
+            if self.required:
+                raise ValueError(f"{self.label} is required")
+            return self.default
+        if self.validate is None:
+            return text
+        return self.validate(text)
+
+
+class Row:
+    """Several fields laid out side by side under one label"""
+
+    def __init__(self, label, *fields):
+        self.label = label
+        self.fields = fields
+
+
+class Form:
+    """An ordered list of fields and rows, validated as a whole"""
+
+    def __init__(self, name, title, items, submit='Save'):
+        self.name = name
+        self.title = title
+        self.items = items
+        self.submit = submit
+
+    @property
+    def fields(self):
+        for item in self.items:
+            if isinstance(item, Row):
+                yield from item.fields
+            else:
+                yield item
+
+    def validate(self, texts):
+        """Return (values, errors) for {field name: text}
+
+        errors maps the names of the fields that did not validate to their
+        messages, in form order; values holds the cleaned value of the rest.
+        """
+        values = {}
+        errors = {}
+        for field in self.fields:
+            try:
+                values[field.name] = field.clean(texts.get(field.name, ''))
+            except ValueError as error:
+                errors[field.name] = str(error)
+        return values, errors
+
+
+PATIENT_FORM = Form('patient', 'Add New Patient', [
+    Field('name', 'Patient Name', required=True),
+    Field('phone', 'Phone', required=True, validate=validate_phone),
+    Field('email', 'Email'),
+    Field('dob', 'Date of Birth', validate=validate_date, hint='YYYY-MM-DD'),
+])
+
+APPOINTMENT_FORM = Form('appointment', 'Schedule Appointment', [
+    Field('patient_id', 'Patient ID', required=True, hint='e.g., P0001'),
+    Field('date', 'Date', required=True, validate=validate_date, hint='YYYY-MM-DD'),
+    Field('time', 'Time', required=True, validate=validate_time, hint='HH:MM'),
+    Row('Duration (min) / Chair',
+        Field('duration', 'Duration', validate=validate_duration, default=DEFAULT_DURATION,
+              input_filter='int', hint=str(DEFAULT_DURATION)),
+        Field('chair', 'Chair', default=DEFAULT_CHAIR, hint=DEFAULT_CHAIR)),
+    Field('reason', 'Reason'),
+], submit='Schedule')
+
+TREATMENT_FORM = Form('treatment', 'Add Treatment Record', [
+    Field('patient_id', 'Patient ID', required=True, hint='e.g., P0001'),
+    Field('procedure', 'Procedure', required=True),
+    Field('date', 'Date', required=True, validate=validate_date, hint='YYYY-MM-DD'),
+    Field('cost', 'Cost', required=True, validate=validate_cost),
+    Row('Tooth / Surfaces (optional)',
+        Field('tooth', 'Tooth', validate=validate_tooth, input_filter='int', hint='1-32'),
+        Field('surfaces', 'Surfaces', validate=validate_surfaces, hint='e.g. MOD')),
+    Field('notes', 'Notes', multiline=True),
+])
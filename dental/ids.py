@@ -0,0 +1,107 @@
+"""
+Record ID allocation
+Hands out P0001/APT0001/T0001 style IDs from persistent per-collection sequences
+"""
+
+import json
+import os
+import re
+
+from dental.locking import file_lock
+
+ID_PREFIXES = {
+    'patients': 'P',
+    'appointments': 'APT',
+    'treatments': 'T',
+}
+
+_ID_PATTERN = re.compile(r'^([A-Za-z]*)(\d+)$')
+
+
+def format_id(collection, number):
+    return f"{ID_PREFIXES[collection]}{number:04d}"
+
+
+def parse_id(record_id):
+    """Split an ID into its prefix and number, or return None if it has no number"""
+    match = _ID_PATTERN.match(record_id)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def id_sort_key(record_id):
+    """Sort key that keeps P9999 before P10000"""
+    parsed = parse_id(record_id)
+    if parsed is None:
+        return (record_id, -1)
+    return parsed
+
+
+def highest_id_number(record_ids):
+    numbers = [parsed[1] for parsed in map(parse_id, record_ids) if parsed is not None]
+    return max(numbers, default=0)
+
+
+class IdAllocator:
+    """Monotonic per-collection sequences kept in data/sequences.json
+
+    Allocation takes an inter-process lock, reads the sequence file, bumps
+    one counter and writes it back, so it never touches the collection
+    itself and two app instances cannot hand out the same ID. IDs are
+    never reused after a deletion.
+    """
+
+    def __init__(self, data_dir='data'):
+        self.path = os.path.join(data_dir, 'sequences.json')
+        self.lock_path = self.path + '.lock'
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, sequences):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(sequences, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def next_id(self, collection, existing_ids=None):
+        """Allocate the next ID for collection
+
+        existing_ids is a callable returning the IDs already in use. It is
+        only called the first time a collection is seen (or after the
+        sequence file was lost) to continue numbering after the highest
+        existing ID.
+        """
+        return self.next_ids(collection, 1, existing_ids)[0]
+
+    def next_ids(self, collection, count, existing_ids=None):
+        """Allocate count consecutive IDs for collection with one locked update"""
+        with file_lock(self.lock_path):
+            sequences = self._read()
+            last = sequences.get(collection)
+            if last is None:
+                last = highest_id_number(existing_ids()) if existing_ids else 0
+            sequences[collection] = last + count
+            self._write(sequences)
+        return [format_id(collection, number) for number in range(last + 1, last + count + 1)]
+
+    def reserve(self, collection, record_id, existing_ids=None):
+        """Move the sequence past an ID that was assigned outside the allocator (e.g. imported)"""
+        parsed = parse_id(record_id)
+        if parsed is None or parsed[0] != ID_PREFIXES[collection]:
+            return
+        with file_lock(self.lock_path):
+            sequences = self._read()
+            last = sequences.get(collection)
+            if last is None:
+                last = highest_id_number(existing_ids()) if existing_ids else 0
+            if collection not in sequences or parsed[1] > last:
+                sequences[collection] = max(last, parsed[1])
+                self._write(sequences)
@@ -0,0 +1,112 @@
+"""
+Secondary record indexes
+Maps patients to their appointments and treatments
+"""
+
+import os
+import threading
+
+from dental.archive import shared_archive
+from dental.storage import ARCHIVED, REMOVED
+
+
+class RecordIndexes:
+    """Secondary indexes kept in step with the collections
+
+    patient_id -> appointment IDs and patient_id -> treatment IDs are
+    built with one pass over each collection when first requested and
+    then maintained from change events, so one patient's history costs
+    O(k) in that patient's own records. They cover the collection files
+    only; archived records leave them.
+    """
+
+    def __init__(self, data_mgr):
+        self.data_mgr = data_mgr
+        self.appointments_by_patient = {}
+        self.treatments_by_patient = {}
+        self._appointment_keys = {}
+        self._treatment_keys = {}
+        self._lock = threading.RLock()
+
+        data_mgr.subscribe_and_load(data_mgr.appointments_file, self._on_appointment, self._lock)
+        data_mgr.subscribe_and_load(data_mgr.treatments_file, self._on_treatment, self._lock)
+
+    @staticmethod
+    def _move(index, old_key, new_key, record_id):
+        if old_key is not None:
+            ids = index.get(old_key)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del index[old_key]
+        if new_key is not None:
+            index.setdefault(new_key, set()).add(record_id)
+
+    def _on_appointment(self, event, apt_id, apt):
+        with self._lock:
+            old_patient = self._appointment_keys.pop(apt_id, None)
+            new_patient = None
+            if event not in (REMOVED, ARCHIVED):
+                new_patient = apt.get('patient_id')
+                self._appointment_keys[apt_id] = new_patient
+            self._move(self.appointments_by_patient, old_patient, new_patient, apt_id)
+
+    def _on_treatment(self, event, treatment_id, treatment):
+        with self._lock:
+            old_patient = self._treatment_keys.pop(treatment_id, None)
+            new_patient = None
+            if event not in (REMOVED, ARCHIVED):
+                new_patient = treatment.get('patient_id')
+                self._treatment_keys[treatment_id] = new_patient
+            self._move(self.treatments_by_patient, old_patient, new_patient, treatment_id)
+
+    def appointment_ids_for(self, patient_id):
+        with self._lock:
+            return set(self.appointments_by_patient.get(patient_id, ()))
+
+    def treatment_ids_for(self, patient_id):
+        with self._lock:
+            return set(self.treatments_by_patient.get(patient_id, ()))
+
+    def patient_history(self, patient_id):
+        """Return (appointments, treatments) for one patient as {id: record} dicts
+
+        Archived records are included, read from only the archive segments
+        that hold this patient's records.
+        """
+        return (
+            self._with_archived('appointments', patient_id, self._fetch(
+                self.data_mgr.appointments_file, self.appointment_ids_for(patient_id))),
+            self._with_archived('treatments', patient_id, self._fetch(
+                self.data_mgr.treatments_file, self.treatment_ids_for(patient_id))),
+        )
+
+    def _with_archived(self, collection, patient_id, records):
+        archive = shared_archive(self.data_mgr)
+        if archive.before is None:
+            return records
+        archived = archive.patient_records(collection, patient_id)
+        archived.update(records)
+        return archived
+
+    def _fetch(self, filename, record_ids):
+        records = {}
+        for record_id in record_ids:
+            record = self.data_mgr.get_record(filename, record_id)
+            if record is not None:
+                records[record_id] = record
+        return records
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_indexes(data_mgr):
+    """Return the process-wide RecordIndexes for data_mgr's data directory"""
+    key = os.path.abspath(data_mgr.data_dir)
+    with _shared_lock:
+        indexes = _shared.get(key)
+        if indexes is None:
+            indexes = _shared[key] = RecordIndexes(data_mgr)
+        return indexes
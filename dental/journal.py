@@ -0,0 +1,259 @@
+"""
+Append-only journal storage backend
+Each change is appended as one JSON line and folded into a snapshot in the background
+"""
+
+import json
+import os
+import threading
+import time
+
+from dental import compact
+from dental.profiling import profiler
+from dental.storage import StaleDataError, read_data_file, scan
+
+JOURNAL_SUFFIX = '.journal'
+COMPACTING_SUFFIX = '.journal.compacting'
+
+
+def _encode(entry):
+    return json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _read_snapshot(path):
+    try:
+        return read_data_file(path)
+    except FileNotFoundError:
+        return {}
+
+
+def _replay(journal_path, data):
+    """Apply journal_path to data and return the number of entries replayed
+
+    A final line without its newline is a write torn by a crash; it is cut
+    off so that the next append starts on a clean line.
+    """
+    try:
+        with open(journal_path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return 0
+
+    end = raw.rfind(b'\n') + 1
+    if end < len(raw):
+        with open(journal_path, 'r+b') as f:
+            f.truncate(end)
+
+    count = 0
+    for line in raw[:end].splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get('op') == 'put':
+            data[entry['id']] = entry['record']
+        elif entry.get('op') == 'del':
+            data.pop(entry['id'], None)
+        count += 1
+    return count
+
+
+def _write_snapshot(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        compact.write(f, data, compact.default_format())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _Collection:
+    """In-memory state of one journaled collection"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = _read_snapshot(path)
+        self.entries = _replay(path + COMPACTING_SUFFIX, self.data)
+        self.entries += _replay(path + JOURNAL_SUFFIX, self.data)
+        self.journal = open(path + JOURNAL_SUFFIX, 'ab')
+        self.compactor = None
+        self.version = 0
+
+
+class JournalBackend:
+    """Write-ahead journal backend with background snapshot compaction
+
+    A collection lives in its snapshot file (the same JSON document the
+    JSON backend writes) plus ``<file>.journal``. Inserts append one line
+    instead of rewriting the file. Once the journal holds
+    ``compact_threshold`` entries it is renamed aside and a background
+    thread writes a fresh snapshot; if that is interrupted, the renamed
+    journal is replayed again at the next startup.
+
+    The state lives in this process's memory, so unlike the JSON and
+    SQLite backends a data directory must not be shared with other
+    processes while it is open; version() counts this process's writes.
+    """
+
+    def __init__(self, compact_threshold=1000, fsync=True):
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self._collections = {}
+        self._lock = threading.RLock()
+
+    def _open(self, path):
+        path = os.path.abspath(path)
+        collection = self._collections.get(path)
+        if collection is None:
+            started = time.perf_counter()
+            collection = _Collection(path)
+            if profiler.enabled:
+                profiler.detail('parse', os.path.basename(path), time.perf_counter() - started,
+                                rows=len(collection.data), replayed=collection.entries)
+            self._collections[path] = collection
+        return collection
+
+    def _append(self, collection, entries):
+        if not entries:
+            return
+        started = time.perf_counter()
+        payload = b''.join(_encode(entry) for entry in entries)
+        collection.journal.write(payload)
+        collection.journal.flush()
+        if self.fsync:
+            os.fsync(collection.journal.fileno())
+        if profiler.enabled:
+            profiler.detail('write', os.path.basename(collection.path), time.perf_counter() - started,
+                            bytes=len(payload))
+
+        for entry in entries:
+            if entry['op'] == 'put':
+                collection.data[entry['id']] = entry['record']
+            else:
+                collection.data.pop(entry['id'], None)
+        collection.entries += len(entries)
+        collection.version += 1
+
+        if collection.entries >= self.compact_threshold:
+            self._start_compaction(collection)
+
+    def load(self, path):
+        with self._lock:
+            return self._open(path).data
+
+    def get(self, path, key):
+        with self._lock:
+            return self._open(path).data.get(key)
+
+    def items(self, path):
+        # Writes update the dict in place, so iterate over a copy of its items
+        with self._lock:
+            return iter(list(self._open(path).data.items()))
+
+    def keys(self, path):
+        with self._lock:
+            return iter(list(self._open(path).data))
+
+    def version(self, path):
+        with self._lock:
+            return self._open(path).version
+
+    def save(self, path, data, expected_version=None):
+        """Journal only the records that differ from the current state"""
+        with self._lock:
+            collection = self._open(path)
+            if expected_version is not None and collection.version != expected_version:
+                raise StaleDataError(f"{path} changed since it was read")
+            current = collection.data
+            entries = [
+                {'op': 'put', 'id': key, 'record': dict(record)}
+                for key, record in data.items()
+                if current.get(key) != record
+            ]
+            entries.extend({'op': 'del', 'id': key} for key in current if key not in data)
+            self._append(collection, entries)
+
+    def put(self, path, key, record):
+        self.put_many(path, {key: record})
+
+    def put_many(self, path, records):
+        with self._lock:
+            self._append(self._open(path), [
+                {'op': 'put', 'id': key, 'record': dict(record)}
+                for key, record in records.items()
+            ])
+
+    def delete(self, path, key):
+        with self._lock:
+            collection = self._open(path)
+            if key in collection.data:
+                self._append(collection, [{'op': 'del', 'id': key}])
+
+    def find(self, path, field, value):
+        return scan(self.load(path), field, value)
+
+    def _start_compaction(self, collection):
+        if collection.compactor is not None and collection.compactor.is_alive():
+            return
+        compacting_path = collection.path + COMPACTING_SUFFIX
+        if os.path.exists(compacting_path):
+            # A previous compaction never finished; its entries are still
+            # in memory, so fold them into this snapshot as well.
+            journal_path = collection.path + JOURNAL_SUFFIX
+            collection.journal.close()
+            with open(compacting_path, 'ab') as dst, open(journal_path, 'rb') as src:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(journal_path)
+        else:
+            collection.journal.close()
+            os.replace(collection.path + JOURNAL_SUFFIX, compacting_path)
+
+        collection.journal = open(collection.path + JOURNAL_SUFFIX, 'ab')
+        collection.entries = 0
+        snapshot = dict(collection.data)
+
+        collection.compactor = threading.Thread(
+            target=self._compact, args=(collection.path, snapshot), daemon=True)
+        collection.compactor.start()
+
+    @staticmethod
+    def _compact(path, snapshot):
+        _write_snapshot(path, snapshot)
+        os.remove(path + COMPACTING_SUFFIX)
+
+    def compact(self, path=None, wait=True):
+        """Fold the journal of path (or of every open collection) into its snapshot"""
+        with self._lock:
+            if path is None:
+                collections = list(self._collections.values())
+            else:
+                collections = [self._open(path)]
+            for collection in collections:
+                if collection.entries:
+                    # A compaction already running would make this one a no-op
+                    if collection.compactor is not None:
+                        collection.compactor.join()
+                    self._start_compaction(collection)
+        if wait:
+            for collection in collections:
+                if collection.compactor is not None:
+                    collection.compactor.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'collections': len(self._collections),
+                'journal_entries': sum(c.entries for c in self._collections.values()),
+            }
+
+    def close(self):
+        with self._lock:
+            collections = list(self._collections.values())
+        for collection in collections:
+            if collection.compactor is not None:
+                collection.compactor.join()
+            collection.journal.close()
+        with self._lock:
+            self._collections.clear()
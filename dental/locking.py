@@ -0,0 +1,66 @@
+"""
+Inter-process advisory file locks
+Uses fcntl on POSIX (Linux, macOS, Android) and msvcrt on Windows
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+def _thread_lock_for(path):
+    with _thread_locks_guard:
+        lock = _thread_locks.get(path)
+        if lock is None:
+            lock = _thread_locks[path] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path for the duration of the block
+
+    The lock file is created if needed and never deleted. Threads of this
+    process are serialized as well, so the same lock guards both. A thread
+    that already holds the lock can take it again.
+    """
+    path = os.path.abspath(path)
+    held = _held.__dict__.setdefault('paths', set())
+    if path in held:
+        yield
+        return
+    with _thread_lock_for(path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        held.add(path)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.01)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+            held.discard(path)
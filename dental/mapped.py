@@ -0,0 +1,304 @@
+"""
+Memory-mapped collections
+Reads single records of a JSON collection file on demand through a persistent offset index
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from json.decoder import WHITESPACE, scanstring
+
+from dental import compact
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'DNTI'
+INDEX_VERSION = 1
+
+# magic, version, byte order, record count, data file mtime_ns and size
+_HEADER = struct.Struct('<4sBBxxQQQ')
+_LITTLE, _BIG = 1, 2
+_BYTEORDER = _LITTLE if sys.byteorder == 'little' else _BIG
+
+# The C scanner behind json.loads, called directly to skip json.loads's
+# per-call type checks and encoding detection
+_scan_once = json.JSONDecoder().scan_once
+
+
+def _decode_record(raw):
+    return _scan_once(str(raw, 'utf-8'), 0)[0]
+
+
+def _decode_key(raw):
+    if b'\\' in raw:
+        return json.loads(raw)
+    return str(raw[1:-1], 'ascii')
+
+
+def _scan(text):
+    """Yield (key_start, key_end, value_start, value_end) for each member of a JSON object
+
+    text is the file decoded as latin-1, so string offsets are byte offsets
+    into the file. Each value is parsed to find where it ends.
+    """
+    scan_once = json.JSONDecoder().scan_once
+    skip = WHITESPACE.match
+    position = skip(text, 0).end()
+    if text[position:position + 1] != '{':
+        raise ValueError('collection file is not a JSON object')
+    position = skip(text, position + 1).end()
+    if text[position:position + 1] == '}':
+        return
+    while True:
+        if text[position:position + 1] != '"':
+            raise ValueError(f'expected a record ID at byte {position}')
+        key_start = position
+        _, position = scanstring(text, position + 1)
+        key_end = position
+        position = skip(text, position).end()
+        if text[position:position + 1] != ':':
+            raise ValueError(f"expected ':' at byte {position}")
+        value_start = position = skip(text, position + 1).end()
+        try:
+            _, position = scan_once(text, position)
+        except StopIteration:
+            raise ValueError(f'expected a record at byte {position}')
+        yield key_start, key_end, value_start, position
+        position = skip(text, position).end()
+        separator = text[position:position + 1]
+        position = skip(text, position + 1).end()
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError(f"expected ',' or '}}' at byte {position}")
+
+
+def build_index(raw):
+    """Return (spans, order) for the JSON collection in raw, or None
+
+    spans holds four byte offsets per record in file order: the start and
+    end of its quoted ID and of its record. order lists the record
+    positions sorted by quoted ID. Returns None when an ID is not written
+    the way json.dumps() writes it, as lookups compare encoded IDs byte
+    for byte.
+    """
+    spans = array('Q')
+    keys = []
+    positions = {}
+    for key_start, key_end, value_start, value_end in _scan(str(raw, 'latin-1')):
+        encoded = bytes(raw[key_start:key_end])
+        if json.dumps(json.loads(encoded)).encode('ascii') != encoded:
+            return None
+        if encoded in positions:
+            # json.load keeps the last of repeated IDs
+            previous = positions[encoded]
+            spans[previous * 4:previous * 4 + 4] = array('Q', [key_start, key_end,
+                                                               value_start, value_end])
+            continue
+        positions[encoded] = len(keys)
+        keys.append(encoded)
+        spans.extend((key_start, key_end, value_start, value_end))
+    order = array('Q', sorted(range(len(keys)), key=keys.__getitem__))
+    return spans, order
+
+
+class MappedCollection:
+    """Read-only view of one JSON collection file, decoding records on demand
+
+    The file is memory-mapped and located through an offset index kept in
+    <path>.idx, which is rebuilt (one full parse, without keeping the
+    records) whenever the file's mtime or size no longer match it. A
+    lookup by ID is a binary search over the index that decodes only the
+    record found, and iteration decodes one record at a time, so memory
+    use does not grow with the collection.
+
+    Use open() to create one; it returns None for files it cannot map
+    (missing, empty, or in the compact format). DataStore closes the view
+    before the file is rewritten. keys() and items() iterations that are
+    still running keep the mapping open until they finish or are dropped,
+    and go on reading the file as it was when they started; the new file
+    is written beside it and renamed over it, so the old one stays
+    readable. Windows cannot rename over a file that is still open, so
+    there a save to a file that is being iterated fails with OSError.
+    """
+
+    def __init__(self, path, f, data, signature, spans, order, index_map=None):
+        self.path = path
+        self.signature = signature
+        self._file = f
+        self._data = data
+        self._spans = spans
+        self._order = order
+        self._index_map = index_map
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._closed = False
+
+    @classmethod
+    def open(cls, path):
+        f = open(path, 'rb')
+        try:
+            st = os.fstat(f.fileno())
+            signature = (st.st_mtime_ns, st.st_size)
+            if not st.st_size:
+                f.close()
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            f.close()
+            raise
+        if compact.is_compact(data[:len(compact.MAGIC)]):
+            data.close()
+            f.close()
+            return None
+
+        index_path = path + INDEX_SUFFIX
+        loaded = _read_index(index_path, signature)
+        if loaded is not None:
+            spans, order, index_map = loaded
+            return cls(path, f, data, signature, spans, order, index_map)
+        try:
+            built = build_index(data)
+        except ValueError:
+            built = None
+        if built is None:
+            data.close()
+            f.close()
+            return None
+        spans, order = built
+        _write_index(index_path, signature, spans, order)
+        return cls(path, f, data, signature, spans, order)
+
+    def __len__(self):
+        return len(self._order)
+
+    def _position(self, key):
+        encoded = json.dumps(key).encode('ascii')
+        data, spans, order = self._data, self._spans, self._order
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            position = order[middle]
+            found = data[spans[position * 4]:spans[position * 4 + 1]]
+            if found < encoded:
+                low = middle + 1
+            elif found > encoded:
+                high = middle
+            else:
+                return position
+        return None
+
+    def __contains__(self, key):
+        return self._position(key) is not None
+
+    def get(self, key, default=None):
+        """Decode and return the record stored under key"""
+        position = self._position(key)
+        if position is None:
+            return default
+        start = position * 4 + 2
+        return _decode_record(self._data[self._spans[start]:self._spans[start + 1]])
+
+    def _reader(self, generator):
+        """Start generator so the mapping stays open from now until it finishes or is dropped"""
+        with self._lock:
+            if self._closed:
+                raise ValueError(f'{self.path} view is closed')
+            self._readers += 1
+        next(generator)
+        return generator
+
+    def _read_done(self):
+        with self._lock:
+            self._readers -= 1
+            release = self._closed and not self._readers
+        if release:
+            self._release()
+
+    def keys(self):
+        """Yield the record IDs in file order"""
+        return self._reader(self._keys())
+
+    def _keys(self):
+        try:
+            yield
+            data, spans = self._data, self._spans
+            for offset in range(0, len(spans), 4):
+                yield _decode_key(data[spans[offset]:spans[offset + 1]])
+        finally:
+            self._read_done()
+
+    def items(self):
+        """Yield (record_id, record) in file order, decoding one record at a time"""
+        return self._reader(self._items())
+
+    def _items(self):
+        try:
+            yield
+            data, spans = self._data, self._spans
+            for offset in range(0, len(spans), 4):
+                yield (_decode_key(data[spans[offset]:spans[offset + 1]]),
+                       _decode_record(data[spans[offset + 2]:spans[offset + 3]]))
+        finally:
+            self._read_done()
+
+    def close(self):
+        """Release the mapping, or once the last running iteration is done"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._readers:
+                return
+        self._release()
+
+    def _release(self):
+        if self._index_map is not None:
+            # spans and order are views of the index map, which cannot be
+            # closed while they are alive
+            self._spans.release()
+            self._order.release()
+            self._index_map.close()
+            self._index_map = None
+        self._data.close()
+        self._file.close()
+
+
+def _read_index(index_path, signature):
+    """Map a saved index; returns (spans, order, map) or None if missing or stale"""
+    try:
+        with open(index_path, 'rb') as f:
+            index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        magic, version, byteorder, count, mtime_ns, size = _HEADER.unpack_from(index_map)
+    except struct.error:
+        index_map.close()
+        return None
+    if (magic, version, byteorder, (mtime_ns, size)) != (
+            INDEX_MAGIC, INDEX_VERSION, _BYTEORDER, signature) \
+            or len(index_map) != _HEADER.size + count * 5 * 8:
+        index_map.close()
+        return None
+    with memoryview(index_map) as view:
+        spans = view[_HEADER.size:_HEADER.size + count * 4 * 8].cast('Q')
+        order = view[_HEADER.size + count * 4 * 8:].cast('Q')
+    return spans, order, index_map
+
+
+def _write_index(index_path, signature, spans, order):
+    """Save the index next to the data file; a read-only directory keeps it in memory only"""
+    # Readers in several processes may build the same index at once
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, _BYTEORDER, len(order), *signature))
+            f.write(spans.tobytes())
+            f.write(order.tobytes())
+        os.replace(tmp_path, index_path)
+    except OSError:
+        pass
@@ -0,0 +1,32 @@
+"""
+Money helpers
+Treatment costs are entered as free text and handled internally as integer cents
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+
+_PLAIN_AMOUNT = re.compile(r'(\d+)(?:\.(\d{1,2}))?')
+
+
+def parse_cents(cost):
+    """Parse '150', '$1,200.50' or 99.5 into integer cents, or None if unparseable"""
+    if cost is None or isinstance(cost, bool):
+        return None
+    if isinstance(cost, int):
+        return cost * 100
+    text = str(cost).strip().replace('$', '').replace(',', '')
+    match = _PLAIN_AMOUNT.fullmatch(text)
+    if match:
+        # Most costs look like '150' or '99.50'; skip Decimal for those.
+        return int(match.group(1)) * 100 + int((match.group(2) or '0').ljust(2, '0'))
+    try:
+        return int((Decimal(text) * 100).quantize(Decimal('1')))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    dollars, cents = divmod(abs(cents), 100)
+    return f"{sign}{dollars:,}.{cents:02d}"
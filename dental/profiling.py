@@ -0,0 +1,224 @@
+"""
+Profiling
+Opt-in timings of data-layer calls, screen builds and frames, kept in memory and traced to a rotating file
+"""
+
+import functools
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+DEFAULT_TRACE_FILE = os.path.join('logs', 'trace.jsonl')
+TRACE_MAX_BYTES = 1_000_000
+TRACE_BACKUPS = 3
+RECENT_EVENTS = 200
+FLUSH_SECONDS = 1.0
+
+
+class TraceWriter:
+    """Appends events as JSON lines to a size-rotated file from a background thread
+
+    Events are queued by the timed code and serialised and written in
+    batches by the writer thread. When the file would grow past
+    max_bytes it is renamed to <path>.1 (shifting older ones up to
+    <path>.<backups>) and a new file is started.
+    """
+
+    def __init__(self, path, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._events = queue.SimpleQueue()
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='dental-trace', daemon=True)
+        self._thread.start()
+
+    def put(self, event):
+        self._events.put(event)
+
+    def close(self):
+        """Write what is queued and stop the thread"""
+        self._closing.set()
+        self._events.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._events.get()]
+            self._closing.wait(FLUSH_SECONDS)
+            while True:
+                try:
+                    batch.append(self._events.get_nowait())
+                except queue.Empty:
+                    break
+            closing = None in batch
+            self._write(''.join(json.dumps(event, separators=(',', ':')) + '\n'
+                                for event in batch if event is not None))
+            if closing:
+                return
+
+    def _write(self, text):
+        if not text:
+            return
+        data = text.encode('utf-8')
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size and size + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            older = f'{self.path}.{index}'
+            if os.path.exists(older):
+                os.replace(older, f'{self.path}.{index + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+
+class Profiler:
+    """Collects timing events while enabled
+
+    An event is a dict with the wall-clock time, a kind ('load', 'save',
+    'build', 'frames', ...), a name, its duration in milliseconds and any
+    extra fields. The latest RECENT_EVENTS are kept in memory for the
+    overlay, per-kind totals are kept for summaries, and each event is
+    written as one JSON line to a size-rotated trace file by a background
+    thread, so timed code pays for a few clock reads and a queue put.
+
+    Spans nest per thread: detail() adds what a lower layer measured
+    (bytes read, parse time) to the innermost open span, so a DataManager
+    load reports the parse time of the backend underneath it.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.recent = deque(maxlen=RECENT_EVENTS)
+        self.totals = {}
+        self.trace_path = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def enable(self, trace_path=DEFAULT_TRACE_FILE, max_bytes=TRACE_MAX_BYTES,
+               backups=TRACE_BACKUPS):
+        """Start collecting; trace_path=None keeps events in memory only"""
+        if self.enabled:
+            return
+        if trace_path:
+            directory = os.path.dirname(trace_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._writer = TraceWriter(trace_path, max_bytes, backups)
+            self.trace_path = trace_path
+        self.enabled = True
+
+    def disable(self):
+        """Stop collecting and flush the trace file"""
+        self.enabled = False
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def record(self, kind, name, seconds, **fields):
+        event = {'ts': round(time.time(), 3), 'kind': kind, 'name': name,
+                 'ms': round(seconds * 1000, 3)}
+        event.update(fields)
+        self.recent.append(event)
+        with self._lock:
+            totals = self.totals.get(kind)
+            if totals is None:
+                totals = self.totals[kind] = [0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+        writer = self._writer
+        if writer is not None:
+            writer.put(event)
+        return event
+
+    def _spans(self):
+        spans = getattr(self._local, 'spans', None)
+        if spans is None:
+            spans = self._local.spans = []
+        return spans
+
+    def start(self, kind, name, **fields):
+        """Open a span; pass the returned handle to stop()"""
+        span = (kind, name, fields, time.perf_counter())
+        self._spans().append(span)
+        return span
+
+    def stop(self, span, **fields):
+        elapsed = time.perf_counter() - span[3]
+        spans = self._spans()
+        for index in range(len(spans) - 1, -1, -1):
+            if spans[index] is span:
+                del spans[index]
+                break
+        span[2].update(fields)
+        return self.record(span[0], span[1], elapsed, **span[2])
+
+    def detail(self, kind, name, seconds, **counts):
+        """Add a lower layer's measurement to the innermost span on this thread
+
+        seconds is added to the span as '<kind>_ms' and counts are summed
+        into it. Outside any span the measurement is recorded as its own
+        event.
+        """
+        spans = getattr(self._local, 'spans', None)
+        if not spans:
+            self.record(kind, name, seconds, **counts)
+            return
+        fields = spans[-1][2]
+        key = f'{kind}_ms'
+        fields[key] = round(fields.get(key, 0) + seconds * 1000, 3)
+        for field, value in counts.items():
+            fields[field] = fields.get(field, 0) + value
+
+    def summary(self):
+        """{kind: {'count', 'total_ms', 'max_ms'}} since the profiler was enabled"""
+        with self._lock:
+            return {
+                kind: {'count': count, 'total_ms': round(total * 1000, 3),
+                       'max_ms': round(longest * 1000, 3)}
+                for kind, (count, total, longest) in self.totals.items()
+            }
+
+
+profiler = Profiler()
+
+
+def enable_from_env():
+    """Enable the profiler if DENTAL_PROFILE is set; DENTAL_PROFILE_FILE picks the trace file"""
+    if os.environ.get('DENTAL_PROFILE', '0').lower() in ('', '0', 'false', 'no', 'off'):
+        return False
+    profiler.enable(os.environ.get('DENTAL_PROFILE_FILE', DEFAULT_TRACE_FILE) or None)
+    return True
+
+
+def timed(kind):
+    """Time a DataManager method whose first argument is a collection file
+
+    Costs one attribute check per call while the profiler is disabled.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, filename, *args, **kwargs):
+            if not profiler.enabled:
+                return method(self, filename, *args, **kwargs)
+            span = profiler.start(kind, os.path.basename(filename))
+            try:
+                return method(self, filename, *args, **kwargs)
+            finally:
+                profiler.stop(span)
+        return wrapper
+    return decorate
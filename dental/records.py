@@ -0,0 +1,294 @@
+"""
+Typed records
+Slotted patient, appointment and treatment records with parsed dates, times and costs
+"""
+
+import sys
+from datetime import date, datetime, time
+from functools import lru_cache
+
+from dental.money import parse_cents
+from dental.schedule import DEFAULT_CHAIR, parse_date, parse_time
+
+# Dates, times and costs repeat across records, so their parsed values are shared
+VALUE_CACHE_SIZE = 8192
+
+_MISSING = object()
+
+
+def _converter(parse, format_value, cached=False):
+    """Return convert(raw) -> (value, exact) for a kind of field
+
+    value is None if raw does not parse; exact is False unless
+    format_value(value) gives raw back, in which case raw must be kept.
+    """
+    def convert(raw):
+        try:
+            value = parse(raw)
+        except (TypeError, ValueError):
+            return None, False
+        return value, format_value(value) == raw
+    return lru_cache(maxsize=VALUE_CACHE_SIZE, typed=True)(convert) if cached else convert
+
+
+def _parse_date(text):
+    if len(text) == 10:
+        try:
+            return date.fromisoformat(text)
+        except ValueError:
+            pass
+    return parse_date(text)
+
+
+def _parse_time(text):
+    if len(text) == 5:
+        try:
+            return time.fromisoformat(text)
+        except ValueError:
+            pass
+    return parse_time(text)
+
+
+def _format_time(value):
+    return value.isoformat('minutes')
+
+
+def _format_timestamp(value):
+    return value.isoformat(' ', 'seconds')
+
+
+def _convert_timestamp(raw):
+    try:
+        value = datetime.fromisoformat(raw)
+    except (TypeError, ValueError):
+        return None, False
+    # Once fromisoformat accepts it, this layout can only be the canonical
+    # YYYY-MM-DD HH:MM:SS, and checking it is far cheaper than formatting
+    exact = (len(raw) == 19 and raw[4] == raw[7] == '-' and raw[10] == ' '
+             and raw[13] == raw[16] == ':')
+    return value, exact
+
+
+def _parse_cost(text):
+    cents = parse_cents(text)
+    if cents is None:
+        raise ValueError(f"Unrecognised cost: {text!r}")
+    return cents
+
+
+def _format_cost(cents):
+    sign = '-' if cents < 0 else ''
+    dollars, cents = divmod(abs(cents), 100)
+    return f"{sign}{dollars}.{cents:02d}" if cents else f"{sign}{dollars}"
+
+
+def _parse_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"Not an integer: {value!r}")
+    return int(value)
+
+
+def _convert_text(raw):
+    return (raw, True) if type(raw) is str else (None, False)
+
+
+def _convert_label(raw):
+    """Short text that repeats across records (IDs, statuses); one copy is kept"""
+    return (sys.intern(raw), True) if type(raw) is str else (None, False)
+
+
+def _same(value):
+    return value
+
+
+# (convert, format) per kind of field
+TEXT = (_convert_text, _same)
+LABEL = (_convert_label, _same)
+DATE = (_converter(_parse_date, date.isoformat, cached=True), date.isoformat)
+TIME = (_converter(_parse_time, _format_time, cached=True), _format_time)
+TIMESTAMP = (_convert_timestamp, _format_timestamp)
+INTEGER = (_converter(_parse_int, _same), _same)
+COST = (_converter(_parse_cost, _format_cost, cached=True), _format_cost)
+
+
+class Record:
+    """Base of the typed records
+
+    from_dict converts a stored record once, at the data-layer boundary;
+    to_dict gives back an equal dict. Values that do not parse, or that
+    were stored in a non-canonical form (a '$1,200' cost, a '9:30 AM'
+    time), are kept as stored in extra, along with any unknown keys, so a
+    round trip never loses anything. Absent fields are None.
+
+    Records are treated as immutable: use replace() for a changed copy.
+    stored(), also available as get(), reads a field in its stored form.
+    """
+
+    __slots__ = ('id', 'extra')
+    COLLECTION = None
+    FIELDS = ()
+    _BY_KEY = {}
+    _KEYS = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._BY_KEY = {field[0]: field for field in cls.FIELDS}
+        cls._KEYS = frozenset(cls._BY_KEY)
+
+    def __init__(self, record_id, **values):
+        self.id = record_id
+        self.extra = None
+        for _key, attribute, _convert, _format in self.FIELDS:
+            setattr(self, attribute, values.pop(attribute, None))
+        if values:
+            raise TypeError(f"Unknown {type(self).__name__} fields: {', '.join(values)}")
+
+    @classmethod
+    def from_dict(cls, record_id, data):
+        record = cls.__new__(cls)
+        record.id = record_id
+        extra = None
+        found = 0
+        for key, attribute, convert, _format in cls.FIELDS:
+            raw = data.get(key, _MISSING)
+            if raw is _MISSING:
+                setattr(record, attribute, None)
+                continue
+            found += 1
+            try:
+                value, exact = convert(raw)
+            except TypeError:
+                # Unhashable values cannot go through the cache
+                value, exact = None, False
+            setattr(record, attribute, value)
+            if not exact:
+                extra = extra or {}
+                extra[key] = raw
+        if len(data) > found:
+            for key in data.keys() - cls._KEYS:
+                extra = extra or {}
+                extra[key] = data[key]
+        record.extra = extra
+        return record
+
+    def to_dict(self):
+        data = {}
+        extra = self.extra or {}
+        for key, attribute, _convert, format_value in self.FIELDS:
+            if key in extra:
+                data[key] = extra[key]
+            else:
+                value = getattr(self, attribute)
+                if value is not None:
+                    data[key] = format_value(value)
+        for key, value in extra.items():
+            data.setdefault(key, value)
+        return data
+
+    def stored(self, key, default=None):
+        """Return the stored form of key, like dict.get on the stored record"""
+        extra = self.extra
+        if extra is not None and key in extra:
+            return extra[key]
+        field = self._BY_KEY.get(key)
+        if field is None:
+            return default
+        value = getattr(self, field[1])
+        return default if value is None else field[3](value)
+
+    def replace(self, **changes):
+        """Return a copy with the given attributes changed"""
+        record = type(self).__new__(type(self))
+        record.id = changes.pop('id', self.id)
+        for _key, attribute, _convert, _format in self.FIELDS:
+            setattr(record, attribute, changes.pop(attribute, getattr(self, attribute)))
+        if changes:
+            raise TypeError(f"Unknown {type(self).__name__} fields: {', '.join(changes)}")
+        extra = self.extra
+        if extra:
+            # A stored form no longer describes a changed value
+            changed = {key for key, attribute, _convert, _format in self.FIELDS
+                       if getattr(record, attribute) is not getattr(self, attribute)}
+            extra = {key: value for key, value in extra.items() if key not in changed} or None
+        record.extra = extra
+        return record
+
+    # RecycleView reads a dozen layout hints from every data item with
+    # get(key, default), so records answer it as their stored dict would
+    get = stored
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.id == other.id and self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.id!r}, {self.to_dict()!r})"
+
+
+class Patient(Record):
+    __slots__ = ('name', 'phone', 'email', 'dob', 'created_at', 'teeth')
+    COLLECTION = 'patients'
+    FIELDS = (
+        ('name', 'name', *TEXT),
+        ('phone', 'phone', *TEXT),
+        ('email', 'email', *TEXT),
+        ('dob', 'dob', *DATE),
+        ('created_at', 'created_at', *TIMESTAMP),
+        ('teeth', 'teeth', *TEXT),
+    )
+
+
+class Appointment(Record):
+    __slots__ = ('patient_id', 'date', 'time', 'duration', 'chair', 'reason', 'status',
+                 'created_at')
+    COLLECTION = 'appointments'
+    FIELDS = (
+        ('patient_id', 'patient_id', *LABEL),
+        ('date', 'date', *DATE),
+        ('time', 'time', *TIME),
+        ('duration', 'duration', *INTEGER),
+        ('chair', 'chair', *LABEL),
+        ('reason', 'reason', *TEXT),
+        ('status', 'status', *LABEL),
+        ('created_at', 'created_at', *TIMESTAMP),
+    )
+
+    @property
+    def start(self):
+        if self.date is None or self.time is None:
+            return None
+        return datetime.combine(self.date, self.time)
+
+    @property
+    def sort_key(self):
+        """Chronological; appointments whose date or time does not parse sort last by their text"""
+        if self.date is None or self.time is None:
+            return (1, str(self.stored('date', '')), str(self.stored('time', '')))
+        return (0, self.date, self.time, self.chair or str(self.stored('chair') or DEFAULT_CHAIR))
+
+
+class Treatment(Record):
+    __slots__ = ('patient_id', 'procedure', 'date', 'cents', 'notes', 'tooth', 'surfaces',
+                 'created_at')
+    COLLECTION = 'treatments'
+    FIELDS = (
+        ('patient_id', 'patient_id', *LABEL),
+        ('procedure', 'procedure', *LABEL),
+        ('date', 'date', *DATE),
+        ('cost', 'cents', *COST),
+        ('notes', 'notes', *TEXT),
+        ('tooth', 'tooth', *INTEGER),
+        ('surfaces', 'surfaces', *LABEL),
+        ('created_at', 'created_at', *TIMESTAMP),
+    )
+
+    @property
+    def sort_key(self):
+        """Treatment date, with undated records before every dated one"""
+        return self.date or date.min
+
+
+RECORD_TYPES = {cls.COLLECTION: cls for cls in (Patient, Appointment, Treatment)}
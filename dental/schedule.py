@@ -0,0 +1,324 @@
+"""
+Appointment scheduling
+Typed appointment intervals per chair with conflict detection and free-slot search
+"""
+
+import heapq
+import os
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, time, timedelta
+
+from dental.storage import ARCHIVED, REMOVED
+
+DEFAULT_CHAIR = '1'
+DEFAULT_DURATION = 30  # minutes
+SLOT_STEP = 15  # free slots start on this minute grid
+OPENING_HOUR = 8
+CLOSING_HOUR = 18
+SEARCH_HORIZON_DAYS = 90
+
+APPOINTMENT_STATUSES = ('pending', 'confirmed', 'cancelled')
+# Appointments with these statuses do not occupy their chair.
+NON_BLOCKING_STATUSES = {'cancelled'}
+
+WINDOW_SPANS = ('day', 'week', 'month')
+
+_TIME_FORMATS = ('%H:%M', '%H.%M', '%I:%M %p', '%I:%M%p', '%I %p', '%I%p')
+
+
+class SchedulingConflict(ValueError):
+    """Raised when an appointment would overlap another one in the same chair"""
+
+    def __init__(self, chair, start, end, conflicts, free_slots=()):
+        self.chair = chair
+        self.start = start
+        self.end = end
+        self.conflicts = conflicts
+        self.free_slots = list(free_slots)
+        super().__init__(f"Chair {chair} is already booked between "
+                         f"{start:%Y-%m-%d %H:%M} and {end:%H:%M}")
+
+
+def parse_date(text):
+    return datetime.strptime(str(text).strip(), '%Y-%m-%d').date()
+
+
+def parse_time(text):
+    text = str(text).strip().upper()
+    for fmt in _TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).time()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised time: {text!r}")
+
+
+def parse_start(date, time):
+    """Combine a YYYY-MM-DD date and an HH:MM (or 9:30 AM) time into a datetime"""
+    date, time = str(date).strip(), str(time).strip()
+    if len(date) == 10 and len(time) == 5:
+        # Fast path for the canonical format, which is what nearly every
+        # stored appointment uses; strptime is an order of magnitude slower.
+        try:
+            return datetime.fromisoformat(f"{date}T{time}")
+        except ValueError:
+            pass
+    return datetime.combine(parse_date(date), parse_time(time))
+
+
+def appointment_duration(apt):
+    try:
+        minutes = int(apt.get('duration') or DEFAULT_DURATION)
+    except (TypeError, ValueError):
+        minutes = DEFAULT_DURATION
+    return timedelta(minutes=max(minutes, 1))
+
+
+def appointment_interval(apt):
+    """Return (chair, start, end) for an appointment, or None if its date/time do not parse"""
+    try:
+        start = parse_start(apt.get('date', ''), apt.get('time', ''))
+    except ValueError:
+        return None
+    chair = str(apt.get('chair') or DEFAULT_CHAIR)
+    return chair, start, start + appointment_duration(apt)
+
+
+def window_bounds(anchor, span):
+    """Return the [start, end) dates of the day, week (Monday first) or month containing anchor"""
+    if span == 'day':
+        start = anchor
+        return start, start + timedelta(days=1)
+    if span == 'week':
+        start = anchor - timedelta(days=anchor.weekday())
+        return start, start + timedelta(days=7)
+    if span == 'month':
+        start = anchor.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    raise ValueError(f"Unknown window span: {span!r}")
+
+
+def shift_window(anchor, span, steps):
+    """Return the start date of the window steps windows away from the one containing anchor"""
+    start, end = window_bounds(anchor, span)
+    if span == 'month':
+        months = start.year * 12 + start.month - 1 + steps
+        return start.replace(year=months // 12, month=months % 12 + 1)
+    return start + (end - start) * steps
+
+
+def _round_up(moment, minutes):
+    step = timedelta(minutes=minutes)
+    offset = (moment - datetime.min) % step
+    return moment + (step - offset) if offset else moment
+
+
+class ChairSchedule:
+    """Intervals booked in one chair, kept sorted by start time
+
+    Entries are (start, end, apt_id) tuples in a sorted list so lookups
+    are a bisect. Bookings accepted through the scheduler never overlap,
+    but data written before conflict checking existed may, so the
+    longest booking seen bounds how far before a point an overlapping
+    interval can start; conflict checks look back only that far.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.longest = timedelta(0)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, start, end, apt_id):
+        insort(self.entries, (start, end, apt_id))
+        self.longest = max(self.longest, end - start)
+
+    def add_many(self, entries):
+        """Add (start, end, apt_id) tuples, sorting once at the end"""
+        for start, end, _ in entries:
+            self.longest = max(self.longest, end - start)
+        self.entries.extend(entries)
+        self.entries.sort()
+
+    def remove(self, start, end, apt_id):
+        index = bisect_left(self.entries, (start, end, apt_id))
+        if index < len(self.entries) and self.entries[index] == (start, end, apt_id):
+            del self.entries[index]
+
+    def overlapping(self, start, end, ignore=None):
+        """Return the IDs of bookings that overlap [start, end)"""
+        lo = bisect_left(self.entries, (start - self.longest,))
+        hi = bisect_left(self.entries, (end,))
+        return [apt_id for other_start, other_end, apt_id in self.entries[lo:hi]
+                if other_end > start and apt_id != ignore]
+
+    def free_slots(self, after, length, count, opening, closing, horizon):
+        """Yield up to count free [start, end) slots of length, starting at or after after"""
+        found = 0
+        day = after.date()
+        last_day = day + timedelta(days=horizon)
+        index = bisect_left(self.entries, (after - self.longest,))
+        while day <= last_day and found < count:
+            day_start = datetime.combine(day, opening)
+            day_end = datetime.combine(day, closing)
+            cursor = _round_up(max(after, day_start), SLOT_STEP)
+            while found < count:
+                if cursor + length > day_end:
+                    break
+                while index < len(self.entries) and self.entries[index][1] <= cursor:
+                    index += 1
+                # Bookings that end after cursor; the first one starting
+                # before the candidate slot ends pushes the cursor past it.
+                blocker = None
+                probe = index
+                while probe < len(self.entries) and self.entries[probe][0] < cursor + length:
+                    if self.entries[probe][1] > cursor:
+                        if blocker is None or self.entries[probe][1] > blocker:
+                            blocker = self.entries[probe][1]
+                    probe += 1
+                if blocker is None:
+                    yield cursor, cursor + length
+                    found += 1
+                    cursor += length
+                else:
+                    cursor = _round_up(blocker, SLOT_STEP)
+            day += timedelta(days=1)
+
+
+class AppointmentSchedule:
+    """Per-chair interval index over the appointments collection
+
+    Built with one pass over the collection and then kept current from
+    change events. book() checks for overlaps in O(log n) and writes the
+    appointment under the same lock, so two bookings made through one
+    schedule cannot both take a slot.
+    """
+
+    def __init__(self, data_mgr, opening_hour=OPENING_HOUR, closing_hour=CLOSING_HOUR):
+        self.data_mgr = data_mgr
+        self.opening = time(opening_hour)
+        self.closing = time(closing_hour)
+        self.chairs = {}
+        self.inactive = []
+        self._inactive_entries = {}
+        self._intervals = {}
+        self._lock = threading.RLock()
+
+        data_mgr.subscribe_and_load(data_mgr.appointments_file, self.on_change, self._lock,
+                                    self._load)
+
+    def _load(self, appointments):
+        pending = {}
+        with self._lock:
+            for apt_id, apt in appointments.items():
+                interval = self._classify(apt_id, apt, sort=False)
+                if interval is not None:
+                    chair, start, end = interval
+                    pending.setdefault(chair, []).append((start, end, apt_id))
+            for chair, entries in pending.items():
+                self.chairs.setdefault(chair, ChairSchedule()).add_many(entries)
+            self.inactive.sort()
+
+    def _classify(self, apt_id, apt, sort=True):
+        """File apt under inactive, or return the interval it occupies (None if it has none)"""
+        interval = appointment_interval(apt)
+        if interval is None:
+            return None
+        if apt.get('status') in NON_BLOCKING_STATUSES:
+            entry = self._inactive_entries[apt_id] = (interval[1], interval[0], apt_id)
+            if sort:
+                insort(self.inactive, entry)
+            else:
+                self.inactive.append(entry)
+        else:
+            self._intervals[apt_id] = interval
+            return interval
+        return None
+
+    def on_change(self, event, apt_id, apt):
+        with self._lock:
+            previous = self._intervals.pop(apt_id, None)
+            if previous is not None:
+                chair, start, end = previous
+                self.chairs[chair].remove(start, end, apt_id)
+            entry = self._inactive_entries.pop(apt_id, None)
+            if entry is not None:
+                del self.inactive[bisect_left(self.inactive, entry)]
+            if event in (REMOVED, ARCHIVED):
+                return
+            interval = self._classify(apt_id, apt)
+            if interval is not None:
+                chair, start, end = interval
+                self.chairs.setdefault(chair, ChairSchedule()).add(start, end, apt_id)
+
+    def close(self):
+        """Stop following changes to the appointments collection"""
+        self.data_mgr.unsubscribe(self.data_mgr.appointments_file, self.on_change)
+
+    def conflicts(self, chair, start, end, ignore=None):
+        with self._lock:
+            schedule = self.chairs.get(str(chair))
+            return schedule.overlapping(start, end, ignore) if schedule else []
+
+    def free_slots(self, chair, length=DEFAULT_DURATION, count=5, after=None,
+                   horizon=SEARCH_HORIZON_DAYS):
+        """Return the next count free (start, end) slots of length minutes in chair"""
+        after = after or datetime.now()
+        with self._lock:
+            schedule = self.chairs.get(str(chair)) or ChairSchedule()
+            return list(schedule.free_slots(after, timedelta(minutes=length), count,
+                                            self.opening, self.closing, horizon))
+
+    def check(self, apt, apt_id=None):
+        """Raise ValueError if apt has no valid date/time, or SchedulingConflict if its chair is taken"""
+        interval = appointment_interval(apt)
+        if interval is None:
+            raise ValueError(f"Invalid appointment date or time: {apt.get('date')} {apt.get('time')}")
+        if apt.get('status') in NON_BLOCKING_STATUSES:
+            return
+        chair, start, end = interval
+        with self._lock:
+            taken = self.conflicts(chair, start, end, ignore=apt_id)
+            if taken:
+                minutes = (end - start) // timedelta(minutes=1)
+                raise SchedulingConflict(chair, start, end, taken,
+                                         self.free_slots(chair, minutes, count=3, after=start))
+
+    def book(self, apt_id, apt):
+        """Save apt as apt_id, raising SchedulingConflict if its chair is taken"""
+        with self._lock:
+            self.check(apt, apt_id)
+            self.data_mgr.put_appointment(apt_id, apt)
+
+    def ids_between(self, start, end):
+        """IDs of appointments starting in [start, end), in chronological order
+
+        Each chair's entries are sliced with two bisects, so the cost
+        depends on the size of the window rather than of the collection.
+        Appointments whose date or time cannot be parsed belong to no
+        window.
+        """
+        with self._lock:
+            ranges = [self.inactive[bisect_left(self.inactive, (start,)):
+                                    bisect_left(self.inactive, (end,))]]
+            for chair, schedule in self.chairs.items():
+                entries = schedule.entries
+                ranges.append([(entry_start, chair, apt_id) for entry_start, _, apt_id in
+                               entries[bisect_left(entries, (start,)):bisect_left(entries, (end,))]])
+            return [apt_id for _, _, apt_id in heapq.merge(*ranges)]
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_schedule(data_mgr):
+    """Return the process-wide AppointmentSchedule for data_mgr's data directory"""
+    key = os.path.abspath(data_mgr.data_dir)
+    with _shared_lock:
+        schedule = _shared.get(key)
+        if schedule is None:
+            schedule = _shared[key] = AppointmentSchedule(data_mgr)
+        return schedule
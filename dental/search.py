@@ -0,0 +1,232 @@
+"""
+Patient search
+In-memory token index over name, phone and email with prefix and typo-tolerant matching
+"""
+
+import re
+import threading
+from bisect import bisect_left, insort
+
+from dental.ids import id_sort_key
+from dental.storage import REMOVED
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Typo tolerance is limited to name tokens of at least this length; shorter
+# tokens have too many one-edit neighbours to be useful.
+FUZZY_MIN_LENGTH = 4
+
+EXACT, PREFIX, FUZZY = 3, 2, 1
+
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(str(text or '').lower())
+
+
+def _deletes(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def within_one_edit(a, b):
+    """True if a and b differ by at most one insertion, deletion, substitution or transposition"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        return (i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i]
+                and a[i + 2:] == b[i + 2:])
+    return a[i:] == b[i + 1:]
+
+
+def patient_tokens(patient):
+    """Return (all tokens, name tokens) indexed for a patient record"""
+    name_tokens = set(tokenize(patient.get('name')))
+    tokens = set(name_tokens)
+    tokens.update(tokenize(patient.get('email')))
+    phone = patient.get('phone') or ''
+    tokens.update(tokenize(phone))
+    digits = re.sub(r'\D', '', phone)
+    if digits:
+        tokens.add(digits)
+    return tokens, name_tokens
+
+
+class PatientSearchIndex:
+    """Inverted index over patient name, phone and email
+
+    Query terms are matched against indexed tokens as exact matches,
+    prefixes (for search-as-you-type), or, for name tokens, within one
+    typo. Every term must match. Tokens are kept in a sorted list so a
+    prefix is a bisect range, and one-deletion variants of name tokens
+    are indexed so typo candidates are found by lookup rather than by
+    comparing against every token. The index is built once from the
+    patients collection and then kept current from change events.
+    """
+
+    def __init__(self, data_mgr=None):
+        self._postings = {}
+        self._sorted_tokens = []
+        self._fuzzy = {}
+        self._doc_tokens = {}
+        self._lock = threading.RLock()
+        if data_mgr is not None:
+            data_mgr.subscribe_and_load(data_mgr.patients_file, self.on_change, self._lock,
+                                        lambda patients: self.add_many(patients.items()))
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def on_change(self, event, patient_id, patient):
+        if event == REMOVED:
+            self.remove(patient_id)
+        else:
+            self.add(patient_id, patient)
+
+    def add(self, patient_id, patient):
+        with self._lock:
+            self._add(patient_id, patient, sort=True)
+
+    def add_many(self, items):
+        """Index (patient_id, patient) pairs, sorting the token list once at the end"""
+        with self._lock:
+            for patient_id, patient in items:
+                self._add(patient_id, patient, sort=False)
+            self._sorted_tokens = sorted(self._postings)
+
+    def _add(self, patient_id, patient, sort):
+        tokens, name_tokens = patient_tokens(patient)
+        self.remove(patient_id)
+        self._doc_tokens[patient_id] = tokens
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = set()
+                if sort:
+                    insort(self._sorted_tokens, token)
+            posting.add(patient_id)
+        for token in name_tokens:
+            if len(token) >= FUZZY_MIN_LENGTH:
+                for variant in _deletes(token) | {token}:
+                    self._fuzzy.setdefault(variant, {}).setdefault(token, set()).add(patient_id)
+
+    def remove(self, patient_id):
+        with self._lock:
+            tokens = self._doc_tokens.pop(patient_id, None)
+            if tokens is None:
+                return
+            for token in tokens:
+                posting = self._postings[token]
+                posting.discard(patient_id)
+                if not posting:
+                    del self._postings[token]
+                    del self._sorted_tokens[bisect_left(self._sorted_tokens, token)]
+                if len(token) >= FUZZY_MIN_LENGTH:
+                    for variant in _deletes(token) | {token}:
+                        owners = self._fuzzy.get(variant, {}).get(token)
+                        if owners is None:
+                            continue
+                        owners.discard(patient_id)
+                        if not owners:
+                            del self._fuzzy[variant][token]
+                            if not self._fuzzy[variant]:
+                                del self._fuzzy[variant]
+
+    def _prefix_tokens(self, term):
+        # Tokens only contain [a-z0-9], all of which sort before '{'.
+        start = bisect_left(self._sorted_tokens, term)
+        return start, bisect_left(self._sorted_tokens, term + '{', start)
+
+    def _fuzzy_tokens(self, term):
+        if len(term) < FUZZY_MIN_LENGTH - 1:
+            return set()
+        found = set()
+        for variant in _deletes(term) | {term}:
+            for token in self._fuzzy.get(variant, ()):
+                if within_one_edit(term, token):
+                    found.add(token)
+        return found
+
+    def _match_count(self, start, end, fuzzy, cap):
+        """Count the postings a term would scan, giving up once past cap"""
+        count = 0
+        for token in self._sorted_tokens[start:end]:
+            count += len(self._postings[token])
+            if count > cap:
+                return count
+        return count + sum(len(self._postings[token]) for token in fuzzy)
+
+    def _term_score(self, term, fuzzy, tokens):
+        best = 0
+        for token in tokens:
+            if token == term:
+                return EXACT
+            if token.startswith(term):
+                best = PREFIX
+            elif best < FUZZY and token in fuzzy:
+                best = FUZZY
+        return best
+
+    def search(self, query, limit=50):
+        """Return up to limit patient IDs matching every term of query, best first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            ranges = []
+            for term in terms:
+                start, end = self._prefix_tokens(term)
+                fuzzy = self._fuzzy_tokens(term) if start == end or len(term) >= FUZZY_MIN_LENGTH else set()
+                fuzzy = {token for token in fuzzy if not token.startswith(term)}
+                if start == end and not fuzzy:
+                    return []
+                ranges.append((end - start + len(fuzzy), term, start, end, fuzzy))
+
+            # Count postings narrowest range first so broad terms such as a
+            # shared area code stop counting as soon as they lose.
+            ranges.sort(key=lambda plan: plan[0])
+            plans = []
+            cheapest = float('inf')
+            for _, term, start, end, fuzzy in ranges:
+                cost = self._match_count(start, end, fuzzy, cheapest)
+                cheapest = min(cheapest, cost)
+                plans.append((cost, term, start, end, fuzzy))
+
+            # Drive the search from the most selective term and check the
+            # others against each candidate's own handful of tokens.
+            plans.sort(key=lambda plan: plan[0])
+            _, term, start, end, fuzzy = plans[0]
+            driver_tokens = self._sorted_tokens[start:end]
+            if term in self._postings:
+                driver_tokens.remove(term)
+                driver_tokens.insert(0, term)
+            driver_tokens.extend(sorted(fuzzy))
+
+            results = {}
+            for token in driver_tokens:
+                for patient_id in self._postings[token]:
+                    if patient_id in results:
+                        continue
+                    doc_tokens = self._doc_tokens[patient_id]
+                    score = 0
+                    for _, other, _, _, other_fuzzy in plans:
+                        term_score = self._term_score(other, other_fuzzy, doc_tokens)
+                        if not term_score:
+                            break
+                        score += term_score
+                    else:
+                        results[patient_id] = score
+                        if len(results) >= limit:
+                            break
+                if len(results) >= limit:
+                    break
+
+        return sorted(results, key=lambda patient_id: (-results[patient_id], id_sort_key(patient_id)))
@@ -0,0 +1,296 @@
+"""
+SQLite storage backend
+Keeps every collection in one WAL-mode database with records indexed by patient
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from dental.profiling import profiler
+from dental.storage import StaleDataError, read_data_file, scan
+
+DB_NAME = 'dental.db'
+COLLECTIONS = ('patients', 'appointments', 'treatments')
+INDEXED_FIELDS = ('patient_id',)
+ITER_BATCH = 500
+
+
+def _table_for(path):
+    table = os.path.splitext(os.path.basename(path))[0]
+    if not table.isidentifier():
+        raise ValueError(f"Cannot store {path} in SQLite")
+    return table
+
+
+def _row_for(record_id, record):
+    return (
+        record_id,
+        record.get('patient_id'),
+        json.dumps(record, separators=(',', ':')),
+    )
+
+
+class _Database:
+    """One SQLite connection plus the per-table record cache built on top of it"""
+
+    def __init__(self, db_path):
+        self.path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.tables = set()
+        self.cache = {}
+        self.cache_version = None
+
+    def ensure_table(self, table):
+        if table in self.tables:
+            return
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} ('
+            'id TEXT PRIMARY KEY, patient_id TEXT, body TEXT NOT NULL)')
+        for field in INDEXED_FIELDS:
+            self.conn.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{field} ON {table} ({field})')
+        self.tables.add(table)
+
+    def table_version(self, table):
+        row = self.conn.execute(
+            'SELECT value FROM meta WHERE key = ?', (f'version:{table}',)).fetchone()
+        return int(row[0]) if row else 0
+
+    def data_version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def validate_cache(self):
+        # data_version only moves when another connection commits, so our
+        # own writes keep the cache valid and external ones drop it.
+        version = self.data_version()
+        if version != self.cache_version:
+            self.cache.clear()
+            self.cache_version = version
+
+
+def migrate_json_to_sqlite(data_dir='data', db_path=None, force=False):
+    """Import patients/appointments/treatments JSON files into the database
+
+    Runs once per database: the import is recorded in the meta table and
+    later calls are no-ops unless force is set. Returns the number of
+    records imported per collection.
+    """
+    db_path = db_path or os.path.join(data_dir, DB_NAME)
+    db = _Database(db_path)
+    try:
+        if not force and db.conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+            return {}
+
+        imported = {}
+        db.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in COLLECTIONS:
+                db.ensure_table(table)
+                try:
+                    records = read_data_file(os.path.join(data_dir, f'{table}.json'))
+                except FileNotFoundError:
+                    records = {}
+                db.conn.executemany(
+                    f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)',
+                    (_row_for(key, record) for key, record in records.items()))
+                imported[table] = len(records)
+            db.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('migrated_from_json', '1')")
+            db.conn.execute('COMMIT')
+        except BaseException:
+            db.conn.execute('ROLLBACK')
+            raise
+        return imported
+    finally:
+        db.conn.close()
+
+
+class SqliteBackend:
+    """Stores collections as rows in data/dental.db
+
+    ``patient_id`` is copied into an indexed column, so find() on it, as
+    sync does when a patient's ID changes, is an index lookup rather
+    than a full scan. Lookups by date or status go through the in-memory
+    schedule and statistics instead, so those fields are not indexed
+    here. The first time a data directory is opened the existing JSON
+    files are imported.
+    """
+
+    def __init__(self, migrate=True):
+        self.migrate = migrate
+        self._databases = {}
+        self._lock = threading.RLock()
+
+    def _open(self, path):
+        path = os.path.abspath(path)
+        data_dir = os.path.dirname(path)
+        db = self._databases.get(data_dir)
+        if db is None:
+            db_path = os.path.join(data_dir, DB_NAME)
+            if self.migrate:
+                migrate_json_to_sqlite(data_dir, db_path)
+            db = _Database(db_path)
+            self._databases[data_dir] = db
+        table = _table_for(path)
+        db.ensure_table(table)
+        db.validate_cache()
+        return db, table
+
+    def _load(self, db, table):
+        data = db.cache.get(table)
+        if data is None:
+            started = time.perf_counter()
+            data = {
+                record_id: json.loads(body)
+                for record_id, body in db.conn.execute(f'SELECT id, body FROM {table}')
+            }
+            if profiler.enabled:
+                profiler.detail('parse', table, time.perf_counter() - started, rows=len(data))
+            db.cache[table] = data
+        return data
+
+    def _write(self, db, table, puts, deletes, expected_version=None):
+        started = time.perf_counter()
+        db.conn.execute('BEGIN IMMEDIATE')
+        try:
+            if expected_version is not None and db.table_version(table) != expected_version:
+                raise StaleDataError(f"{table} changed since it was read")
+            if puts:
+                db.conn.executemany(
+                    f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)',
+                    [_row_for(key, record) for key, record in puts.items()])
+            if deletes:
+                db.conn.executemany(
+                    f'DELETE FROM {table} WHERE id = ?', [(key,) for key in deletes])
+            db.conn.execute(
+                "INSERT INTO meta VALUES (?, '1') ON CONFLICT (key) "
+                'DO UPDATE SET value = CAST(value AS INTEGER) + 1', (f'version:{table}',))
+            db.conn.execute('COMMIT')
+        except BaseException:
+            db.conn.execute('ROLLBACK')
+            db.cache.pop(table, None)
+            raise
+        db.cache_version = db.data_version()
+        if profiler.enabled:
+            profiler.detail('write', table, time.perf_counter() - started,
+                            rows=len(puts) + len(deletes))
+
+        cached = db.cache.get(table)
+        if cached is not None:
+            cached.update(puts)
+            for key in deletes:
+                cached.pop(key, None)
+
+    def load(self, path):
+        with self._lock:
+            db, table = self._open(path)
+            return self._load(db, table)
+
+    def get(self, path, key):
+        with self._lock:
+            db, table = self._open(path)
+            cached = db.cache.get(table)
+            if cached is not None:
+                return cached.get(key)
+            row = db.conn.execute(f'SELECT body FROM {table} WHERE id = ?', (key,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def items(self, path):
+        """Yield (record_id, record) in pages of ITER_BATCH rows unless the table is cached"""
+        with self._lock:
+            db, table = self._open(path)
+            cached = db.cache.get(table)
+        if cached is not None:
+            yield from list(cached.items())
+            return
+        last = 0
+        while True:
+            with self._lock:
+                rows = db.conn.execute(
+                    f'SELECT rowid, id, body FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last, ITER_BATCH)).fetchall()
+            for last, record_id, body in rows:
+                yield record_id, json.loads(body)
+            if len(rows) < ITER_BATCH:
+                return
+
+    def keys(self, path):
+        with self._lock:
+            db, table = self._open(path)
+            cached = db.cache.get(table)
+            if cached is not None:
+                return iter(list(cached))
+            return iter([row[0] for row in db.conn.execute(f'SELECT id FROM {table} ORDER BY rowid')])
+
+    def version(self, path):
+        with self._lock:
+            db, table = self._open(path)
+            return db.table_version(table)
+
+    def save(self, path, data, expected_version=None):
+        with self._lock:
+            db, table = self._open(path)
+            current = self._load(db, table)
+            puts = {key: record for key, record in data.items() if current.get(key) != record}
+            deletes = [key for key in current if key not in data]
+            if puts or deletes:
+                self._write(db, table, puts, deletes, expected_version)
+            elif expected_version is not None and db.table_version(table) != expected_version:
+                raise StaleDataError(f"{table} changed since it was read")
+
+    def put(self, path, key, record):
+        self.put_many(path, {key: record})
+
+    def put_many(self, path, records):
+        with self._lock:
+            db, table = self._open(path)
+            self._write(db, table, {key: dict(record) for key, record in records.items()}, [])
+
+    def delete(self, path, key):
+        with self._lock:
+            db, table = self._open(path)
+            self._write(db, table, {}, [key])
+
+    def find(self, path, field, value):
+        if field not in INDEXED_FIELDS:
+            return scan(self.load(path), field, value)
+        with self._lock:
+            db, table = self._open(path)
+            return {
+                record_id: json.loads(body)
+                for record_id, body in db.conn.execute(
+                    f'SELECT id, body FROM {table} WHERE {field} = ?', (value,))
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'databases': len(self._databases),
+                'cached_tables': sum(len(db.cache) for db in self._databases.values()),
+            }
+
+    def close(self):
+        with self._lock:
+            for db in self._databases.values():
+                db.conn.close()
+            self._databases.clear()
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    data_dir = args[0] if args else 'data'
+    counts = migrate_json_to_sqlite(data_dir, force='--force' in sys.argv)
+    if counts:
+        for table, count in counts.items():
+            print(f"{table}: {count} records imported")
+    else:
+        print(f"{os.path.join(data_dir, DB_NAME)} was already migrated (use --force to re-import)")
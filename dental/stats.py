@@ -0,0 +1,94 @@
+"""
+Practice statistics
+Running counters kept up to date from DataManager change events
+"""
+
+import threading
+from collections import Counter
+
+from dental.money import parse_cents
+from dental.storage import ARCHIVED, REMOVED
+
+
+class PracticeStats:
+    """Patient, appointment and revenue counters maintained incrementally
+
+    The collections are scanned once at construction and after that every
+    added/updated/removed event adjusts the counters in O(1), so reading
+    e.g. the appointment count for any date never rescans anything.
+    Listeners registered with add_listener() are called with no arguments
+    after each change.
+    """
+
+    def __init__(self, data_mgr):
+        self.data_mgr = data_mgr
+        self.patients_total = 0
+        self.appointments_by_date = Counter()
+        self.appointments_by_status = Counter()
+        self.revenue_by_date = Counter()
+        self._patient_ids = set()
+        self._appointments = {}
+        self._treatments = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+
+        data_mgr.subscribe_and_load(data_mgr.patients_file, self._changed(self._on_patient),
+                                    self._lock)
+        data_mgr.subscribe_and_load(data_mgr.appointments_file,
+                                    self._changed(self._on_appointment), self._lock)
+        data_mgr.subscribe_and_load(data_mgr.treatments_file, self._changed(self._on_treatment),
+                                    self._lock)
+
+    def _changed(self, handler):
+        def callback(event, record_id, record):
+            with self._lock:
+                handler(event, record_id, record)
+            for listener in list(self._listeners):
+                listener()
+        return callback
+
+    def _on_patient(self, event, patient_id, patient):
+        if event == REMOVED:
+            self._patient_ids.discard(patient_id)
+        else:
+            self._patient_ids.add(patient_id)
+        self.patients_total = len(self._patient_ids)
+
+    def _on_appointment(self, event, apt_id, apt):
+        previous = self._appointments.pop(apt_id, None)
+        if previous is not None:
+            date, status = previous
+            self.appointments_by_date[date] -= 1
+            self.appointments_by_status[status] -= 1
+        if event not in (REMOVED, ARCHIVED):
+            date, status = apt.get('date', ''), apt.get('status', 'pending')
+            self._appointments[apt_id] = (date, status)
+            self.appointments_by_date[date] += 1
+            self.appointments_by_status[status] += 1
+
+    def _on_treatment(self, event, treatment_id, treatment):
+        previous = self._treatments.pop(treatment_id, None)
+        if previous is not None:
+            date, cents = previous
+            self.revenue_by_date[date] -= cents
+        if event not in (REMOVED, ARCHIVED):
+            date, cents = treatment.get('date', ''), parse_cents(treatment.get('cost')) or 0
+            self._treatments[treatment_id] = (date, cents)
+            self.revenue_by_date[date] += cents
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def appointments_on(self, date):
+        return self.appointments_by_date[date]
+
+    def appointments_with_status(self, status):
+        return self.appointments_by_status[status]
+
+    def revenue_on(self, date):
+        """Treatment revenue for date in cents"""
+        return self.revenue_by_date[date]
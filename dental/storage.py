@@ -0,0 +1,651 @@
+"""
+Data storage layer for the Dental Mobile Application
+Parsed collections are cached process-wide and revalidated against the file on disk
+"""
+
+import os
+import threading
+import time
+import weakref
+
+from dental import compact
+from dental.ids import IdAllocator
+from dental.locking import file_lock
+from dental.mapped import MappedCollection
+from dental.profiling import profiler, timed
+
+
+LOCK_SUFFIX = '.lock'
+READ_RETRIES = 5
+READ_RETRY_DELAY = 0.01
+UPDATE_RETRIES = 5
+
+
+class StaleDataError(Exception):
+    """A collection changed between reading it and saving it back"""
+
+
+def read_data_file(path, retries=READ_RETRIES):
+    """Parse a collection file in either format, retrying while it does not decode
+
+    A file that does not decode is usually being written in place by a
+    program that does not replace it atomically, so it is read again
+    after a growing delay. If it still does not decode, ValueError is
+    raised: a damaged file must never be taken for an empty collection
+    and then overwritten by the next save. An empty file is an empty
+    collection, without retrying.
+    """
+    delay = READ_RETRY_DELAY
+    for attempt in range(retries + 1):
+        try:
+            return compact.read_file(path)
+        except ValueError as error:
+            if os.path.getsize(path) == 0:
+                return {}
+            if attempt == retries:
+                raise ValueError(f"{path} could not be decoded and was not loaded: {error}") \
+                    from error
+        time.sleep(delay)
+        delay *= 2
+
+
+def _sync_directory(path):
+    """Make a rename in path's directory durable (POSIX only)"""
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def scan(data, field, value):
+    """Return the records of data whose field equals value"""
+    return {key: record for key, record in data.items() if record.get(field) == value}
+
+
+class DataStore:
+    """Process-wide cache of parsed data files, revalidated by mtime and size
+
+    Files are read in either format and written in file_format, which
+    defaults to the DENTAL_FORMAT variable ('json' or 'compact').
+
+    A file that is not cached can still be read one record at a time:
+    get_record() and iter_records() go through a MappedCollection of the
+    file instead of parsing it whole, so looking up one patient does not
+    load every patient. Views are closed before their file is rewritten;
+    iterations still running over one finish over the file as it was
+    (see MappedCollection).
+
+    The (mtime, size) signature doubles as the version of a file: put()
+    makes sure every write changes it.
+    """
+
+    def __init__(self, file_format=None, fsync=True):
+        self.file_format = file_format or compact.default_format()
+        self.fsync = fsync
+        self._entries = {}
+        self._views = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.mapped_reads = 0
+
+    @staticmethod
+    def _signature(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self, path):
+        """Return the parsed contents of path, parsing only if the file changed"""
+        path = os.path.abspath(path)
+        with self._lock:
+            try:
+                signature = self._signature(path)
+            except FileNotFoundError:
+                self._entries.pop(path, None)
+                self.misses += 1
+                return {}
+
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            started = time.perf_counter()
+            try:
+                data = read_data_file(path)
+            except FileNotFoundError:
+                return {}
+            if profiler.enabled:
+                profiler.detail('parse', os.path.basename(path), time.perf_counter() - started,
+                                bytes=signature[1])
+            self._entries[path] = (signature, data)
+            return data
+
+    def _cached(self, path, signature):
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == signature:
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def _view(self, path, signature):
+        """The mapped view of path, or None if the file cannot be mapped"""
+        view = self._views.get(path)
+        if view is not None:
+            if view[0] == signature:
+                return view[1]
+            self._close_view(path)
+        started = time.perf_counter()
+        try:
+            mapped = MappedCollection.open(path)
+        except FileNotFoundError:
+            return None
+        if mapped is not None:
+            signature = mapped.signature
+            if profiler.enabled:
+                profiler.detail('map', os.path.basename(path), time.perf_counter() - started,
+                                bytes=signature[1])
+        self._views[path] = (signature, mapped)
+        return mapped
+
+    def _close_view(self, path):
+        view = self._views.pop(path, None)
+        if view is not None and view[1] is not None:
+            view[1].close()
+
+    def get_record(self, path, key):
+        """Return one record of path, decoding only that record unless path is cached"""
+        path = os.path.abspath(path)
+        with self._lock:
+            try:
+                signature = self._signature(path)
+            except FileNotFoundError:
+                return None
+            data = self._cached(path, signature)
+            if data is None:
+                mapped = self._view(path, signature)
+                if mapped is not None:
+                    self.mapped_reads += 1
+                    return mapped.get(key)
+                data = self.get(path)
+            return data.get(key)
+
+    def _source(self, path):
+        """The cached dict of path if it is current, else its mapped view, else the parsed dict"""
+        path = os.path.abspath(path)
+        with self._lock:
+            try:
+                signature = self._signature(path)
+            except FileNotFoundError:
+                return {}
+            data = self._cached(path, signature)
+            if data is None:
+                data = self._view(path, signature)
+                if data is None:
+                    data = self.get(path)
+                else:
+                    self.mapped_reads += 1
+            return data
+
+    def iter_records(self, path):
+        """Yield (record_id, record) of path, decoding one record at a time unless cached"""
+        # Started under the lock so a put() cannot close the view in between
+        with self._lock:
+            return iter(self._source(path).items())
+
+    def record_ids(self, path):
+        """Yield the record IDs of path in file order"""
+        with self._lock:
+            return iter(self._source(path).keys())
+
+    def put(self, path, data):
+        """Write data to path and keep it as the cached copy
+
+        The file is written beside path, flushed to disk and renamed over
+        it, so readers (and mapped views in other processes) see the old or
+        the new file, never a partly written one, and a crash leaves one of
+        the two.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            started = time.perf_counter()
+            self._close_view(path)
+            previous = self.version(path)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                compact.write(f, data, self.file_format)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            if self.fsync:
+                _sync_directory(path)
+            signature = self._signature(path)
+            if signature == previous:
+                # Same size within one tick of the file system clock: move
+                # the mtime on so that caches and version checks notice
+                os.utime(path, ns=(signature[0] + 1, signature[0] + 1))
+                signature = self._signature(path)
+            if profiler.enabled:
+                profiler.detail('write', os.path.basename(path), time.perf_counter() - started,
+                                bytes=signature[1])
+            self._entries[path] = (signature, data)
+
+    def version(self, path):
+        """An opaque token that changes whenever path is rewritten"""
+        try:
+            return self._signature(os.path.abspath(path))
+        except FileNotFoundError:
+            return (0, 0)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self.release()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+                self._close_view(os.path.abspath(path))
+
+    def release(self):
+        """Close every mapped view; they are reopened on the next record read"""
+        with self._lock:
+            for path in list(self._views):
+                self._close_view(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'mapped_reads': self.mapped_reads,
+                'mapped': sum(1 for view in self._views.values() if view[1] is not None),
+            }
+
+
+shared_store = DataStore()
+
+
+class JsonFileBackend:
+    """Stores each collection as one indented JSON or compact document
+
+    Every write re-reads the file and saves it back while holding
+    <file>.lock, so processes sharing a data directory do not lose each
+    other's records.
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else shared_store
+
+    def load(self, path):
+        return self.store.get(path)
+
+    def get(self, path, key):
+        return self.store.get_record(path, key)
+
+    def items(self, path):
+        return self.store.iter_records(path)
+
+    def keys(self, path):
+        return self.store.record_ids(path)
+
+    def version(self, path):
+        return self.store.version(path)
+
+    def save(self, path, data, expected_version=None):
+        with file_lock(path + LOCK_SUFFIX):
+            if expected_version is not None and self.store.version(path) != expected_version:
+                raise StaleDataError(f"{path} changed since it was read")
+            self.store.put(path, dict(data))
+
+    def put(self, path, key, record):
+        self.put_many(path, {key: record})
+
+    def put_many(self, path, records):
+        with file_lock(path + LOCK_SUFFIX):
+            data = dict(self.store.get(path))
+            data.update(records)
+            self.store.put(path, data)
+
+    def delete(self, path, key):
+        with file_lock(path + LOCK_SUFFIX):
+            data = dict(self.store.get(path))
+            if data.pop(key, None) is not None:
+                self.store.put(path, data)
+
+    def find(self, path, field, value):
+        return scan(self.store.get(path), field, value)
+
+    def stats(self):
+        return self.store.stats()
+
+    def close(self):
+        self.store.release()
+
+
+# backend -> {path: (version, typed records)}, filled by DataManager.load_records
+_typed_records = weakref.WeakKeyDictionary()
+
+ADDED = 'added'
+UPDATED = 'updated'
+REMOVED = 'removed'
+# The record left the collection file for dental.archive and is still
+# readable there; the event carries the record as it was archived.
+ARCHIVED = 'archived'
+
+
+def diff_records(old, new):
+    """List the (event, record_id, record) changes that turn old into new"""
+    changes = []
+    for key, record in new.items():
+        previous = old.get(key)
+        if previous is None:
+            changes.append((ADDED, key, record))
+        elif previous != record:
+            changes.append((UPDATED, key, record))
+    changes.extend((REMOVED, key, None) for key in old if key not in new)
+    return changes
+
+
+class ChangeNotifier:
+    """Dispatches added/updated/removed/archived events to listeners of a collection file
+
+    Listeners are called as callback(event, record_id, record) on the
+    thread that made the change; record is None for removals.
+    """
+
+    def __init__(self):
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, path, callback):
+        with self._lock:
+            self._listeners.setdefault(os.path.abspath(path), []).append(callback)
+
+    def unsubscribe(self, path, callback):
+        with self._lock:
+            listeners = self._listeners.get(os.path.abspath(path), [])
+            if callback in listeners:
+                listeners.remove(callback)
+
+    def has_listeners(self, path):
+        return bool(self._listeners.get(os.path.abspath(path)))
+
+    def notify(self, path, changes):
+        with self._lock:
+            listeners = list(self._listeners.get(os.path.abspath(path), ()))
+        for event, record_id, record in changes:
+            for callback in listeners:
+                callback(event, record_id, record)
+
+
+shared_notifier = ChangeNotifier()
+
+
+def create_backend(name):
+    """Build a storage backend from its configured name"""
+    if name == 'json':
+        return JsonFileBackend()
+    if name == 'journal':
+        from dental.journal import JournalBackend
+        return JournalBackend()
+    if name == 'sqlite':
+        from dental.sqlite_backend import SqliteBackend
+        return SqliteBackend()
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_default_backend():
+    """Return the process-wide backend, chosen by the DENTAL_STORAGE variable"""
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = create_backend(os.environ.get('DENTAL_STORAGE', 'json'))
+        return _default_backend
+
+
+def set_default_backend(backend):
+    global _default_backend
+    with _default_backend_lock:
+        _default_backend = backend
+
+
+class DataManager:
+    """Manages application data persistence
+
+    Records handed out by the get_* methods are shared with the backend's
+    in-memory copy and must be treated as read-only; build a new dict to
+    change a record.
+    """
+
+    def __init__(self, data_dir='data', store=None, backend=None, notifier=None):
+        self.data_dir = data_dir
+        if backend is None:
+            backend = JsonFileBackend(store) if store is not None else get_default_backend()
+        self.backend = backend
+        self.notifier = notifier if notifier is not None else shared_notifier
+        self.patients_file = os.path.join(self.data_dir, 'patients.json')
+        self.appointments_file = os.path.join(self.data_dir, 'appointments.json')
+        self.treatments_file = os.path.join(self.data_dir, 'treatments.json')
+        self._ensure_data_dir()
+        self.ids = IdAllocator(self.data_dir)
+
+    def _ensure_data_dir(self):
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+
+    @timed('load')
+    def load_data(self, filename):
+        # Callers add to the returned dict before saving it, so hand out a
+        # shallow copy and keep the backend's copy pristine.
+        return dict(self.backend.load(filename))
+
+    def load_versioned(self, filename):
+        """Return (data, version) for a save_data(..., expected_version=version) later"""
+        # Read the version first: a write in between then makes the save
+        # fail rather than silently overwrite it
+        version = self.backend.version(filename)
+        return self.load_data(filename), version
+
+    @timed('save')
+    def save_data(self, filename, data, expected_version=None):
+        """Replace the collection with data
+
+        With expected_version from load_versioned(), raise StaleDataError
+        instead of saving if the collection changed since it was read.
+        """
+        if not self.notifier.has_listeners(filename):
+            self.backend.save(filename, data, expected_version)
+            return
+        changes = diff_records(dict(self.backend.load(filename)), data)
+        self.backend.save(filename, data, expected_version)
+        self.notifier.notify(filename, changes)
+
+    def get_record(self, filename, record_id):
+        return self.backend.get(filename, record_id)
+
+    def iter_records(self, filename):
+        """Yield (record_id, record) pairs without building the whole collection where possible"""
+        return self.backend.items(filename)
+
+    def record_ids(self, filename):
+        return self.backend.keys(filename)
+
+    @timed('put')
+    def put_record(self, filename, record_id, record):
+        event = UPDATED if self.backend.get(filename, record_id) is not None else ADDED
+        self.backend.put(filename, record_id, record)
+        self.notifier.notify(filename, [(event, record_id, record)])
+
+    @timed('put')
+    def put_records(self, filename, records):
+        """Insert or replace several records with a single backend write"""
+        changes = [
+            (UPDATED if self.backend.get(filename, record_id) is not None else ADDED,
+             record_id, record)
+            for record_id, record in records.items()
+        ]
+        self.backend.put_many(filename, records)
+        self.notifier.notify(filename, changes)
+
+    @timed('delete')
+    def delete_record(self, filename, record_id):
+        if self.backend.get(filename, record_id) is None:
+            return
+        self.backend.delete(filename, record_id)
+        self.notifier.notify(filename, [(REMOVED, record_id, None)])
+
+    @timed('delete')
+    def archive_records(self, filename, record_ids, expected_version=None):
+        """Drop records that dental.archive has copied out of the collection
+
+        Works like save_data without record_ids, but listeners are sent
+        ARCHIVED with the record instead of REMOVED, since it can still be
+        read from the archive. Returns the number of records dropped.
+        """
+        data = self.load_data(filename)
+        archived = [(ARCHIVED, record_id, data.pop(record_id))
+                    for record_id in record_ids if record_id in data]
+        if not archived:
+            return 0
+        self.backend.save(filename, data, expected_version)
+        self.notifier.notify(filename, archived)
+        return len(archived)
+
+    def subscribe(self, filename, callback):
+        """Call callback(event, record_id, record) whenever filename changes"""
+        self.notifier.subscribe(filename, callback)
+
+    def unsubscribe(self, filename, callback):
+        self.notifier.unsubscribe(filename, callback)
+
+    def subscribe_and_load(self, filename, callback, lock, load=None):
+        """Subscribe callback to filename, then pass its current records to load
+
+        Both happen holding lock, which callback must take as well: a change
+        made while the records are read waits for load() and is applied on
+        top of it rather than lost. By default each record is replayed
+        through callback(None, record_id, record), so lock must then be
+        reentrant.
+        """
+        with lock:
+            self.subscribe(filename, callback)
+            records = self.load_data(filename)
+            if load is not None:
+                load(records)
+            else:
+                for record_id, record in records.items():
+                    callback(None, record_id, record)
+
+    def find_records(self, filename, field, value):
+        return self.backend.find(filename, field, value)
+
+    def _next_id(self, collection, filename):
+        return self.ids.next_id(collection, lambda: self.backend.keys(filename))
+
+    def next_ids(self, collection, count):
+        """Allocate count IDs for collection ('patients', 'appointments' or 'treatments')"""
+        filename = self.file_for(collection)
+        return self.ids.next_ids(collection, count, lambda: self.backend.keys(filename))
+
+    def reserve_id(self, collection, record_id):
+        """Keep the sequence for collection ahead of an ID assigned elsewhere"""
+        filename = self.file_for(collection)
+        self.ids.reserve(collection, record_id, lambda: self.backend.keys(filename))
+
+    def file_for(self, collection):
+        return os.path.join(self.data_dir, f'{collection}.json')
+
+    def load_records(self, collection):
+        """Return every record of collection as a list of dental.records typed records
+
+        Records are converted one at a time as they are read, so the
+        collection is never held as dicts and records at once. The records
+        are shared by every DataManager on the same backend until the
+        collection changes; loading it again meanwhile only checks its
+        version.
+        """
+        from dental.records import RECORD_TYPES
+        filename = self.file_for(collection)
+        version = self.backend.version(filename)
+        typed = _typed_records.setdefault(self.backend, {})
+        cached = typed.get(os.path.abspath(filename))
+        if cached is None or cached[0] != version:
+            from_dict = RECORD_TYPES[collection].from_dict
+            records = [from_dict(record_id, record)
+                       for record_id, record in self.iter_records(filename)]
+            cached = typed[os.path.abspath(filename)] = (version, records)
+        return list(cached[1])
+
+    def get_typed(self, collection, record_id):
+        """Return one record of collection as a typed record, or None"""
+        from dental.records import RECORD_TYPES
+        record = self.get_record(self.file_for(collection), record_id)
+        return None if record is None else RECORD_TYPES[collection].from_dict(record_id, record)
+
+    def next_patient_id(self):
+        return self._next_id('patients', self.patients_file)
+
+    def next_appointment_id(self):
+        return self._next_id('appointments', self.appointments_file)
+
+    def next_treatment_id(self):
+        return self._next_id('treatments', self.treatments_file)
+
+    def get_patients(self):
+        return self.load_data(self.patients_file)
+
+    def get_patient(self, patient_id):
+        return self.get_record(self.patients_file, patient_id)
+
+    def save_patients(self, patients):
+        self.save_data(self.patients_file, patients)
+
+    def put_patient(self, patient_id, patient):
+        self.put_record(self.patients_file, patient_id, patient)
+
+    def patient_name_for(self, record, patients=None):
+        """Resolve the current name of the patient a record belongs to
+
+        Pass the patients dict when resolving many records at once.
+        Records written before names were joined still carry a copied
+        patient_name, which is used if the patient no longer exists.
+        """
+        patient_id = record.get('patient_id')
+        if patients is not None:
+            patient = patients.get(patient_id)
+        else:
+            patient = self.get_patient(patient_id) if patient_id else None
+        if patient:
+            return patient['name']
+        return record.get('patient_name', 'Unknown patient')
+
+    def get_appointments(self):
+        return self.load_data(self.appointments_file)
+
+    def save_appointments(self, appointments):
+        self.save_data(self.appointments_file, appointments)
+
+    def put_appointment(self, apt_id, appointment):
+        self.put_record(self.appointments_file, apt_id, appointment)
+
+    def get_treatments(self):
+        return self.load_data(self.treatments_file)
+
+    def save_treatments(self, treatments):
+        self.save_data(self.treatments_file, treatments)
+
+    def put_treatment(self, treatment_id, treatment):
+        self.put_record(self.treatments_file, treatment_id, treatment)
+
+    def cache_stats(self):
+        return self.backend.stats()
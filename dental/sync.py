@@ -0,0 +1,615 @@
+"""
+Multi-device sync
+Replicates record changes between devices through a small sync server using version vectors
+
+    dental sync-server --host 0.0.0.0 --port 8765 --token s3cret
+    DENTAL_SYNC_URL=http://192.168.1.10:8765 DENTAL_SYNC_TOKEN=s3cret python main.py
+"""
+
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from bisect import bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dental.ids import ID_PREFIXES, highest_id_number, id_sort_key
+from dental.archive import ARCHIVED_COLLECTIONS, shared_archive
+from dental.storage import ADDED, ARCHIVED
+
+SYNC_COLLECTIONS = tuple(ID_PREFIXES)
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_INTERVAL = 30
+PUSH_BATCH = 500
+PULL_BATCH = 500
+COMPACT_ENTRIES = 1000
+# Fields of other collections that hold a patient ID, rewritten when a
+# patient is renamed
+PATIENT_REFERENCES = ('appointments', 'treatments')
+
+STATE_FILE = 'sync_state.json'
+JOURNAL_FILE = 'sync.journal'
+SERVER_JOURNAL_FILE = 'server.journal'
+
+
+class SyncError(Exception):
+    """The sync server could not be reached or rejected a request"""
+
+
+def dominates(a, b):
+    """True if version vector a has seen every change b has"""
+    return all(a.get(device, 0) >= counter for device, counter in b.items())
+
+
+def merge_vectors(a, b):
+    merged = dict(a)
+    for device, counter in b.items():
+        if counter > merged.get(device, 0):
+            merged[device] = counter
+    return merged
+
+
+def wins(a, b):
+    """Pick between two concurrent versions: the later edit, then the larger device ID"""
+    return (a['ts'], a['origin']) > (b['ts'], b['origin'])
+
+
+def _append_line(f, entry):
+    f.write(json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n')
+    f.flush()
+
+
+def _read_lines(path):
+    """Yield the entries of a JSON-lines journal, skipping a torn final line"""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return
+    for line in raw[:raw.rfind(b'\n') + 1].splitlines():
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SyncServer:
+    """Keeps the latest version of every record and hands out changes per device
+
+    A version is the record (None once deleted) plus its version vector
+    ('vv', {device: counter}), the time and device of the edit ('ts',
+    'origin') and its 'dot', the [device, counter] that names it. Each
+    device's dots are kept in order, so pull() finds what a device has
+    not seen by bisecting per device from its vector: the work grows with
+    the changes since its last sync, not with the number of records.
+
+    A pushed version replaces the stored one when its vector dominates
+    it and is dropped when the stored one dominates. Concurrent versions
+    are resolved by wins(); the winner is stored under a new server dot
+    with the merged vector, so every device, the losing one included,
+    pulls the outcome. A new record whose ID another device already used
+    for different data is reported back as a collision for the pushing
+    device to move to a fresh ID.
+
+    Accepted versions are appended to server.journal in state_dir and
+    replayed on start.
+    """
+
+    def __init__(self, state_dir='sync_server'):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.records = {}
+        self._logs = {}
+        self.highest = {collection: 0 for collection in SYNC_COLLECTIONS}
+        self.journal_path = os.path.join(state_dir, SERVER_JOURNAL_FILE)
+
+        entries = 0
+        self.server_id = None
+        for entry in _read_lines(self.journal_path):
+            if 'server_id' in entry:
+                self.server_id = entry['server_id']
+                continue
+            self._store(entry)
+            entries += 1
+        self.counter = max((version['vv'].get(self.server_id, 0)
+                            for version in self.records.values()), default=0)
+        if self.server_id is None or entries > 2 * len(self.records) + COMPACT_ENTRIES:
+            self._compact()
+        self._journal = open(self.journal_path, 'ab')
+
+    def _compact(self):
+        self.server_id = self.server_id or f'server-{uuid.uuid4().hex[:12]}'
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            _append_line(f, {'server_id': self.server_id})
+            for version in self.records.values():
+                _append_line(f, version)
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _store(self, version):
+        key = (version['collection'], version['id'])
+        self.records[key] = version
+        device, counter = version['dot']
+        log = self._logs.setdefault(device, ([], []))
+        position = bisect_right(log[0], counter)
+        log[0].insert(position, counter)
+        log[1].insert(position, key)
+        if version['record'] is not None and version['collection'] in self.highest:
+            number = highest_id_number([version['id']])
+            if number > self.highest[version['collection']]:
+                self.highest[version['collection']] = number
+
+    def _accept(self, version):
+        self._store(version)
+        _append_line(self._journal, version)
+
+    def push(self, device_id, changes):
+        """Apply a batch of versions from device_id
+
+        Returns {'accepted', 'conflicts', 'collisions': [[collection, id]],
+        'highest': {collection: highest ID number stored}}.
+        """
+        accepted = conflicts = 0
+        collisions = []
+        with self._lock:
+            for change in changes:
+                created = change.get('created', False)
+                change = {field: change[field] for field in
+                          ('collection', 'id', 'record', 'vv', 'ts', 'origin', 'dot')}
+                key = (change['collection'], change['id'])
+                stored = self.records.get(key)
+                if stored is None or (dominates(change['vv'], stored['vv'])
+                                      and change['vv'] != stored['vv']):
+                    self._accept(change)
+                    accepted += 1
+                elif dominates(stored['vv'], change['vv']):
+                    continue
+                elif created and stored['record'] != change['record']:
+                    collisions.append(list(key))
+                else:
+                    conflicts += 1
+                    winner = change if wins(change, stored) else stored
+                    self.counter += 1
+                    vv = merge_vectors(change['vv'], stored['vv'])
+                    vv[self.server_id] = self.counter
+                    self._accept(dict(winner, vv=vv, dot=[self.server_id, self.counter]))
+            self._journal.flush()
+            return {'accepted': accepted, 'conflicts': conflicts, 'collisions': collisions,
+                    'highest': dict(self.highest)}
+
+    def pull(self, vector, limit=PULL_BATCH):
+        """Return up to limit versions the holder of vector has not seen
+
+        Returns {'changes', 'vector', 'more'}; the caller adopts 'vector'
+        once it has applied the changes and pulls again while 'more' is set.
+        """
+        changes = []
+        progress = dict(vector)
+        with self._lock:
+            for device in sorted(self._logs):
+                counters, keys = self._logs[device]
+                for position in range(bisect_right(counters, vector.get(device, 0)), len(counters)):
+                    if len(changes) >= limit:
+                        return {'changes': changes, 'vector': progress, 'more': True}
+                    version = self.records[keys[position]]
+                    # Versions replaced since are covered by the newer dot
+                    if version['dot'] == [device, counters[position]]:
+                        changes.append(version)
+                    progress[device] = counters[position]
+            return {'changes': changes, 'vector': progress, 'more': False}
+
+    def status(self):
+        with self._lock:
+            return {'server_id': self.server_id, 'records': len(self.records),
+                    'devices': sorted(self._logs)}
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'DentalSync/1'
+
+    def _authorised(self):
+        token = self.server.token
+        if not token:
+            return True
+        return hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {token}')
+
+    def _reply(self, status, body):
+        payload = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if not self._authorised():
+            return self._reply(401, {'error': 'unauthorised'})
+        if self.path != '/status':
+            return self._reply(404, {'error': 'not found'})
+        self._reply(200, self.server.sync.status())
+
+    def do_POST(self):
+        if not self._authorised():
+            return self._reply(401, {'error': 'unauthorised'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            if self.path == '/push':
+                reply = self.server.sync.push(request['device'], request['changes'])
+            elif self.path == '/pull':
+                reply = self.server.sync.pull(request['vector'], request.get('limit', PULL_BATCH))
+            else:
+                return self._reply(404, {'error': 'not found'})
+        except (KeyError, TypeError, ValueError) as error:
+            return self._reply(400, {'error': f'bad request: {error}'})
+        self._reply(200, reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def make_http_server(sync_server, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None):
+    """An HTTP server exposing sync_server; call serve_forever() on it
+
+    The server hands every record to whoever asks, so binding to anything
+    but a loopback address raises ValueError unless a token is required.
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(f"refusing to serve patient records on {host} without a token; "
+                         "pass --token or set DENTAL_SYNC_TOKEN")
+    http_server = ThreadingHTTPServer((host, port), _Handler)
+    http_server.sync = sync_server
+    http_server.token = token
+    return http_server
+
+
+class HttpTransport:
+    """Talks to a sync server over HTTP"""
+
+    def __init__(self, url, token=None, timeout=10):
+        self.url = url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def _post(self, path, body):
+        request = urllib.request.Request(
+            self.url + path, data=json.dumps(body, separators=(',', ':')).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}, method='POST')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            raise SyncError(f"sync server answered {error.code} for {path}") from error
+        except (OSError, ValueError) as error:
+            raise SyncError(f"could not reach sync server at {self.url}: {error}") from error
+
+    def push(self, device_id, changes):
+        return self._post('/push', {'device': device_id, 'changes': changes})
+
+    def pull(self, device_id, vector, limit):
+        return self._post('/pull', {'device': device_id, 'vector': vector, 'limit': limit})
+
+
+class LocalTransport:
+    """Calls a SyncServer in the same process, for tests and demos
+
+    Requests and replies go through JSON as they would over HTTP, so no
+    objects are shared between the client and the server.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    @staticmethod
+    def _wire(value):
+        return json.loads(json.dumps(value))
+
+    def push(self, device_id, changes):
+        return self._wire(self.server.push(device_id, self._wire(changes)))
+
+    def pull(self, device_id, vector, limit):
+        return self._wire(self.server.pull(self._wire(vector), limit))
+
+
+class SyncClient:
+    """Keeps a DataManager's collections in sync with a sync server
+
+    Every change made through a DataManager in this process (they share
+    one ChangeNotifier) bumps this device's counter and marks the record
+    dirty. sync() pushes the dirty records in batches of PUSH_BATCH, then
+    pulls what other devices changed since this device's version vector
+    and applies it with one put_records() per collection and batch.
+
+    The device ID, counter, vector, each synced record's version and the
+    dirty set are kept in data/sync_state.json plus data/sync.journal,
+    which records every step since and is folded into the state file
+    after COMPACT_ENTRIES entries.
+    """
+
+    def __init__(self, data_mgr, transport):
+        self.data_mgr = data_mgr
+        self.transport = transport
+        self.state_path = os.path.join(data_mgr.data_dir, STATE_FILE)
+        self.journal_path = os.path.join(data_mgr.data_dir, JOURNAL_FILE)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._local = threading.local()
+        self._load_state()
+        self._callbacks = {}
+        for collection in SYNC_COLLECTIONS:
+            callback = self._listener(collection)
+            self._callbacks[collection] = callback
+            data_mgr.subscribe(data_mgr.file_for(collection), callback)
+
+    # State ------------------------------------------------------------------
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        self.device_id = state.get('device_id') or f'device-{uuid.uuid4().hex[:12]}'
+        self.counter = state.get('counter', 0)
+        self.vector = state.get('vector', {})
+        self.versions = {collection: state.get('versions', {}).get(collection, {})
+                         for collection in SYNC_COLLECTIONS}
+        # {(collection, id): created} in the order the records last changed
+        self.dirty = {(collection, record_id): created
+                      for collection, record_id, created in state.get('dirty', [])}
+        self._entries = 0
+        for entry in _read_lines(self.journal_path):
+            self._replay(entry)
+            self._entries += 1
+        if not state:
+            self._save_state()
+        self._journal = open(self.journal_path, 'ab')
+
+    def _replay(self, entry):
+        op = entry['op']
+        if op == 'local':
+            key = (entry['c'], entry['id'])
+            self.versions[entry['c']][entry['id']] = entry['meta']
+            created = self.dirty.pop(key, False) or entry['created']
+            self.dirty[key] = created
+            self.counter = max(self.counter, entry['meta']['dot'][1])
+        elif op == 'remote':
+            self.versions[entry['c']][entry['id']] = entry['meta']
+            self.dirty.pop((entry['c'], entry['id']), None)
+        elif op == 'pushed':
+            for collection, record_id, dot in entry['keys']:
+                meta = self.versions[collection].get(record_id)
+                if meta is not None and meta['dot'] == dot:
+                    self.dirty.pop((collection, record_id), None)
+        elif op == 'forget':
+            self.versions[entry['c']].pop(entry['id'], None)
+            self.dirty.pop((entry['c'], entry['id']), None)
+        elif op == 'vector':
+            self.vector = entry['vector']
+
+    def _log(self, entry):
+        """Apply entry to the in-memory state and append it to the journal"""
+        with self._lock:
+            self._replay(entry)
+            _append_line(self._journal, entry)
+            self._entries += 1
+
+    def _save_state(self):
+        with self._lock:
+            _write_json(self.state_path, {
+                'device_id': self.device_id,
+                'counter': self.counter,
+                'vector': self.vector,
+                'versions': self.versions,
+                'dirty': [[collection, record_id, created]
+                          for (collection, record_id), created in self.dirty.items()],
+            })
+            if getattr(self, '_journal', None) is not None:
+                self._journal.close()
+                self._journal = open(self.journal_path, 'wb')
+            self._entries = 0
+
+    # Local changes ----------------------------------------------------------
+
+    def _listener(self, collection):
+        def on_change(event, record_id, record):
+            # Archiving moves a record within this device; it is not an edit
+            if event != ARCHIVED and not getattr(self._local, 'applying', False):
+                self._record_local(collection, record_id, created=event == ADDED)
+        return on_change
+
+    def _record_local(self, collection, record_id, created):
+        with self._lock:
+            base = self.versions[collection].get(record_id)
+            vv = dict(base['vv']) if base else {}
+            counter = self.counter + 1
+            vv[self.device_id] = counter
+            meta = {'vv': vv, 'ts': time.time(), 'origin': self.device_id,
+                    'dot': [self.device_id, counter]}
+            self._log({'op': 'local', 'c': collection, 'id': record_id, 'meta': meta,
+                       'created': created and base is None})
+
+    def _applying(self, flag):
+        self._local.applying = flag
+
+    def seed(self):
+        """Mark every existing record dirty so the next sync pushes it
+
+        Use once on the device whose data should populate an empty server.
+        Devices holding a copy of the same files can seed as well: records
+        that match are merged rather than duplicated.
+        """
+        count = 0
+        for collection in SYNC_COLLECTIONS:
+            for record_id in self.data_mgr.record_ids(self.data_mgr.file_for(collection)):
+                self._record_local(collection, record_id, created=False)
+                count += 1
+        return count
+
+    # Sync rounds ------------------------------------------------------------
+
+    def sync(self):
+        """Push local changes, then pull remote ones
+
+        Returns {'pushed', 'pulled', 'conflicts', 'renamed'} counts; raises
+        SyncError if the server cannot be reached, leaving the state as it
+        was after the last completed batch.
+        """
+        with self._sync_lock:
+            result = {'pushed': 0, 'pulled': 0, 'conflicts': 0, 'renamed': 0}
+            try:
+                self._push(result)
+                self._pull(result)
+            finally:
+                if self._entries >= COMPACT_ENTRIES:
+                    self._save_state()
+            return result
+
+    def _push(self, result):
+        while True:
+            with self._lock:
+                batch = list(self.dirty.items())[:PUSH_BATCH]
+                if not batch:
+                    return
+                changes = []
+                for (collection, record_id), created in batch:
+                    record = self.data_mgr.get_record(self.data_mgr.file_for(collection),
+                                                      record_id)
+                    if record is None and collection in ARCHIVED_COLLECTIONS:
+                        # Edited, then archived before this push
+                        record = shared_archive(self.data_mgr).get(collection, record_id)
+                    changes.append(dict(self.versions[collection][record_id],
+                                        collection=collection, id=record_id, record=record,
+                                        created=created))
+            reply = self.transport.push(self.device_id, changes)
+            collided = {tuple(key) for key in reply['collisions']}
+            self._log({'op': 'pushed', 'keys': [
+                [change['collection'], change['id'], change['dot']] for change in changes
+                if (change['collection'], change['id']) not in collided
+            ]})
+            result['pushed'] += len(changes) - len(collided)
+            result['conflicts'] += reply['conflicts']
+            self._reserve(reply['highest'])
+            for collection, record_id in collided:
+                self._rename(collection, record_id)
+                result['renamed'] += 1
+
+    def _reserve(self, highest):
+        for collection, number in highest.items():
+            if number and collection in SYNC_COLLECTIONS:
+                self.data_mgr.reserve_id(collection, f'{ID_PREFIXES[collection]}{number}')
+
+    def _rename(self, collection, record_id):
+        """Move a locally created record whose ID another device took to a fresh ID"""
+        data_mgr = self.data_mgr
+        filename = data_mgr.file_for(collection)
+        record = data_mgr.get_record(filename, record_id)
+        self._log({'op': 'forget', 'c': collection, 'id': record_id})
+        if record is None:
+            return
+        new_id = data_mgr.next_ids(collection, 1)[0]
+        self._applying(True)
+        try:
+            # The old ID now belongs to the other device's record, which
+            # the pull that follows brings in.
+            data_mgr.delete_record(filename, record_id)
+        finally:
+            self._applying(False)
+        data_mgr.put_record(filename, new_id, record)
+        if collection == 'patients':
+            for referencing in PATIENT_REFERENCES:
+                referencing_file = data_mgr.file_for(referencing)
+                moved = {
+                    other_id: dict(other, patient_id=new_id)
+                    for other_id, other in data_mgr.find_records(
+                        referencing_file, 'patient_id', record_id).items()
+                }
+                if moved:
+                    data_mgr.put_records(referencing_file, moved)
+
+    def _pull(self, result):
+        while True:
+            # Every change this device made is either pushed or still
+            # dirty, so its own entries never need to come back
+            vector = dict(self.vector)
+            vector[self.device_id] = self.counter
+            reply = self.transport.pull(self.device_id, vector, PULL_BATCH)
+            self._apply(reply['changes'], result)
+            self._log({'op': 'vector', 'vector': reply['vector']})
+            if not reply['more']:
+                return
+
+    def _apply(self, changes, result):
+        by_collection = {}
+        with self._lock:
+            for change in changes:
+                collection, record_id = change['collection'], change['id']
+                if collection not in self.versions:
+                    continue
+                local = self.versions[collection].get(record_id)
+                if local is not None:
+                    if dominates(local['vv'], change['vv']):
+                        continue
+                    if not dominates(change['vv'], local['vv']) and not wins(change, local):
+                        # A local edit made during this sync; pushed next time
+                        continue
+                by_collection.setdefault(collection, []).append(change)
+
+        for collection, applied in by_collection.items():
+            filename = self.data_mgr.file_for(collection)
+            puts = {change['id']: change['record'] for change in applied
+                    if change['record'] is not None}
+            self._applying(True)
+            try:
+                if puts:
+                    self.data_mgr.put_records(filename, puts)
+                for change in applied:
+                    if change['record'] is None:
+                        self.data_mgr.delete_record(filename, change['id'])
+            finally:
+                self._applying(False)
+            for change in applied:
+                self._log({'op': 'remote', 'c': collection, 'id': change['id'], 'meta': {
+                    field: change[field] for field in ('vv', 'ts', 'origin', 'dot')}})
+            if puts:
+                self.data_mgr.reserve_id(collection, max(puts, key=id_sort_key))
+            result['pulled'] += len(applied)
+
+    def close(self):
+        for collection, callback in self._callbacks.items():
+            self.data_mgr.unsubscribe(self.data_mgr.file_for(collection), callback)
+        with self._sync_lock:
+            self._save_state()
+            self._journal.close()
@@ -0,0 +1,258 @@
+"""
+Synthetic practice data
+Seeded, realistic patients, appointments and treatments for benchmarks and demos
+"""
+
+import math
+import random
+from datetime import date, datetime, timedelta
+
+from dental.ids import format_id
+from dental.schedule import OPENING_HOUR
+from dental.teeth import SURFACES, TOOTH_COUNT, ToothChart
+
+SCALES = {
+    '1k': 1_000,
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+# Each patient has this many appointments and treatments on average.
+VISITS_PER_PATIENT = 4
+
+# Appointments are spread over one working day per this many appointments,
+# within these bounds, and run this many days past the anchor date.
+APPOINTMENTS_PER_DAY = 20
+MIN_DAYS = 30
+MAX_DAYS = 3650
+FUTURE_DAYS = 14
+
+# Eight of the longest visits with the longest gaps fill the opening hours
+# exactly, so appointments never run past closing or overlap.
+APPOINTMENTS_PER_CHAIR = 8
+
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+    'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+    'Carlos', 'Karen', 'Wei', 'Nancy', 'Ahmed', 'Lisa', 'Daniel', 'Priya', 'Matthew', 'Sofia',
+    'Anthony', 'Fatima', 'Mark', 'Emily', 'Kenji', 'Olivia', 'Luis', 'Amara', 'Ivan', 'Chloe',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+    'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore',
+    'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Nguyen',
+    'Patel', 'Kim', 'Chen', 'Okafor', 'Kowalski', 'Rossi', 'Novak', "O'Brien", 'Schmidt', 'Tanaka',
+)
+EMAIL_DOMAINS = ('example.com', 'mail.example.org', 'clinic-test.net')
+
+REASONS = (
+    'Check-up', 'Cleaning', 'Toothache', 'Filling', 'Crown fitting', 'Root canal', 'Consultation',
+    'Follow-up', 'Extraction', 'Whitening', 'Implant review', 'Broken tooth',
+)
+DURATIONS = (30, 30, 30, 45, 60)
+GAPS = (0, 0, 0, 15)
+
+# (procedure, lowest cost, highest cost, charted on a tooth, surfaces it touches)
+PROCEDURES = (
+    ('Cleaning', 95, 150, False, 0),
+    ('Examination', 60, 100, False, 0),
+    ('X-ray', 50, 120, False, 0),
+    ('Filling', 120, 250, True, 2),
+    ('Filling', 120, 250, True, 1),
+    ('Crown', 800, 1500, True, 0),
+    ('Root canal', 700, 1200, True, 0),
+    ('Extraction', 150, 400, True, 0),
+    ('Implant', 2500, 4500, True, 0),
+    ('Whitening', 300, 600, False, 0),
+)
+PROCEDURE_WEIGHTS = (30, 20, 15, 12, 8, 5, 4, 3, 1, 2)
+NOTES = ('', '', '', 'No complications', 'Patient anxious; consider sedation next time',
+         'Review in six months', 'Local anaesthetic', 'Sensitive to cold')
+
+
+def parse_scale(text):
+    """Parse a scale such as '10k', '1M' or '2500' into a record count"""
+    text = str(text).strip().lower()
+    if text in SCALES:
+        return SCALES[text]
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    try:
+        count = int(float(text.rstrip('km')) * multiplier)
+    except ValueError:
+        raise ValueError(f"Unrecognised scale: {text!r}")
+    if count < 1:
+        raise ValueError(f"Scale must be at least 1, got {text!r}")
+    return count
+
+
+def scale_name(count):
+    for name, size in SCALES.items():
+        if size == count:
+            return name
+    return str(count)
+
+
+def counts_for(size):
+    """Collection sizes for a scale: size appointments and treatments, size / 4 patients"""
+    return {
+        'patients': max(1, size // VISITS_PER_PATIENT),
+        'appointments': size,
+        'treatments': size,
+    }
+
+
+class SyntheticPractice:
+    """Generates one practice's records from a seed
+
+    The same seed, scale and anchor date always produce the same records.
+    Appointments are laid out chair by chair on working days (Monday to
+    Saturday) ending FUTURE_DAYS after the anchor, never overlap in a
+    chair, and are mostly confirmed in the past and pending in the
+    future. Treatments are performed at past visits, so they come out in
+    date order, and tooth procedures are charted on the patient.
+    """
+
+    def __init__(self, seed=0, today=None):
+        self.seed = seed
+        self.today = today or date.today()
+        self.rng = random.Random(seed)
+
+    def generate(self, size):
+        """Return {'patients': ..., 'appointments': ..., 'treatments': ...} as {id: record} dicts"""
+        counts = counts_for(size)
+        patients = dict(self.patients(counts['patients']))
+        visits = []
+        appointments = dict(self.appointments(counts['appointments'], list(patients), visits))
+        treatments = dict(self.treatments(counts['treatments'], visits, patients))
+        return {'patients': patients, 'appointments': appointments, 'treatments': treatments}
+
+    def _timestamp(self, day, hour_from=8, hour_to=19):
+        moment = datetime.combine(day, datetime.min.time()) + timedelta(
+            seconds=self.rng.randrange(hour_from * 3600, hour_to * 3600))
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+    def patients(self, count):
+        """Yield (patient_id, patient)"""
+        rng = self.rng
+        oldest = date(self.today.year - 90, 1, 1).toordinal()
+        youngest = (self.today - timedelta(days=365 * 2)).toordinal()
+        registered_from = (self.today - timedelta(days=MAX_DAYS)).toordinal()
+        for number in range(1, count + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            email = ''
+            if rng.random() < 0.8:
+                handle = f"{first}.{last}".lower().replace("'", '')
+                email = f"{handle}{rng.randrange(100)}@{rng.choice(EMAIL_DOMAINS)}"
+            yield format_id('patients', number), {
+                'name': f"{first} {last}",
+                'phone': f"555-{rng.randrange(200, 1000):03d}-{rng.randrange(10000):04d}",
+                'email': email,
+                'dob': date.fromordinal(rng.randrange(oldest, youngest)).isoformat(),
+                'created_at': self._timestamp(
+                    date.fromordinal(rng.randrange(registered_from, self.today.toordinal() + 1))),
+            }
+
+    def _working_days(self, count):
+        """The count working days ending FUTURE_DAYS after today, oldest first"""
+        days = []
+        day = self.today + timedelta(days=FUTURE_DAYS)
+        while len(days) < count:
+            if day.weekday() != 6:
+                days.append(day)
+            day -= timedelta(days=1)
+        days.reverse()
+        return days
+
+    def appointments(self, count, patient_ids, visits=None):
+        """Yield (apt_id, appointment) in date order
+
+        (date, patient_id) of every past, confirmed appointment is appended
+        to visits so treatments can be generated for them.
+        """
+        rng = self.rng
+        days = self._working_days(min(max(count // APPOINTMENTS_PER_DAY, MIN_DAYS), MAX_DAYS))
+        per_day = math.ceil(count / len(days))
+        chairs = math.ceil(per_day / APPOINTMENTS_PER_CHAIR)
+        number = 0
+        for day in days:
+            past = day < self.today
+            date_text = day.isoformat()
+            cursors = [OPENING_HOUR * 60] * chairs
+            for slot in range(min(per_day, count - number)):
+                chair = slot % chairs
+                start = cursors[chair] + rng.choice(GAPS)
+                duration = rng.choice(DURATIONS)
+                cursors[chair] = start + duration
+                roll = rng.random()
+                if past:
+                    status = 'cancelled' if roll < 0.07 else 'pending' if roll < 0.1 else 'confirmed'
+                else:
+                    status = 'cancelled' if roll < 0.05 else 'confirmed' if roll < 0.3 else 'pending'
+                patient_id = rng.choice(patient_ids)
+                if past and status == 'confirmed' and visits is not None:
+                    visits.append((date_text, patient_id))
+                number += 1
+                yield format_id('appointments', number), {
+                    'patient_id': patient_id,
+                    'date': date_text,
+                    'time': f"{start // 60:02d}:{start % 60:02d}",
+                    'duration': duration,
+                    'chair': str(chair + 1),
+                    'reason': rng.choice(REASONS),
+                    'status': status,
+                    'created_at': self._timestamp(day - timedelta(days=rng.randrange(1, 60))),
+                }
+
+    def treatments(self, count, visits, patients=None):
+        """Yield (treatment_id, treatment) in date order for a sample of visits
+
+        Tooth procedures are applied to each patient's chart, which is
+        stored on the patient record when patients is given.
+        """
+        rng = self.rng
+        if not visits:
+            visits = [(self.today.isoformat(), patient_id) for patient_id in (patients or ['P0001'])]
+        charts = {}
+        picks = sorted(rng.choices(range(len(visits)), k=count))
+        procedures = rng.choices(PROCEDURES, weights=PROCEDURE_WEIGHTS, k=count)
+        for number, (index, procedure) in enumerate(zip(picks, procedures), 1):
+            date_text, patient_id = visits[index]
+            name, low, high, charted, surface_count = procedure
+            treatment = {
+                'patient_id': patient_id,
+                'procedure': name,
+                'date': date_text,
+                'cost': f"{rng.randrange(low, high + 1)}" if rng.random() < 0.7
+                        else f"{rng.randrange(low * 100, high * 100 + 1) / 100:.2f}",
+                'notes': rng.choice(NOTES),
+                'created_at': f"{date_text} {rng.randrange(8, 18):02d}:{rng.randrange(60):02d}:00",
+            }
+            if charted:
+                tooth = rng.randrange(1, TOOTH_COUNT + 1)
+                picked = rng.sample(SURFACES, surface_count) if surface_count else SURFACES
+                treatment['tooth'] = tooth
+                treatment['surfaces'] = ''.join(s for s in SURFACES if s in picked)
+                chart = charts.get(patient_id)
+                if chart is None:
+                    chart = charts[patient_id] = ToothChart()
+                chart.apply_procedure(tooth, name, treatment['surfaces'])
+            yield format_id('treatments', number), treatment
+
+        if patients is not None:
+            for patient_id, chart in charts.items():
+                patients[patient_id] = dict(patients[patient_id], teeth=chart.encode())
+
+
+def generate(size, seed=0, today=None):
+    return SyntheticPractice(seed, today).generate(size)
+
+
+def populate(data_mgr, size, seed=0, today=None):
+    """Replace data_mgr's collections with generated ones; returns the record counts"""
+    collections = generate(size, seed, today)
+    for collection, records in collections.items():
+        data_mgr.save_data(data_mgr.file_for(collection), records)
+        if records:
+            data_mgr.reserve_id(collection, format_id(collection, len(records)))
+    return {collection: len(records) for collection, records in collections.items()}
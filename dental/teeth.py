@@ -0,0 +1,149 @@
+"""
+Tooth chart model
+Per-patient tooth and surface conditions kept in one fixed-size byte array
+"""
+
+TOOTH_COUNT = 32
+SURFACES = ('M', 'O', 'D', 'B', 'L')
+SURFACE_NAMES = {
+    'M': 'Mesial',
+    'O': 'Occlusal',
+    'D': 'Distal',
+    'B': 'Buccal',
+    'L': 'Lingual',
+}
+
+HEALTHY, CARIES, FILLED, CROWN, ROOT_CANAL, MISSING, IMPLANT, EXTRACTION_PLANNED = range(8)
+CONDITION_NAMES = (
+    'Healthy', 'Caries', 'Filled', 'Crown', 'Root canal', 'Missing', 'Implant', 'Extraction planned',
+)
+
+# Conditions that describe the whole tooth; setting one marks every surface.
+WHOLE_TOOTH = {CROWN, ROOT_CANAL, MISSING, IMPLANT, EXTRACTION_PLANNED}
+
+# When a tooth's surfaces differ, the later entry here is reported for the tooth.
+_PRIORITY = (HEALTHY, FILLED, CARIES, ROOT_CANAL, CROWN, IMPLANT, EXTRACTION_PLANNED, MISSING)
+_RANK = {condition: rank for rank, condition in enumerate(_PRIORITY)}
+
+# Procedure keywords and the condition the procedure leaves the tooth in,
+# checked in order so "implant crown" is recorded as an implant.
+PROCEDURE_CONDITIONS = (
+    ('extraction', MISSING),
+    ('implant', IMPLANT),
+    ('root canal', ROOT_CANAL),
+    ('crown', CROWN),
+    ('filling', FILLED),
+    ('restoration', FILLED),
+)
+
+_SIZE = TOOTH_COUNT * len(SURFACES)
+
+
+def parse_tooth(value):
+    """Parse and range-check a Universal tooth number"""
+    tooth = int(value)
+    if not 1 <= tooth <= TOOTH_COUNT:
+        raise ValueError(f"Tooth number must be between 1 and {TOOTH_COUNT}, got {tooth}")
+    return tooth
+
+
+def parse_surfaces(text):
+    """Turn e.g. 'MOD' into ('M', 'O', 'D'); an empty string means the whole tooth"""
+    surfaces = tuple(dict.fromkeys(str(text or '').upper().replace(' ', '')))
+    unknown = [surface for surface in surfaces if surface not in SURFACES]
+    if unknown:
+        raise ValueError(f"Unknown tooth surface: {''.join(unknown)}")
+    return surfaces or SURFACES
+
+
+def procedure_condition(procedure):
+    """Return the condition a procedure leaves a tooth in, or None if it is not recognised"""
+    text = str(procedure or '').lower()
+    for keyword, condition in PROCEDURE_CONDITIONS:
+        if keyword in text:
+            return condition
+    return None
+
+
+class ToothChart:
+    """Condition codes for 32 teeth x 5 surfaces in a 160-byte array
+
+    Teeth use Universal numbering (1-32). The chart is stored on the
+    patient record as a hex string under 'teeth', so it is loaded and
+    saved with the patient and costs a fixed 320 characters however much
+    has been charted.
+    """
+
+    def __init__(self, data=None):
+        self.data = bytearray(data) if data is not None else bytearray(_SIZE)
+        if len(self.data) != _SIZE:
+            raise ValueError(f"Tooth chart must be {_SIZE} bytes, got {len(self.data)}")
+
+    @classmethod
+    def decode(cls, text):
+        return cls(bytes.fromhex(text)) if text else cls()
+
+    @classmethod
+    def from_record(cls, patient):
+        try:
+            return cls.decode(patient.get('teeth'))
+        except ValueError:
+            return cls()
+
+    def encode(self):
+        return self.data.hex()
+
+    def __eq__(self, other):
+        return isinstance(other, ToothChart) and self.data == other.data
+
+    @staticmethod
+    def _offset(tooth):
+        return (parse_tooth(tooth) - 1) * len(SURFACES)
+
+    def surfaces(self, tooth):
+        """Condition codes for tooth in SURFACES order"""
+        offset = self._offset(tooth)
+        return tuple(self.data[offset:offset + len(SURFACES)])
+
+    def get(self, tooth, surface):
+        return self.data[self._offset(tooth) + SURFACES.index(surface)]
+
+    def set(self, tooth, condition, surfaces=SURFACES):
+        """Record condition on surfaces of tooth; whole-tooth conditions mark every surface"""
+        if not 0 <= condition < len(CONDITION_NAMES):
+            raise ValueError(f"Unknown condition code: {condition}")
+        offset = self._offset(tooth)
+        if condition in WHOLE_TOOTH:
+            surfaces = SURFACES
+        elif any(self.data[offset + i] in WHOLE_TOOTH for i in range(len(SURFACES))):
+            # Charting a surface on e.g. a crowned tooth replaces the crown.
+            self.data[offset:offset + len(SURFACES)] = bytes(len(SURFACES))
+        for surface in surfaces:
+            self.data[offset + SURFACES.index(surface)] = condition
+
+    def condition(self, tooth):
+        """The single most significant condition across the tooth's surfaces"""
+        return max(self.surfaces(tooth), key=_RANK.__getitem__)
+
+    def apply_procedure(self, tooth, procedure, surfaces=SURFACES):
+        """Update tooth for a recorded procedure; returns the new condition or None"""
+        condition = procedure_condition(procedure)
+        if condition is not None:
+            self.set(tooth, condition, surfaces)
+        return condition
+
+
+def load_chart(data_mgr, patient_id):
+    """Return (patient, ToothChart) or (None, None) if the patient does not exist"""
+    patient = data_mgr.get_patient(patient_id)
+    if not patient:
+        return None, None
+    return patient, ToothChart.from_record(patient)
+
+
+def save_chart(data_mgr, patient_id, chart):
+    """Write chart back onto the patient record"""
+    patient = data_mgr.get_patient(patient_id)
+    if not patient:
+        raise KeyError(patient_id)
+    data_mgr.put_patient(patient_id, dict(patient, teeth=chart.encode()))
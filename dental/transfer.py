@@ -0,0 +1,309 @@
+"""
+Bulk import and export
+Streams patients, appointments and treatments to and from CSV and JSONL files
+"""
+
+import csv
+import json
+import re
+from datetime import date, datetime
+from itertools import islice
+
+from dental.archive import ARCHIVED_COLLECTIONS, shared_archive
+from dental.ids import ID_PREFIXES, id_sort_key
+from dental.money import parse_cents
+from dental.schedule import (
+    APPOINTMENT_STATUSES, DEFAULT_CHAIR, DEFAULT_DURATION, AppointmentSchedule,
+    SchedulingConflict, parse_start
+)
+from dental.storage import REMOVED
+from dental.teeth import parse_surfaces, parse_tooth
+
+COLLECTIONS = tuple(ID_PREFIXES)
+FORMATS = ('csv', 'jsonl')
+DEFAULT_BATCH_SIZE = 5000
+
+# Columns written to CSV, in order; JSONL exports every field of a record.
+FIELDS = {
+    'patients': ('id', 'name', 'phone', 'email', 'dob', 'created_at'),
+    'appointments': ('id', 'patient_id', 'date', 'time', 'duration', 'chair', 'reason', 'status',
+                     'created_at'),
+    'treatments': ('id', 'patient_id', 'procedure', 'date', 'cost', 'notes', 'tooth', 'surfaces',
+                   'created_at'),
+}
+
+
+class InvalidRecord(ValueError):
+    """A row that cannot be imported"""
+
+
+def format_for(path, fmt=None):
+    """Pick the format from an explicit choice or the file extension"""
+    if fmt:
+        return fmt
+    return 'jsonl' if str(path).lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(f, fmt):
+    """Yield (line number, row dict) from an open CSV or JSONL file one row at a time"""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if key is not None}
+        return
+    for line_no, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as error:
+            yield line_no, InvalidRecord(f"invalid JSON: {error.msg}")
+            continue
+        yield line_no, row if isinstance(row, dict) else InvalidRecord('expected a JSON object')
+
+
+def write_rows(f, fmt, collection, records):
+    """Write (record_id, record) pairs to an open file; returns the number written"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, fieldnames=FIELDS[collection], extrasaction='ignore')
+        writer.writeheader()
+        for record_id, record in records:
+            writer.writerow(dict(record, id=record_id))
+            count += 1
+        return count
+    for record_id, record in records:
+        f.write(json.dumps(dict(record, id=record_id), ensure_ascii=False))
+        f.write('\n')
+        count += 1
+    return count
+
+
+def export_records(data_mgr, collection, f, fmt, include_archive=False):
+    """Write a collection in ID order, streaming it record by record where the backend can
+
+    With include_archive, archived appointments or treatments are written
+    too, in the same ID order; each is read from its segment as it is
+    written, so only the archive's index and cached segments are held.
+    """
+    filename = data_mgr.file_for(collection)
+    record_ids = list(data_mgr.record_ids(filename))
+    ordered = sorted(record_ids, key=id_sort_key)
+    if include_archive and collection in ARCHIVED_COLLECTIONS:
+        archive = shared_archive(data_mgr)
+        live = set(record_ids)
+        archived = {record_id for record_id in archive.record_ids(collection)
+                    if record_id not in live}
+        ordered = sorted(record_ids + list(archived), key=id_sort_key)
+        records = ((record_id, archive.get(collection, record_id) if record_id in archived
+                    else data_mgr.get_record(filename, record_id)) for record_id in ordered)
+    elif ordered == record_ids:
+        records = data_mgr.iter_records(filename)
+    else:
+        records = ((record_id, data_mgr.get_record(filename, record_id)) for record_id in ordered)
+    return write_rows(f, fmt, collection, records)
+
+
+def _text(row, field, required=False):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise InvalidRecord(f"missing {field}")
+    return value
+
+
+def _normalise_name(name):
+    return ' '.join(name.casefold().split())
+
+
+def _digits(phone):
+    return re.sub(r'\D', '', phone)
+
+
+class Importer:
+    """Validates, dedupes and writes rows for one collection in batches
+
+    Rows are consumed from an iterator, so only the current batch is held
+    besides the dedupe keys. Each batch is written with one
+    DataManager.put_records() call and its IDs are allocated with one
+    sequence update. A row is a duplicate when its ID is already in use
+    or when it matches an existing record on its natural key (name and
+    phone for patients; patient, date, time and chair for appointments;
+    patient, date, procedure and cost for treatments). Duplicates are
+    skipped, or replace the stored record when update is set and the row
+    carries its ID.
+    """
+
+    def __init__(self, data_mgr, collection, batch_size=DEFAULT_BATCH_SIZE, update=False,
+                 dry_run=False):
+        if collection not in COLLECTIONS:
+            raise ValueError(f"Unknown collection: {collection}")
+        self.data_mgr = data_mgr
+        self.collection = collection
+        self.filename = data_mgr.file_for(collection)
+        self.batch_size = batch_size
+        self.update = update
+        self.dry_run = dry_run
+        self.imported = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.errors = []
+
+        existing = data_mgr.load_data(self.filename)
+        self._ids = set(existing)
+        self._keys = {self._natural_key(record): record_id for record_id, record in existing.items()}
+        self._patient_ids = (set(data_mgr.load_data(data_mgr.patients_file))
+                             if collection != 'patients' else None)
+        self._schedule = AppointmentSchedule(data_mgr) if collection == 'appointments' else None
+        self._validate = getattr(self, f'_validate_{collection}')
+
+    def close(self):
+        """Release the schedule an appointments import checks against"""
+        if self._schedule is not None:
+            self._schedule.close()
+
+    def _natural_key(self, record):
+        if self.collection == 'patients':
+            return (_normalise_name(str(record.get('name', ''))), _digits(str(record.get('phone', ''))))
+        if self.collection == 'appointments':
+            return (record.get('patient_id'), record.get('date'), record.get('time'),
+                    str(record.get('chair') or DEFAULT_CHAIR))
+        return (record.get('patient_id'), record.get('date'),
+                str(record.get('procedure', '')).casefold(), parse_cents(record.get('cost')))
+
+    def _created_at(self, row):
+        return _text(row, 'created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _validate_patients(self, row):
+        dob = _text(row, 'dob')
+        if dob:
+            try:
+                date.fromisoformat(dob)
+            except ValueError:
+                raise InvalidRecord(f"dob must be YYYY-MM-DD, got {dob!r}")
+        return {
+            'name': _text(row, 'name', required=True),
+            'phone': _text(row, 'phone', required=True),
+            'email': _text(row, 'email'),
+            'dob': dob,
+            'created_at': self._created_at(row),
+        }
+
+    def _check_patient(self, row):
+        patient_id = _text(row, 'patient_id', required=True)
+        if patient_id not in self._patient_ids:
+            raise InvalidRecord(f"unknown patient {patient_id}")
+        return patient_id
+
+    def _validate_appointments(self, row):
+        patient_id = self._check_patient(row)
+        try:
+            start = parse_start(_text(row, 'date', required=True), _text(row, 'time', required=True))
+        except ValueError as error:
+            raise InvalidRecord(str(error))
+        try:
+            duration = int(_text(row, 'duration') or DEFAULT_DURATION)
+        except ValueError:
+            raise InvalidRecord(f"duration must be a number of minutes, got {row.get('duration')!r}")
+        status = _text(row, 'status').lower() or 'pending'
+        if status not in APPOINTMENT_STATUSES:
+            raise InvalidRecord(f"status must be one of {', '.join(APPOINTMENT_STATUSES)}")
+        return {
+            'patient_id': patient_id,
+            'date': start.strftime('%Y-%m-%d'),
+            'time': start.strftime('%H:%M'),
+            'duration': duration,
+            'chair': _text(row, 'chair') or DEFAULT_CHAIR,
+            'reason': _text(row, 'reason'),
+            'status': status,
+            'created_at': self._created_at(row),
+        }
+
+    def _validate_treatments(self, row):
+        patient_id = self._check_patient(row)
+        treatment_date = _text(row, 'date', required=True)
+        try:
+            date.fromisoformat(treatment_date)
+        except ValueError:
+            raise InvalidRecord(f"date must be YYYY-MM-DD, got {treatment_date!r}")
+        cost = _text(row, 'cost', required=True)
+        if parse_cents(cost) is None:
+            raise InvalidRecord(f"cost is not an amount: {cost!r}")
+        treatment = {
+            'patient_id': patient_id,
+            'procedure': _text(row, 'procedure', required=True),
+            'date': treatment_date,
+            'cost': cost,
+            'notes': _text(row, 'notes'),
+            'created_at': self._created_at(row),
+        }
+        tooth = _text(row, 'tooth')
+        if tooth:
+            try:
+                treatment['tooth'] = parse_tooth(tooth)
+                treatment['surfaces'] = ''.join(parse_surfaces(_text(row, 'surfaces')))
+            except ValueError as error:
+                raise InvalidRecord(str(error))
+        return treatment
+
+    def run(self, rows):
+        """Import (line number, row) pairs; returns self with the counters filled in"""
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return self
+            self._import_batch(batch)
+
+    def _import_batch(self, batch):
+        accepted = []
+        for line_no, row in batch:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                record = self._validate(row)
+                record_id = _text(row, 'id') or None
+                key = self._natural_key(record)
+                existing_id = record_id if record_id in self._ids else self._keys.get(key)
+                if existing_id is not None and not (self.update and record_id == existing_id):
+                    self.duplicates += 1
+                    continue
+                if self._schedule is not None:
+                    self._schedule.check(record, record_id)
+            except (InvalidRecord, SchedulingConflict) as error:
+                self.errors.append((line_no, str(error)))
+                continue
+            # Rows without an ID get a placeholder until the batch's IDs are
+            # allocated, so later rows still dedupe and conflict against them.
+            pending_id = record_id or f'~import-{line_no}'
+            accepted.append((record_id, pending_id, record, key, existing_id is not None))
+            self._keys[key] = pending_id
+            self._ids.add(pending_id)
+            if self._schedule is not None:
+                self._schedule.on_change(None, pending_id, record)
+
+        if accepted and not self.dry_run:
+            self._write(accepted)
+        for *_, replaced in accepted:
+            if replaced:
+                self.updated += 1
+            else:
+                self.imported += 1
+
+    def _write(self, accepted):
+        new_ids = iter(self.data_mgr.next_ids(
+            self.collection, sum(1 for record_id, *_ in accepted if record_id is None)))
+        records = {}
+        for record_id, pending_id, record, key, _ in accepted:
+            if record_id is None:
+                record_id = self._keys[key] = next(new_ids)
+                self._ids.discard(pending_id)
+                self._ids.add(record_id)
+                if self._schedule is not None:
+                    self._schedule.on_change(REMOVED, pending_id, None)
+            records[record_id] = record
+        # put_records() notifies the schedule of the final IDs
+        self.data_mgr.put_records(self.filename, records)
+        explicit = [record_id for record_id, *_ in accepted if record_id is not None]
+        if explicit:
+            self.data_mgr.reserve_id(self.collection, max(explicit, key=id_sort_key))
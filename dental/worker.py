@@ -0,0 +1,127 @@
+"""
+Background I/O worker
+Runs blocking data-layer calls off the UI thread and hands results back through a dispatcher
+"""
+
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _Task:
+    def __init__(self, fn, args, key):
+        self.fn = fn
+        self.args = args
+        self.key = key
+        self.callbacks = []
+        self.error_callbacks = []
+
+
+class IoWorker:
+    """Single background thread that executes submitted calls in order
+
+    Results are passed to callbacks through ``dispatch``, which the app
+    sets to schedule them on the Kivy main thread; without one, callbacks
+    run on the worker thread. A task submitted with a key replaces the
+    still-queued task with the same key, so repeated writes to one file
+    collapse into the most recent one while every caller is still called
+    back.
+    """
+
+    def __init__(self, dispatch=None, name='dental-io'):
+        self.dispatch = dispatch or (lambda fn: fn())
+        self.name = name
+        self._queue = deque()
+        self._pending = {}
+        self._busy = False
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, fn, *args, callback=None, error_callback=None, key=None):
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError(f"{self.name} worker is stopped")
+            task = self._pending.get(key) if key is not None else None
+            if task is not None:
+                task.fn, task.args = fn, args
+            else:
+                task = _Task(fn, args, key)
+                self._queue.append(task)
+                if key is not None:
+                    self._pending[key] = task
+            if callback is not None:
+                task.callbacks.append(callback)
+            if error_callback is not None:
+                task.error_callbacks.append(error_callback)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                task = self._queue.popleft()
+                if task.key is not None and self._pending.get(task.key) is task:
+                    del self._pending[task.key]
+                self._busy = True
+
+            try:
+                result = task.fn(*task.args)
+            except Exception as error:
+                if not task.error_callbacks:
+                    logger.exception('Background task %r failed', task.fn)
+                for error_callback in task.error_callbacks:
+                    self.dispatch(lambda cb=error_callback, e=error: cb(e))
+            else:
+                for callback in task.callbacks:
+                    self.dispatch(lambda cb=callback, r=result: cb(r))
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def is_idle(self):
+        with self._cond:
+            return not self._queue and not self._busy
+
+    def wait_idle(self, timeout=None):
+        """Block until every submitted task has run; returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    def stop(self, timeout=None):
+        """Finish the queued tasks and stop the thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+class AsyncDataManager:
+    """Non-blocking facade over a DataManager
+
+    call() returns immediately and reports back through callback. Screens
+    wrap each load or write in one function so it runs as a single task,
+    in order with every other data access. Saves that rewrite the same
+    record pass a key naming it, so a burst of them is coalesced into the
+    latest one.
+    """
+
+    def __init__(self, data_mgr, worker):
+        self.data_mgr = data_mgr
+        self.worker = worker
+
+    def call(self, fn, *args, callback=None, error_callback=None, key=None):
+        """Run fn(*args) on the worker, replacing a still-queued call with the same key"""
+        self.worker.submit(fn, *args, callback=callback, error_callback=error_callback, key=key)
@@ -3,8 +3,12 @@ Dental Mobile Application
 A comprehensive dental practice management application
 """
 
+import functools
 import os
+import time
+from operator import attrgetter
 os.environ['KIVY_NO_CONSOLELOG'] = '1'
+_imports_started = time.perf_counter()
 
 from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager, Screen
@@ -12,59 +16,674 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
-from kivy.uix.textinput import TextInput
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.popup import Popup
+from kivy.uix.widget import Widget
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.core.window import Window
-from kivy.graphics import Color, Rectangle
+from kivy.graphics import Color, Line, Rectangle
+from kivy.core.text import Label as CoreLabel
+from kivy.clock import Clock, mainthread
+from kivy.logger import Logger
+from kivy.event import EventDispatcher
+from kivy.properties import NumericProperty, StringProperty
 from datetime import datetime, timedelta
-import json
+
+from dental.analytics import TreatmentAnalytics
+from dental.archive import horizon as archive_horizon, shared_archive
+from dental.forms import APPOINTMENT_FORM, PATIENT_FORM, TREATMENT_FORM, Row
+from dental.ids import id_sort_key
+from dental.indexes import shared_indexes
+from dental.money import format_cents
+from dental.profiling import enable_from_env, profiler
+from dental.records import Appointment, Patient, Treatment
+from dental.schedule import (
+    APPOINTMENT_STATUSES, DEFAULT_CHAIR, DEFAULT_DURATION, WINDOW_SPANS, SchedulingConflict,
+    parse_start, shared_schedule, shift_window, window_bounds
+)
+from dental.search import PatientSearchIndex
+from dental.stats import PracticeStats
+from dental.teeth import (
+    CONDITION_NAMES, HEALTHY, SURFACE_NAMES, SURFACES, TOOTH_COUNT, ToothChart, load_chart,
+    parse_surfaces, parse_tooth, save_chart
+)
+from dental.storage import ARCHIVED, DataManager, REMOVED, get_default_backend
+from dental.worker import AsyncDataManager, IoWorker
 
 Window.clearcolor = (0.95, 0.95, 0.97, 1)
 
 
-class DataManager:
-    """Manages application data persistence"""
+# Chart colours by tooth condition code (see dental.teeth.CONDITION_NAMES)
+CONDITION_COLORS = (
+    (1, 1, 1, 1),           # healthy
+    (0.9, 0.25, 0.2, 1),    # caries
+    (0.3, 0.55, 0.9, 1),    # filled
+    (0.95, 0.75, 0.2, 1),   # crown
+    (0.6, 0.35, 0.75, 1),   # root canal
+    (0.55, 0.55, 0.55, 1),  # missing
+    (0.2, 0.7, 0.6, 1),     # implant
+    (0.95, 0.5, 0.15, 1),   # extraction planned
+)
+
+
+# Set DENTAL_PROFILE=1 to time data access, screen builds and frames; see
+# dental.profiling. F12 toggles the on-screen overlay.
+enable_from_env()
+
+
+class StartupTimer:
+    """Records how long each startup phase takes"""
     
-    def __init__(self):
-        self.data_dir = 'data'
-        self.patients_file = os.path.join(self.data_dir, 'patients.json')
-        self.appointments_file = os.path.join(self.data_dir, 'appointments.json')
-        self.treatments_file = os.path.join(self.data_dir, 'treatments.json')
-        self._ensure_data_dir()
-        
-    def _ensure_data_dir(self):
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
-            
-    def load_data(self, filename):
-        try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-            
-    def save_data(self, filename, data):
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
-            
-    def get_patients(self):
-        return self.load_data(self.patients_file)
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []
+        
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        if profiler.enabled:
+            profiler.record('startup', phase, now - self.last)
+        self.last = now
+        
+    def report(self):
+        total = self.last - self.started
+        for phase, seconds in self.phases:
+            Logger.info(f'Startup: {phase:<20} {seconds * 1000:8.1f} ms')
+        Logger.info(f'Startup: {"total":<20} {total * 1000:8.1f} ms')
+        return total
+
+
+startup_timer = StartupTimer(_imports_started)
+startup_timer.mark('imports')
+
+# All file access runs here so the UI thread never waits on disk; results
+# come back on the main thread through the Kivy clock.
+io_worker = IoWorker(dispatch=lambda fn: Clock.schedule_once(lambda dt: fn()))
+
+
+def count_widgets(widget):
+    return sum(1 for _ in widget.walk(restrict=True))
+
+
+def profiled_build(build_ui):
+    """Record how long a screen's build_ui takes and how many widgets it leaves"""
+    @functools.wraps(build_ui)
+    def wrapper(self, *args, **kwargs):
+        if not profiler.enabled:
+            return build_ui(self, *args, **kwargs)
+        started = time.perf_counter()
+        result = build_ui(self, *args, **kwargs)
+        profiler.record('build', self.name, time.perf_counter() - started,
+                        widgets=count_widgets(self))
+        return result
+    return wrapper
+
+
+def set_saving(popup, saving):
+    """Show a dialog's save button as busy while its write is in flight"""
+    button = popup.save_btn
+    if saving:
+        popup.save_text = button.text
+    button.text = 'Saving…' if saving else popup.save_text
+    button.disabled = saving
+
+
+def finish_saving(popup, record_id, missing=''):
+    """End a dialog's save: close it, or show missing if nothing was saved"""
+    if not popup.save_btn.disabled:
+        # The dialog was closed and reopened for another record meanwhile
+        return
+    if record_id is None:
+        set_saving(popup, False)
+        popup.error_label.text = missing
+    else:
+        popup.dismiss()
+
+
+def fail_saving(popup, what, error):
+    """End a dialog's save that raised: log the error and show it in the dialog"""
+    Logger.warning(f'{what.capitalize()}s: could not save {what}: {error!r}')
+    if not popup.save_btn.disabled:
+        return
+    set_saving(popup, False)
+    popup.error_label.text = f'Could not save the {what}: {error}'
+
+
+class PatientNames:
+    """Current patient names for list rows, looked up once per patient
+    
+    Rows hold only the patient ID and resolve the name when they are
+    shown, so a rename touches one entry here instead of every row.
+    """
+    
+    def __init__(self, data_mgr):
+        self.data_mgr = data_mgr
+        self.names = {}
+        
+    def load_all(self):
+        """Look up every patient's name in one pass (call from the I/O worker)"""
+        self.names.update(
+            (patient_id, patient['name'])
+            for patient_id, patient in self.data_mgr.iter_records(self.data_mgr.patients_file)
+        )
+        
+    def name_for(self, record):
+        name = self.names.get(record.patient_id)
+        if name is None:
+            patient = self.data_mgr.get_patient(record.patient_id) if record.patient_id else None
+            if patient is None:
+                return self.data_mgr.patient_name_for(record.to_dict())
+            name = self.names[record.patient_id] = patient['name']
+        return name
+        
+    def update(self, event, patient_id, patient):
+        """Apply a patients change; returns True if a known name changed"""
+        if event == REMOVED:
+            return self.names.pop(patient_id, None) is not None
+        if self.names.get(patient_id) == patient['name']:
+            return False
+        self.names[patient_id] = patient['name']
+        return True
+
+
+class RecordList(RecycleView):
+    """Virtualized record list that only creates widgets for visible rows
+    
+    Rows are dental.records typed records, sorted by sort_key. Rows are
+    also kept by ID, so a row is found by bisecting for its sort key
+    rather than by scanning the list. set_ranked_rows() shows rows in an
+    order of their own (search results) until the next set_rows().
+    """
+    
+    def __init__(self, owner, viewclass, row_height, sort_key, reverse=False, **kwargs):
+        super().__init__(**kwargs)
+        self.owner = owner
+        self.sort_key = sort_key
+        self.reverse = reverse
+        layout = RecycleBoxLayout(
+            orientation='vertical',
+            spacing=5,
+            size_hint_y=None,
+            default_size=(None, row_height),
+            default_size_hint=(1, None)
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self.viewclass = viewclass
+        self.rows = {}
+        self.ranked = False
+        
+    def set_rows(self, rows, presorted=False):
+        self.data = list(rows) if presorted else sorted(rows, key=self.sort_key, reverse=self.reverse)
+        self.rows = {row.id: row for row in self.data}
+        self.ranked = False
+        
+    def set_ranked_rows(self, rows):
+        """Show rows in the order given rather than by sort_key"""
+        self.data = list(rows)
+        self.rows = {row.id: row for row in self.data}
+        self.ranked = True
+        
+    def _index_of(self, record_id):
+        row = self.rows.get(record_id)
+        if row is None:
+            return None
+        data = self.data
+        if self.ranked:
+            return data.index(row)
+        # The first row with an equal sort key, then the one with this ID
+        index = self._bisect(self.sort_key(row), after_equal=False)
+        while data[index].id != record_id:
+            index += 1
+        return index
+        
+    def _bisect(self, key, after_equal=True):
+        """Where a row with key goes: after the rows with an equal key, or before them"""
+        data, sort_key, reverse = self.data, self.sort_key, self.reverse
+        lo, hi = 0, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = sort_key(data[mid])
+            if reverse:
+                before = mid_key >= key if after_equal else mid_key > key
+            else:
+                before = mid_key <= key if after_equal else mid_key < key
+            if before:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+        
+    def upsert_row(self, row):
+        """Insert or replace one row without rebuilding the list"""
+        index = self._index_of(row.id)
+        self.rows[row.id] = row
+        if index is not None:
+            if self.ranked or self.sort_key(self.data[index]) == self.sort_key(row):
+                self.data[index] = row
+                return
+            del self.data[index]
+        self.data.insert(len(self.data) if self.ranked else self._bisect(self.sort_key(row)), row)
+        
+    def remove_row(self, record_id):
+        index = self._index_of(record_id)
+        if index is not None:
+            del self.rows[record_id]
+            del self.data[index]
+
+
+class RecordRow(RecycleDataViewBehavior, BoxLayout):
+    """Base list row; RecycleView rebinds one instance to many records"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.record_id = None
+        self.owner = None
+        with self.canvas.before:
+            Color(1, 1, 1, 1)
+            self.rect = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self._update_rect, size=self._update_rect)
+        
+    def _update_rect(self, instance, value):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+        
+    def refresh_view_attrs(self, rv, index, data):
+        self.owner = rv.owner
+        self.record_id = data.id
+        self.bind_record(data)
+        
+    def bind_record(self, data):
+        raise NotImplementedError
+
+
+class PatientRow(RecordRow):
+    """Patient list row"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', padding=10, spacing=10, **kwargs)
+        info = BoxLayout(orientation='vertical', size_hint_x=0.7)
+        self.name_label = Label(font_size='18sp', bold=True, halign='left')
+        self.phone_label = Label(font_size='14sp', halign='left')
+        info.add_widget(self.name_label)
+        info.add_widget(self.phone_label)
+        
+        view_btn = Button(text='View', size_hint_x=0.3, background_color=(0.3, 0.6, 0.9, 1))
+        view_btn.bind(on_press=self._on_view)
+        
+        self.add_widget(info)
+        self.add_widget(view_btn)
+        
+    def bind_record(self, patient):
+        self.name_label.text = patient.name or ''
+        self.phone_label.text = f"Phone: {patient.phone or ''}"
+        
+    def _on_view(self, instance):
+        self.owner.view_patient(self.record_id)
+
+
+class AppointmentRow(RecordRow):
+    """Appointment list row"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', padding=10, spacing=10, **kwargs)
+        info = BoxLayout(orientation='vertical', size_hint_x=0.7)
+        self.name_label = Label(font_size='18sp', bold=True, halign='left')
+        self.date_label = Label(font_size='14sp', halign='left')
+        self.time_label = Label(font_size='14sp', halign='left')
+        info.add_widget(self.name_label)
+        info.add_widget(self.date_label)
+        info.add_widget(self.time_label)
+        
+        self.status_btn = Button(size_hint_x=0.3)
+        
+        self.add_widget(info)
+        self.add_widget(self.status_btn)
+        
+    def bind_record(self, apt):
+        self.name_label.text = self.owner.patient_names.name_for(apt)
+        self.date_label.text = f"Date: {apt.stored('date', '')}"
+        self.time_label.text = (f"Time: {apt.stored('time', '')} "
+                                f"({apt.stored('duration', DEFAULT_DURATION)} min, "
+                                f"chair {apt.stored('chair', DEFAULT_CHAIR)})")
+        status = apt.status or 'pending'
+        self.status_btn.text = status.capitalize()
+        self.status_btn.background_color = (
+            (0.3, 0.7, 0.3, 1) if status == 'confirmed' else (0.9, 0.6, 0.3, 1))
+
+
+class TreatmentRow(RecordRow):
+    """Treatment list row"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(orientation='vertical', padding=10, spacing=5, **kwargs)
+        self.title_label = Label(font_size='16sp', bold=True, halign='left', size_hint_y=0.4)
+        self.detail_label = Label(font_size='14sp', halign='left', size_hint_y=0.3)
+        self.notes_label = Label(font_size='12sp', halign='left', size_hint_y=0.3)
+        self.add_widget(self.title_label)
+        self.add_widget(self.detail_label)
+        self.add_widget(self.notes_label)
+        
+    def bind_record(self, treatment):
+        self.title_label.text = (f"{self.owner.patient_names.name_for(treatment)} - "
+                                 f"{treatment.stored('procedure')}")
+        cost = (f"${format_cents(treatment.cents)}" if treatment.cents is not None
+                else treatment.stored('cost', 'N/A'))
+        self.detail_label.text = f"Date: {treatment.stored('date', '')} | Cost: {cost}"
+        self.notes_label.text = f"Notes: {treatment.stored('notes', 'N/A')}"
+
+
+class FormDialog:
+    """Popup for a dental.forms.Form, built once and refilled each time it opens
+    
+    Inputs that fail validation are tinted and the first message is shown
+    below the form. A field is checked again when the user leaves it,
+    without rebuilding anything.
+    """
+    
+    VALID_COLOR = (1, 1, 1, 1)
+    INVALID_COLOR = (1, 0.85, 0.85, 1)
+    
+    def __init__(self, form):
+        from kivy.uix.popup import Popup
+        from kivy.uix.textinput import TextInput
+        
+        self.form = form
+        self.inputs = {}
+        self.on_submit = None
+        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
+        
+        for item in form.items:
+            content.add_widget(Label(text=f'{item.label}:', size_hint_y=None, height=30))
+            if isinstance(item, Row):
+                row = BoxLayout(size_hint_y=None, height=40, spacing=10)
+                for field in item.fields:
+                    row.add_widget(self._add_input(field, TextInput()))
+                content.add_widget(row)
+            else:
+                content.add_widget(self._add_input(
+                    item, TextInput(size_hint_y=None, height=60 if item.multiline else 40)))
+        
+        self.error_label = Label(text='', color=(0.8, 0.2, 0.2, 1), size_hint_y=None, height=30)
+        content.add_widget(self.error_label)
+        
+        buttons = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        self.save_btn = Button(text=form.submit, background_color=(0.3, 0.7, 0.3, 1))
+        self.save_btn.bind(on_press=lambda x: self.submit())
+        buttons.add_widget(self.save_btn)
+        cancel_btn = Button(text='Cancel', background_color=(0.7, 0.3, 0.3, 1))
+        buttons.add_widget(cancel_btn)
+        content.add_widget(buttons)
         
-    def save_patients(self, patients):
-        self.save_data(self.patients_file, patients)
+        self.popup = Popup(title=form.title, content=content,
+                           size_hint=(0.9, min(0.9, 0.3 + 0.1 * len(form.items))))
+        cancel_btn.bind(on_press=self.popup.dismiss)
+        
+    def _add_input(self, field, text_input):
+        text_input.multiline = field.multiline
+        text_input.hint_text = field.hint
+        if field.input_filter:
+            text_input.input_filter = field.input_filter
+        text_input.bind(focus=lambda instance, focused: focused or self.check(field))
+        self.inputs[field.name] = text_input
+        return text_input
+        
+    def check(self, field):
+        """Validate one field as the user leaves it"""
+        try:
+            field.clean(self.inputs[field.name].text)
+        except ValueError as error:
+            self.inputs[field.name].background_color = self.INVALID_COLOR
+            self.error_label.text = str(error)
+            return False
+        self.inputs[field.name].background_color = self.VALID_COLOR
+        self.error_label.text = ''
+        return True
+        
+    def open(self, on_submit, values=None):
+        """Show the form with values (or empty fields) and call on_submit(values, dialog) on save"""
+        values = values or {}
+        for name, text_input in self.inputs.items():
+            text_input.text = str(values.get(name, ''))
+            text_input.background_color = self.VALID_COLOR
+        self.error_label.text = ''
+        if self.save_btn.disabled:
+            set_saving(self, False)
+        self.on_submit = on_submit
+        self.popup.open()
+        
+    def submit(self):
+        values, errors = self.form.validate(
+            {name: text_input.text for name, text_input in self.inputs.items()})
+        for name, text_input in self.inputs.items():
+            text_input.background_color = self.INVALID_COLOR if name in errors else self.VALID_COLOR
+        if errors:
+            self.error_label.text = next(iter(errors.values()))
+            return
+        self.error_label.text = ''
+        self.on_submit(values, self)
         
-    def get_appointments(self):
-        return self.load_data(self.appointments_file)
+    def dismiss(self, *args):
+        self.popup.dismiss()
+
+
+class PatientDetailsDialog:
+    """Patient details and history, refilled for each patient"""
+    
+    def __init__(self):
+        from kivy.uix.popup import Popup
+        from kivy.uix.scrollview import ScrollView
         
-    def save_appointments(self, appointments):
-        self.save_data(self.appointments_file, appointments)
+        self.patient_id = None
+        self.on_chart = None
+        content = BoxLayout(orientation='vertical', spacing=10, padding=20)
+        self.id_label = Label(font_size='16sp')
+        self.name_label = Label(font_size='18sp', bold=True)
+        self.phone_label = Label(font_size='16sp')
+        self.email_label = Label(font_size='16sp')
+        self.dob_label = Label(font_size='16sp')
+        for label in (self.id_label, self.name_label, self.phone_label,
+                      self.email_label, self.dob_label):
+            content.add_widget(label)
+        
+        content.add_widget(Label(text='History', font_size='18sp', bold=True))
+        self.history = Label(font_size='14sp', size_hint_y=None, halign='left', valign='top')
+        self.history.bind(width=lambda i, w: setattr(i, 'text_size', (w, None)),
+                          texture_size=lambda i, size: setattr(i, 'height', size[1]))
+        scroll = ScrollView(size_hint_y=2)
+        scroll.add_widget(self.history)
+        content.add_widget(scroll)
         
-    def get_treatments(self):
-        return self.load_data(self.treatments_file)
+        buttons = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        chart_btn = Button(text='Dental Chart', background_color=(0.3, 0.6, 0.9, 1))
+        close_btn = Button(text='Close')
+        buttons.add_widget(chart_btn)
+        buttons.add_widget(close_btn)
+        content.add_widget(buttons)
         
-    def save_treatments(self, treatments):
-        self.save_data(self.treatments_file, treatments)
+        self.popup = Popup(title='Patient Details', content=content, size_hint=(0.9, 0.85))
+        chart_btn.bind(on_press=lambda x: (self.popup.dismiss(), self.on_chart(self.patient_id)))
+        close_btn.bind(on_press=self.popup.dismiss)
+        
+    def open(self, patient_id, patient, history_text, on_chart):
+        self.patient_id = patient_id
+        self.on_chart = on_chart
+        self.id_label.text = f"ID: {patient_id}"
+        self.name_label.text = f"Name: {patient['name']}"
+        self.phone_label.text = f"Phone: {patient['phone']}"
+        self.email_label.text = f"Email: {patient.get('email', 'N/A')}"
+        self.dob_label.text = f"DOB: {patient.get('dob', 'N/A')}"
+        self.history.text = history_text
+        self.popup.open()
+
+
+class ToothDialog:
+    """Tooth condition, history and charting buttons, refilled for each tooth
+    
+    Without a patient only the tooth number and a hint are shown; the other
+    widgets stay built and are put back the next time.
+    """
+    
+    def __init__(self):
+        from kivy.uix.popup import Popup
+        from kivy.uix.togglebutton import ToggleButton
+        
+        self.tooth_number = None
+        self.on_condition = None
+        self.on_close = None
+        self.content = BoxLayout(orientation='vertical', spacing=10, padding=20)
+        self.title_label = Label(font_size='20sp', bold=True)
+        self.hint_label = Label(text='Load a patient to chart this tooth', font_size='16sp')
+        self.condition_label = Label(font_size='16sp')
+        self.surfaces_label = Label(font_size='14sp')
+        self.history_label = Label(font_size='16sp')
+        
+        self.surface_row = BoxLayout(size_hint_y=None, height=40, spacing=5)
+        self.surface_buttons = {}
+        for name in SURFACES:
+            button = ToggleButton(text=name)
+            self.surface_buttons[name] = button
+            self.surface_row.add_widget(button)
+        
+        self.condition_grid = GridLayout(cols=4, size_hint_y=None, height=90, spacing=5)
+        for code, name in enumerate(CONDITION_NAMES):
+            button = Button(text=name, font_size='13sp')
+            button.bind(on_press=lambda x, c=code: self._choose(c))
+            self.condition_grid.add_widget(button)
+        
+        self.close_btn = Button(text='Close', size_hint_y=None, height=50)
+        self.popup = Popup(content=self.content, size_hint=(0.8, 0.7))
+        self.close_btn.bind(on_press=self.popup.dismiss)
+        self.popup.bind(on_dismiss=lambda x: self.on_close and self.on_close())
+        
+    def open(self, tooth_number, surface, chart, history, on_condition, on_close):
+        """Show tooth_number of chart (None when no patient is loaded)"""
+        self.tooth_number = tooth_number
+        self.on_condition = on_condition
+        self.on_close = on_close
+        self.popup.title = f'Tooth #{tooth_number} Details'
+        self.title_label.text = f'Tooth #{tooth_number}'
+        self.content.clear_widgets()
+        self.content.add_widget(self.title_label)
+        if chart is None:
+            self.content.add_widget(self.hint_label)
+        else:
+            conditions = chart.surfaces(tooth_number)
+            self.condition_label.text = f'Condition: {CONDITION_NAMES[chart.condition(tooth_number)]}'
+            self.surfaces_label.text = ', '.join(
+                f'{SURFACE_NAMES[s]}: {CONDITION_NAMES[c]}'
+                for s, c in zip(SURFACES, conditions) if c != HEALTHY) or 'All surfaces healthy'
+            self.history_label.text = (f"Last treatment: {history[0].get('date', '')} - "
+                                       f"{history[0]['procedure']}" if history
+                                       else 'Last treatment: N/A')
+            for name, button in self.surface_buttons.items():
+                button.state = 'down' if name == surface else 'normal'
+            for widget in (self.condition_label, self.surfaces_label, self.history_label,
+                           self.surface_row, self.condition_grid):
+                self.content.add_widget(widget)
+        self.content.add_widget(self.close_btn)
+        self.popup.open()
+        
+    def _choose(self, condition):
+        surfaces = tuple(s for s, b in self.surface_buttons.items() if b.state == 'down') or SURFACES
+        self.on_condition(self.tooth_number, condition, surfaces, self.popup)
+
+
+class DialogPool:
+    """Builds each kind of dialog once and hands the same instance out again
+    
+    Dialogs are registered by key with a factory. acquire() returns an idle
+    dialog of that kind, building another only while every one built is
+    open; a dialog returns to the pool when it is dismissed. prewarm()
+    builds one of each kind not built yet, a kind per frame, after startup.
+    """
+    
+    def __init__(self):
+        self._factories = {}
+        self._idle = {}
+        self._built_kinds = set()
+        self.built = 0
+        self.reused = 0
+        
+    def register(self, key, factory):
+        self._factories[key] = factory
+        self._idle[key] = []
+        
+    def _build(self, key):
+        started = time.perf_counter()
+        dialog = self._factories[key]()
+        dialog.popup.bind(on_dismiss=lambda popup: self._idle[key].append(dialog))
+        self._built_kinds.add(key)
+        self.built += 1
+        if profiler.enabled:
+            profiler.record('dialog', key, time.perf_counter() - started,
+                            widgets=count_widgets(dialog.popup))
+        return dialog
+        
+    def acquire(self, key):
+        idle = self._idle[key]
+        if idle:
+            self.reused += 1
+            return idle.pop()
+        return self._build(key)
+        
+    def prewarm(self, *args):
+        for key in self._factories:
+            if key not in self._built_kinds:
+                self._idle[key].append(self._build(key))
+                Clock.schedule_once(self.prewarm, 0)
+                return
+
+
+dialog_pool = DialogPool()
+dialog_pool.register('patient_form', lambda: FormDialog(PATIENT_FORM))
+dialog_pool.register('appointment_form', lambda: FormDialog(APPOINTMENT_FORM))
+dialog_pool.register('treatment_form', lambda: FormDialog(TREATMENT_FORM))
+dialog_pool.register('patient_details', PatientDetailsDialog)
+dialog_pool.register('tooth', ToothDialog)
+
+
+class DashboardStats(EventDispatcher):
+    """Kivy-facing view of PracticeStats for the dashboard cards"""
+    
+    total_patients = NumericProperty(0)
+    today_appointments = NumericProperty(0)
+    today_revenue = StringProperty('0.00')
+    appointment_statuses = StringProperty('0 / 0 / 0')
+    
+    def __init__(self, data_mgr, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = None
+        # Changes arrive on the I/O thread; coalesce them into one refresh
+        # on the next frame.
+        self._refresh_trigger = Clock.create_trigger(self.refresh)
+        io_worker.submit(PracticeStats, data_mgr, callback=self._on_stats_ready)
+        self._schedule_rollover()
+        
+    def _on_stats_ready(self, stats):
+        self.stats = stats
+        stats.add_listener(self._refresh_trigger)
+        self.refresh()
+        
+    def refresh(self, *args):
+        if self.stats is None:
+            return
+        today = datetime.now().strftime('%Y-%m-%d')
+        self.total_patients = self.stats.patients_total
+        self.today_appointments = self.stats.appointments_on(today)
+        self.today_revenue = format_cents(self.stats.revenue_on(today))
+        self.appointment_statuses = ' / '.join(
+            str(self.stats.appointments_with_status(status)) for status in APPOINTMENT_STATUSES)
+        
+    def _schedule_rollover(self):
+        now = datetime.now()
+        midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+        Clock.schedule_once(self._on_midnight, (midnight - now).total_seconds() + 1)
+        
+    def _on_midnight(self, dt):
+        self.refresh()
+        self._schedule_rollover()
 
 
 class HomeScreen(Screen):
@@ -85,17 +704,16 @@ class HomeScreen(Screen):
         )
         layout.add_widget(title)
         
-        stats_layout = GridLayout(cols=2, spacing=10, size_hint_y=0.2)
+        stats_layout = GridLayout(cols=4, spacing=10, size_hint_y=0.2)
         
-        data_mgr = DataManager()
-        patients = data_mgr.get_patients()
-        appointments = data_mgr.get_appointments()
-        
-        today = datetime.now().strftime('%Y-%m-%d')
-        today_appointments = sum(1 for apt in appointments.values() if apt.get('date') == today)
+        self.dashboard = DashboardStats(DataManager())
         
-        stats_layout.add_widget(self._create_stat_card('Total Patients', str(len(patients))))
-        stats_layout.add_widget(self._create_stat_card('Today\'s Appointments', str(today_appointments)))
+        stats_layout.add_widget(self._create_stat_card('Total Patients', 'total_patients'))
+        stats_layout.add_widget(self._create_stat_card('Today\'s Appointments', 'today_appointments'))
+        stats_layout.add_widget(self._create_stat_card('Today\'s Revenue', 'today_revenue'))
+        stats_layout.add_widget(self._create_stat_card(
+            ' / '.join(status.capitalize() for status in APPOINTMENT_STATUSES),
+            'appointment_statuses'))
         
         layout.add_widget(stats_layout)
         
@@ -106,6 +724,7 @@ class HomeScreen(Screen):
             ('Appointments', 'appointments', (0.4, 0.7, 0.5, 1)),
             ('Dental Chart', 'dental_chart', (0.9, 0.5, 0.3, 1)),
             ('Treatments', 'treatments', (0.7, 0.4, 0.8, 1)),
+            ('Reports', 'reports', (0.3, 0.5, 0.6, 1)),
         ]
         
         for text, screen_name, color in buttons:
@@ -122,14 +741,17 @@ class HomeScreen(Screen):
         layout.add_widget(menu_grid)
         self.add_widget(layout)
         
-    def _create_stat_card(self, title, value):
+    def _create_stat_card(self, title, stat):
         card = BoxLayout(orientation='vertical', padding=10)
         with card.canvas.before:
             Color(1, 1, 1, 1)
             card.rect = Rectangle(pos=card.pos, size=card.size)
         card.bind(pos=self._update_rect, size=self._update_rect)
         
-        card.add_widget(Label(text=value, font_size='32sp', bold=True, color=(0.2, 0.4, 0.7, 1)))
+        value = Label(text=str(getattr(self.dashboard, stat)), font_size='32sp', bold=True,
+                      color=(0.2, 0.4, 0.7, 1))
+        self.dashboard.bind(**{stat: lambda instance, v: setattr(value, 'text', str(v))})
+        card.add_widget(value)
         card.add_widget(Label(text=title, font_size='14sp', color=(0.5, 0.5, 0.5, 1)))
         return card
         
@@ -148,9 +770,32 @@ class PatientsScreen(Screen):
         super().__init__(**kwargs)
         self.name = 'patients'
         self.data_mgr = DataManager()
+        self.data_io = AsyncDataManager(self.data_mgr, io_worker)
+        self.rows = {}
+        self.search_index = None
+        self._search_trigger = Clock.create_trigger(self.run_search, 0.15)
         self.build_ui()
-        
+        self.data_mgr.subscribe(self.data_mgr.patients_file, self.on_patients_changed)
+        io_worker.submit(PatientSearchIndex, self.data_mgr, callback=self._on_search_index_ready)
+        
+    @mainthread
+    def on_patients_changed(self, event, record_id, record):
+        if event == REMOVED:
+            self.rows.pop(record_id, None)
+        else:
+            self.rows[record_id] = Patient.from_dict(record_id, record)
+            
+        if self.search_query():
+            self._search_trigger()
+        elif event == REMOVED:
+            self.patient_list.remove_row(record_id)
+        else:
+            self.patient_list.upsert_row(self.rows[record_id])
+        
+    @profiled_build
     def build_ui(self):
+        from kivy.uix.textinput import TextInput
+        
         self.clear_widgets()
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
@@ -168,111 +813,93 @@ class PatientsScreen(Screen):
         
         layout.add_widget(header)
         
-        scroll = ScrollView(size_hint=(1, 0.9))
-        self.patient_list = BoxLayout(orientation='vertical', spacing=5, size_hint_y=None)
-        self.patient_list.bind(minimum_height=self.patient_list.setter('height'))
+        self.search_input = TextInput(
+            multiline=False,
+            size_hint_y=0.08,
+            hint_text='Search by name, phone or email'
+        )
+        self.search_input.bind(text=lambda instance, text: self._search_trigger())
+        layout.add_widget(self.search_input)
         
-        patients = self.data_mgr.get_patients()
-        for patient_id, patient in patients.items():
-            self.add_patient_item(patient_id, patient)
-            
-        scroll.add_widget(self.patient_list)
-        layout.add_widget(scroll)
+        self.patient_list = RecordList(
+            self, PatientRow, 80,
+            sort_key=lambda patient: id_sort_key(patient.id),
+            size_hint=(1, 0.82)
+        )
+        layout.add_widget(self.patient_list)
         
         self.add_widget(layout)
+        self.data_io.call(self.data_mgr.load_records, 'patients', callback=self._on_patients_loaded)
         
-    def add_patient_item(self, patient_id, patient):
-        item = BoxLayout(orientation='horizontal', size_hint_y=None, height=80, padding=10, spacing=10)
-        
-        with item.canvas.before:
-            Color(1, 1, 1, 1)
-            item.rect = Rectangle(pos=item.pos, size=item.size)
-        item.bind(pos=lambda i, v: setattr(i.rect, 'pos', v), 
-                 size=lambda i, v: setattr(i.rect, 'size', v))
-        
-        info = BoxLayout(orientation='vertical', size_hint_x=0.7)
-        info.add_widget(Label(text=patient['name'], font_size='18sp', bold=True, halign='left'))
-        info.add_widget(Label(text=f"Phone: {patient['phone']}", font_size='14sp', halign='left'))
+    def _on_patients_loaded(self, patients):
+        self.rows = {patient.id: patient for patient in patients}
+        self.run_search()
         
-        view_btn = Button(text='View', size_hint_x=0.3, background_color=(0.3, 0.6, 0.9, 1))
-        view_btn.bind(on_press=lambda x, pid=patient_id: self.view_patient(pid))
-        
-        item.add_widget(info)
-        item.add_widget(view_btn)
-        self.patient_list.add_widget(item)
+    def _on_search_index_ready(self, index):
+        self.search_index = index
+        if self.search_query():
+            self.run_search()
+            
+    def search_query(self):
+        return self.search_input.text.strip()
+        
+    def run_search(self, *args):
+        """Show the patients matching the search box, best match first"""
+        query = self.search_query()
+        if not query:
+            self.patient_list.set_rows(self.rows.values())
+        elif self.search_index is not None:
+            self.patient_list.set_ranked_rows(
+                self.rows[patient_id]
+                for patient_id in self.search_index.search(query)
+                if patient_id in self.rows
+            )
         
     def show_add_patient_dialog(self):
-        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
-        
-        content.add_widget(Label(text='Patient Name:', size_hint_y=None, height=30))
-        name_input = TextInput(multiline=False, size_hint_y=None, height=40)
-        content.add_widget(name_input)
-        
-        content.add_widget(Label(text='Phone:', size_hint_y=None, height=30))
-        phone_input = TextInput(multiline=False, size_hint_y=None, height=40)
-        content.add_widget(phone_input)
-        
-        content.add_widget(Label(text='Email:', size_hint_y=None, height=30))
-        email_input = TextInput(multiline=False, size_hint_y=None, height=40)
-        content.add_widget(email_input)
-        
-        content.add_widget(Label(text='Date of Birth:', size_hint_y=None, height=30))
-        dob_input = TextInput(multiline=False, size_hint_y=None, height=40, hint_text='YYYY-MM-DD')
-        content.add_widget(dob_input)
-        
-        buttons = BoxLayout(size_hint_y=None, height=50, spacing=10)
-        
-        popup = Popup(title='Add New Patient', content=content, size_hint=(0.9, 0.7))
+        dialog_pool.acquire('patient_form').open(self.save_patient)
         
-        save_btn = Button(text='Save', background_color=(0.3, 0.7, 0.3, 1))
-        save_btn.bind(on_press=lambda x: self.save_patient(
-            name_input.text, phone_input.text, email_input.text, dob_input.text, popup))
-        buttons.add_widget(save_btn)
+    def save_patient(self, values, popup):
+        patient = dict(values, created_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        set_saving(popup, True)
+        self.data_io.call(self._create_patient, patient,
+                          callback=lambda patient_id: finish_saving(popup, patient_id),
+                          error_callback=lambda error: fail_saving(popup, 'patient', error))
         
-        cancel_btn = Button(text='Cancel', background_color=(0.7, 0.3, 0.3, 1))
-        cancel_btn.bind(on_press=popup.dismiss)
-        buttons.add_widget(cancel_btn)
-        
-        content.add_widget(buttons)
-        popup.open()
-        
-    def save_patient(self, name, phone, email, dob, popup):
-        if not name or not phone:
-            return
-            
-        patients = self.data_mgr.get_patients()
-        patient_id = f"P{len(patients) + 1:04d}"
-        
-        patients[patient_id] = {
-            'name': name,
-            'phone': phone,
-            'email': email,
-            'dob': dob,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        self.data_mgr.save_patients(patients)
-        popup.dismiss()
-        self.build_ui()
+    def _create_patient(self, patient):
+        patient_id = self.data_mgr.next_patient_id()
+        self.data_mgr.put_patient(patient_id, patient)
+        return patient_id
         
     def view_patient(self, patient_id):
-        patients = self.data_mgr.get_patients()
-        patient = patients.get(patient_id)
+        self.data_io.call(self._load_patient_details, patient_id,
+                          callback=lambda details: self._show_patient(patient_id, *details))
         
+    def _load_patient_details(self, patient_id):
+        patient = self.data_mgr.get_patient(patient_id)
+        if not patient:
+            return None, {}, {}
+        appointments, treatments = shared_indexes(self.data_mgr).patient_history(patient_id)
+        return patient, appointments, treatments
+        
+    def _show_patient(self, patient_id, patient, appointments, treatments):
         if patient:
-            content = BoxLayout(orientation='vertical', spacing=10, padding=20)
-            content.add_widget(Label(text=f"ID: {patient_id}", font_size='16sp'))
-            content.add_widget(Label(text=f"Name: {patient['name']}", font_size='18sp', bold=True))
-            content.add_widget(Label(text=f"Phone: {patient['phone']}", font_size='16sp'))
-            content.add_widget(Label(text=f"Email: {patient.get('email', 'N/A')}", font_size='16sp'))
-            content.add_widget(Label(text=f"DOB: {patient.get('dob', 'N/A')}", font_size='16sp'))
+            dialog_pool.acquire('patient_details').open(
+                patient_id, patient, self._history_text(appointments, treatments), self.open_chart)
             
-            close_btn = Button(text='Close', size_hint_y=None, height=50)
-            popup = Popup(title='Patient Details', content=content, size_hint=(0.8, 0.6))
-            close_btn.bind(on_press=popup.dismiss)
-            content.add_widget(close_btn)
-            popup.open()
+    def open_chart(self, patient_id):
+        self.manager.current = 'dental_chart'
+        self.manager.get_screen('dental_chart').show_patient(patient_id)
             
+    def _history_text(self, appointments, treatments):
+        lines = []
+        for apt in sorted(appointments.values(), key=lambda a: (a.get('date', ''), a.get('time', ''))):
+            lines.append(f"Appointment {apt.get('date', '')} {apt.get('time', '')} - "
+                         f"{apt.get('reason') or 'No reason given'} ({apt.get('status', 'pending')})")
+        for treatment in sorted(treatments.values(), key=lambda t: t.get('date', '')):
+            lines.append(f"Treatment {treatment.get('date', '')} - "
+                         f"{treatment['procedure']} (${treatment['cost']})")
+        return '\n'.join(lines) or 'No appointments or treatments yet'
+        
     def go_back(self):
         self.manager.current = 'home'
 
@@ -280,12 +907,50 @@ class PatientsScreen(Screen):
 class AppointmentsScreen(Screen):
     """Appointment scheduling screen"""
     
+    # Appointments are shown one day, week or month at a time; set
+    # DENTAL_APPOINTMENT_WINDOW to choose the window the screen opens with.
+    window_span = os.environ.get('DENTAL_APPOINTMENT_WINDOW', 'week')
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.name = 'appointments'
         self.data_mgr = DataManager()
+        self.data_io = AsyncDataManager(self.data_mgr, io_worker)
+        self.patient_names = PatientNames(self.data_mgr)
+        if self.window_span not in WINDOW_SPANS:
+            self.window_span = 'week'
+        self.window_start = window_bounds(datetime.now().date(), self.window_span)[0]
+        self._window_rows = {}
         self.build_ui()
+        self.data_mgr.subscribe(self.data_mgr.appointments_file, self.on_appointments_changed)
+        self.data_mgr.subscribe(self.data_mgr.patients_file, self.on_patients_changed)
+        
+    @mainthread
+    def on_appointments_changed(self, event, record_id, record):
+        # Prefetched windows may now be stale; they are reloaded on demand.
+        self._window_rows.clear()
+        if event == ARCHIVED:
+            # Still shown: old windows read the archive as well
+            return
+        apt = None if event == REMOVED else Appointment.from_dict(record_id, record)
+        if apt is None or not self._in_window(apt):
+            self.appointment_list.remove_row(record_id)
+        else:
+            self.appointment_list.upsert_row(apt)
+            
+    def _in_window(self, apt):
+        if apt.start is None:
+            return False
+        start, end = window_bounds(self.window_start, self.window_span)
+        return start <= apt.date < end
+            
+    @mainthread
+    def on_patients_changed(self, event, patient_id, patient):
+        """Show a renamed patient's new name on the visible rows"""
+        if self.patient_names.update(event, patient_id, patient):
+            self.appointment_list.refresh_from_data()
         
+    @profiled_build
     def build_ui(self):
         self.clear_widgets()
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
@@ -304,122 +969,324 @@ class AppointmentsScreen(Screen):
         
         layout.add_widget(header)
         
-        scroll = ScrollView(size_hint=(1, 0.9))
-        self.appointment_list = BoxLayout(orientation='vertical', spacing=5, size_hint_y=None)
-        self.appointment_list.bind(minimum_height=self.appointment_list.setter('height'))
+        pager = BoxLayout(size_hint_y=0.08, spacing=10)
+        prev_btn = Button(text='<', size_hint_x=0.15)
+        prev_btn.bind(on_press=lambda x: self.page(-1))
+        pager.add_widget(prev_btn)
         
-        appointments = self.data_mgr.get_appointments()
-        sorted_appointments = sorted(appointments.items(), 
-                                     key=lambda x: (x[1].get('date', ''), x[1].get('time', '')))
+        self.window_btn = Button(size_hint_x=0.45, background_color=(0.6, 0.6, 0.7, 1))
+        self.window_btn.bind(on_press=lambda x: self.show_today())
+        pager.add_widget(self.window_btn)
         
-        for apt_id, apt in sorted_appointments:
-            self.add_appointment_item(apt_id, apt)
-            
-        scroll.add_widget(self.appointment_list)
-        layout.add_widget(scroll)
+        next_btn = Button(text='>', size_hint_x=0.15)
+        next_btn.bind(on_press=lambda x: self.page(1))
+        pager.add_widget(next_btn)
         
-        self.add_widget(layout)
+        self.span_btn = Button(size_hint_x=0.25, background_color=(0.3, 0.6, 0.9, 1))
+        self.span_btn.bind(on_press=lambda x: self.cycle_span())
+        pager.add_widget(self.span_btn)
         
-    def add_appointment_item(self, apt_id, apt):
-        item = BoxLayout(orientation='horizontal', size_hint_y=None, height=90, padding=10, spacing=10)
-        
-        with item.canvas.before:
-            Color(1, 1, 1, 1)
-            item.rect = Rectangle(pos=item.pos, size=item.size)
-        item.bind(pos=lambda i, v: setattr(i.rect, 'pos', v),
-                 size=lambda i, v: setattr(i.rect, 'size', v))
+        layout.add_widget(pager)
         
-        info = BoxLayout(orientation='vertical', size_hint_x=0.7)
-        info.add_widget(Label(text=f"{apt['patient_name']}", font_size='18sp', bold=True, halign='left'))
-        info.add_widget(Label(text=f"Date: {apt['date']}", font_size='14sp', halign='left'))
-        info.add_widget(Label(text=f"Time: {apt['time']}", font_size='14sp', halign='left'))
-        
-        status_color = (0.3, 0.7, 0.3, 1) if apt.get('status') == 'confirmed' else (0.9, 0.6, 0.3, 1)
-        status_btn = Button(
-            text=apt.get('status', 'pending').capitalize(),
-            size_hint_x=0.3,
-            background_color=status_color
+        self.appointment_list = RecordList(
+            self, AppointmentRow, 90,
+            sort_key=attrgetter('sort_key'),
+            size_hint=(1, 0.82)
         )
+        layout.add_widget(self.appointment_list)
         
-        item.add_widget(info)
-        item.add_widget(status_btn)
-        self.appointment_list.add_widget(item)
+        self.add_widget(layout)
+        self.show_window(self.window_start)
+        
+    def _window_title(self):
+        start, end = window_bounds(self.window_start, self.window_span)
+        if self.window_span == 'day':
+            return start.strftime('%a %d %b %Y')
+        if self.window_span == 'month':
+            return start.strftime('%B %Y')
+        return f"{start:%d %b} - {end - timedelta(days=1):%d %b %Y}"
+        
+    def show_window(self, start):
+        """Show the window starting at start, from the prefetch cache when possible"""
+        self.window_start = start
+        self.window_btn.text = self._window_title()
+        self.span_btn.text = self.window_span.title()
+        key = (self.window_span, start)
+        if key in self._window_rows:
+            self.appointment_list.set_rows(self._window_rows[key], presorted=True)
+        else:
+            self.appointment_list.set_rows([])
+            self._fetch_window(self.window_span, start)
+        self._prefetch_neighbours()
+        
+    def page(self, steps):
+        self.show_window(shift_window(self.window_start, self.window_span, steps))
+        
+    def show_today(self):
+        self.show_window(window_bounds(datetime.now().date(), self.window_span)[0])
+        
+    def cycle_span(self):
+        spans = list(WINDOW_SPANS)
+        self.window_span = spans[(spans.index(self.window_span) + 1) % len(spans)]
+        self.show_window(window_bounds(self.window_start, self.window_span)[0])
+        
+    def _prefetch_neighbours(self):
+        keep = {(self.window_span, self.window_start)}
+        for steps in (-1, 1):
+            start = shift_window(self.window_start, self.window_span, steps)
+            keep.add((self.window_span, start))
+            if (self.window_span, start) not in self._window_rows:
+                self._fetch_window(self.window_span, start)
+        for key in list(self._window_rows):
+            if key not in keep:
+                del self._window_rows[key]
+        
+    def _fetch_window(self, span, start):
+        self.data_io.call(self._load_window, span, start,
+                          callback=lambda rows: self._on_window_loaded(span, start, rows))
+        
+    def _on_window_loaded(self, span, start, rows):
+        self._window_rows[(span, start)] = rows
+        if (span, start) == (self.window_span, self.window_start):
+            self.appointment_list.set_rows(rows, presorted=True)
+        
+    def _load_window(self, span, start):
+        """Build one window's rows in schedule order, reading only the records in it"""
+        start, end = window_bounds(start, span)
+        apt_ids = shared_schedule(self.data_mgr).ids_between(
+            datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time()))
+        rows = []
+        for apt_id in apt_ids:
+            apt = self.data_mgr.get_typed('appointments', apt_id)
+            if apt is not None:
+                rows.append(apt)
+        archive = shared_archive(self.data_mgr)
+        if archive.covers(start):
+            shown = set(apt_ids)
+            rows.extend(Appointment.from_dict(apt_id, apt)
+                        for apt_id, apt in archive.records_between('appointments', start, end).items()
+                        if apt_id not in shown and self.data_mgr.get_record(
+                            self.data_mgr.appointments_file, apt_id) is None)
+            rows.sort(key=attrgetter('sort_key'))
+        for apt in rows:
+            # Looked up here so showing the rows reads nothing
+            self.patient_names.name_for(apt)
+        return rows
         
     def show_schedule_dialog(self):
-        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
-        
-        content.add_widget(Label(text='Patient ID:', size_hint_y=None, height=30))
-        patient_input = TextInput(multiline=False, size_hint_y=None, height=40, hint_text='e.g., P0001')
-        content.add_widget(patient_input)
-        
-        content.add_widget(Label(text='Date:', size_hint_y=None, height=30))
-        date_input = TextInput(multiline=False, size_hint_y=None, height=40, hint_text='YYYY-MM-DD')
-        content.add_widget(date_input)
-        
-        content.add_widget(Label(text='Time:', size_hint_y=None, height=30))
-        time_input = TextInput(multiline=False, size_hint_y=None, height=40, hint_text='HH:MM')
-        content.add_widget(time_input)
-        
-        content.add_widget(Label(text='Reason:', size_hint_y=None, height=30))
-        reason_input = TextInput(multiline=False, size_hint_y=None, height=40)
-        content.add_widget(reason_input)
-        
-        buttons = BoxLayout(size_hint_y=None, height=50, spacing=10)
-        
-        popup = Popup(title='Schedule Appointment', content=content, size_hint=(0.9, 0.7))
-        
-        save_btn = Button(text='Schedule', background_color=(0.3, 0.7, 0.3, 1))
-        save_btn.bind(on_press=lambda x: self.save_appointment(
-            patient_input.text, date_input.text, time_input.text, reason_input.text, popup))
-        buttons.add_widget(save_btn)
-        
-        cancel_btn = Button(text='Cancel', background_color=(0.7, 0.3, 0.3, 1))
-        cancel_btn.bind(on_press=popup.dismiss)
-        buttons.add_widget(cancel_btn)
-        
-        content.add_widget(buttons)
-        popup.open()
-        
-    def save_appointment(self, patient_id, date, time, reason, popup):
-        if not patient_id or not date or not time:
-            return
-            
-        patients = self.data_mgr.get_patients()
-        patient = patients.get(patient_id)
+        dialog_pool.acquire('appointment_form').open(self.save_appointment)
+        
+    def save_appointment(self, values, popup):
+        patient_id = values['patient_id']
+        set_saving(popup, True)
+        self.data_io.call(self._create_appointment, patient_id, values['date'], values['time'],
+                          values['reason'], values['duration'], values['chair'],
+                          callback=lambda apt_id: finish_saving(popup, apt_id,
+                                                                f'No patient {patient_id}'),
+                          error_callback=lambda error: self._on_schedule_error(popup, error))
+        
+    def _on_schedule_error(self, popup, error):
+        set_saving(popup, False)
+        if isinstance(error, SchedulingConflict):
+            free = ', '.join(f"{start:%H:%M}" if start.date() == error.start.date()
+                             else f"{start:%Y-%m-%d %H:%M}"
+                             for start, _ in error.free_slots)
+            popup.error_label.text = f"{error}. Next free: {free or 'none'}"
+        elif isinstance(error, ValueError):
+            popup.error_label.text = 'Use YYYY-MM-DD for the date and HH:MM for the time'
+        else:
+            Logger.error(f'Appointments: could not save appointment: {error!r}')
+        
+    def _create_appointment(self, patient_id, date, time, reason,
+                            duration=DEFAULT_DURATION, chair=DEFAULT_CHAIR):
+        patient = self.data_mgr.get_patient(patient_id)
         
         if not patient:
-            return
+            return None
             
-        appointments = self.data_mgr.get_appointments()
-        apt_id = f"APT{len(appointments) + 1:04d}"
-        
-        appointments[apt_id] = {
+        # Store the canonical format whatever the user typed (e.g. 9:30 am)
+        start = parse_start(date, time)
+        apt = {
             'patient_id': patient_id,
-            'patient_name': patient['name'],
-            'date': date,
-            'time': time,
+            'date': start.strftime('%Y-%m-%d'),
+            'time': start.strftime('%H:%M'),
+            'duration': int(duration or DEFAULT_DURATION),
+            'chair': chair.strip() or DEFAULT_CHAIR,
             'reason': reason,
             'status': 'pending',
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
-        
-        self.data_mgr.save_appointments(appointments)
-        popup.dismiss()
-        self.build_ui()
+        schedule = shared_schedule(self.data_mgr)
+        # Check before allocating so a rejected booking does not burn an ID;
+        # book() checks again under the schedule lock.
+        schedule.check(apt)
+        apt_id = self.data_mgr.next_appointment_id()
+        schedule.book(apt_id, apt)
+        return apt_id
         
     def go_back(self):
         self.manager.current = 'home'
 
 
+class ToothChartWidget(Widget):
+    """Both dental arches drawn on one canvas
+    
+    Each tooth is five surface rectangles (mesial, occlusal, distal,
+    buccal, lingual) whose colours come from the chart. The canvas
+    instructions are created once; loading another patient only changes
+    their colours, and touches are mapped to a tooth and surface
+    arithmetically instead of through 32 child widgets.
+    """
+    
+    __events__ = ('on_tooth_press',)
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.chart = ToothChart()
+        self.selected = None
+        self._surface_colors = {}
+        self._surface_rects = {}
+        self._number_rects = {}
+        with self.canvas:
+            for tooth in range(1, TOOTH_COUNT + 1):
+                for surface in SURFACES:
+                    self._surface_colors[tooth, surface] = Color(*CONDITION_COLORS[HEALTHY])
+                    self._surface_rects[tooth, surface] = Rectangle()
+                label = CoreLabel(text=str(tooth), font_size=14, color=(0.2, 0.2, 0.2, 1))
+                label.refresh()
+                Color(1, 1, 1, 1)
+                self._number_rects[tooth] = Rectangle(texture=label.texture, size=label.texture.size)
+            Color(0.1, 0.4, 0.9, 1)
+            self._highlight = Line(width=2)
+        self.bind(pos=self._layout, size=self._layout)
+        
+    @staticmethod
+    def _cell(tooth):
+        """Grid position of a tooth: upper arch 1-16 left to right, lower arch 32-17 below it"""
+        if tooth <= 16:
+            return tooth - 1, 1
+        return 32 - tooth, 0
+        
+    def _cell_rect(self, tooth):
+        column, row = self._cell(tooth)
+        cell_w, cell_h = self.width / 16, self.height / 2
+        gap = min(cell_w, cell_h) * 0.08
+        label_h = cell_h * 0.2
+        # Numbers sit above the upper arch and below the lower one.
+        x = self.x + column * cell_w + gap
+        y = self.y + row * cell_h + gap + (0 if row else label_h)
+        return x, y, cell_w - 2 * gap, cell_h - label_h - 2 * gap
+        
+    @staticmethod
+    def _surface_rect(surface, x, y, w, h):
+        if surface == 'O':
+            return x + w / 4, y + h / 4, w / 2, h / 2
+        if surface == 'M':
+            return x, y + h / 4, w / 4, h / 2
+        if surface == 'D':
+            return x + w * 3 / 4, y + h / 4, w / 4, h / 2
+        if surface == 'B':
+            return x, y + h * 3 / 4, w, h / 4
+        return x, y, w, h / 4
+        
+    def _layout(self, *args):
+        for tooth in range(1, TOOTH_COUNT + 1):
+            x, y, w, h = self._cell_rect(tooth)
+            for surface in SURFACES:
+                sx, sy, sw, sh = self._surface_rect(surface, x, y, w, h)
+                rect = self._surface_rects[tooth, surface]
+                # A hairline gap keeps neighbouring surfaces distinguishable.
+                rect.pos = (sx + 1, sy + 1)
+                rect.size = (max(sw - 2, 0), max(sh - 2, 0))
+            number = self._number_rects[tooth]
+            label_y = y + h + 2 if tooth <= 16 else y - number.size[1] - 2
+            number.pos = (x + (w - number.size[0]) / 2, label_y)
+        self._draw_highlight()
+        
+    def set_chart(self, chart):
+        """Recolour every surface from chart in a single pass"""
+        self.chart = chart
+        data = chart.data
+        colors = self._surface_colors
+        for tooth in range(1, TOOTH_COUNT + 1):
+            offset = (tooth - 1) * len(SURFACES)
+            for index, surface in enumerate(SURFACES):
+                colors[tooth, surface].rgba = CONDITION_COLORS[data[offset + index]]
+                
+    def select(self, tooth):
+        self.selected = tooth
+        self._draw_highlight()
+        
+    def _draw_highlight(self):
+        if self.selected is None:
+            self._highlight.points = []
+            return
+        x, y, w, h = self._cell_rect(self.selected)
+        self._highlight.rectangle = (x, y, w, h)
+        
+    def hit(self, touch_x, touch_y):
+        """Return (tooth, surface) under a point, or None"""
+        column = int((touch_x - self.x) / (self.width / 16))
+        row = int((touch_y - self.y) / (self.height / 2))
+        if not (0 <= column < 16 and 0 <= row < 2):
+            return None
+        tooth = column + 1 if row else 32 - column
+        x, y, w, h = self._cell_rect(tooth)
+        if not (x <= touch_x < x + w and y <= touch_y < y + h):
+            return tooth, None
+        for surface in SURFACES:
+            sx, sy, sw, sh = self._surface_rect(surface, x, y, w, h)
+            if sx <= touch_x < sx + sw and sy <= touch_y < sy + sh:
+                return tooth, surface
+        return tooth, None
+        
+    def on_touch_down(self, touch):
+        if not self.collide_point(*touch.pos):
+            return super().on_touch_down(touch)
+        hit = self.hit(*touch.pos)
+        if hit is None:
+            return False
+        self.select(hit[0])
+        self.dispatch('on_tooth_press', *hit)
+        return True
+        
+    def on_tooth_press(self, tooth, surface):
+        pass
+
+
 class DentalChartScreen(Screen):
     """Dental chart visualization screen"""
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.name = 'dental_chart'
+        self.data_mgr = DataManager()
+        self.data_io = AsyncDataManager(self.data_mgr, io_worker)
+        self.patient_id = None
+        self.tooth_treatments = {}
+        self.treatment_ids = set()
         self.build_ui()
+        self.data_mgr.subscribe(self.data_mgr.patients_file, self.on_patients_changed)
+        self.data_mgr.subscribe(self.data_mgr.treatments_file, self.on_treatments_changed)
         
+    @mainthread
+    def on_patients_changed(self, event, patient_id, patient):
+        if patient_id == self.patient_id:
+            self.show_patient(patient_id)
+            
+    @mainthread
+    def on_treatments_changed(self, event, treatment_id, treatment):
+        if self.patient_id is None:
+            return
+        # Removals carry no record, so they are matched by the IDs on screen
+        if treatment_id in self.treatment_ids or (
+                event != REMOVED and treatment.get('patient_id') == self.patient_id):
+            self.show_patient(self.patient_id)
+        
+    @profiled_build
     def build_ui(self):
+        from kivy.uix.textinput import TextInput
+        
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         header = BoxLayout(size_hint_y=0.1, spacing=10)
@@ -432,54 +1299,77 @@ class DentalChartScreen(Screen):
         
         layout.add_widget(header)
         
-        chart_container = BoxLayout(orientation='vertical', spacing=20, padding=20)
-        
-        upper_teeth = GridLayout(cols=16, spacing=5, size_hint_y=0.4)
-        tooth_numbers_upper = list(range(1, 17))
-        
-        for tooth_num in tooth_numbers_upper:
-            tooth_btn = Button(
-                text=str(tooth_num),
-                background_color=(1, 1, 1, 1),
-                color=(0, 0, 0, 1)
-            )
-            tooth_btn.bind(on_press=lambda x, t=tooth_num: self.show_tooth_info(t))
-            upper_teeth.add_widget(tooth_btn)
-            
-        chart_container.add_widget(Label(text='Upper Teeth', size_hint_y=0.1, font_size='18sp'))
-        chart_container.add_widget(upper_teeth)
-        
-        chart_container.add_widget(Label(text='━━━━━━━━━━━━━━━━', size_hint_y=0.1))
+        patient_bar = BoxLayout(size_hint_y=0.08, spacing=10)
+        self.patient_input = TextInput(multiline=False, hint_text='Patient ID, e.g. P0001', size_hint_x=0.35)
+        self.patient_input.bind(on_text_validate=lambda x: self.show_patient(x.text.strip()))
+        patient_bar.add_widget(self.patient_input)
+        load_btn = Button(text='Load', size_hint_x=0.15, background_color=(0.3, 0.6, 0.9, 1))
+        load_btn.bind(on_press=lambda x: self.show_patient(self.patient_input.text.strip()))
+        patient_bar.add_widget(load_btn)
+        self.patient_label = Label(text='No patient loaded', font_size='16sp', size_hint_x=0.5,
+                                   color=(0.2, 0.2, 0.2, 1))
+        patient_bar.add_widget(self.patient_label)
+        layout.add_widget(patient_bar)
+        
+        self.chart_widget = ToothChartWidget(size_hint_y=0.72)
+        self.chart_widget.bind(on_tooth_press=lambda w, tooth, surface: self.show_tooth_info(tooth, surface))
+        layout.add_widget(self.chart_widget)
+        
+        # Each condition name is written in its chart colour (healthy is white, so grey)
+        legend = '   '.join(
+            f"[b][color={''.join(f'{int(c * 255):02x}' for c in CONDITION_COLORS[code][:3])}]{name}[/color][/b]"
+            if code != HEALTHY else name
+            for code, name in enumerate(CONDITION_NAMES))
+        layout.add_widget(Label(text=legend, markup=True, font_size='13sp', color=(0.2, 0.2, 0.2, 1),
+                                size_hint_y=0.1))
         
-        lower_teeth = GridLayout(cols=16, spacing=5, size_hint_y=0.4)
-        tooth_numbers_lower = list(range(17, 33))
-        
-        for tooth_num in tooth_numbers_lower:
-            tooth_btn = Button(
-                text=str(tooth_num),
-                background_color=(1, 1, 1, 1),
-                color=(0, 0, 0, 1)
-            )
-            tooth_btn.bind(on_press=lambda x, t=tooth_num: self.show_tooth_info(t))
-            lower_teeth.add_widget(tooth_btn)
-            
-        chart_container.add_widget(Label(text='Lower Teeth', size_hint_y=0.1, font_size='18sp'))
-        chart_container.add_widget(lower_teeth)
-        
-        layout.add_widget(chart_container)
         self.add_widget(layout)
         
-    def show_tooth_info(self, tooth_number):
-        content = BoxLayout(orientation='vertical', spacing=10, padding=20)
-        content.add_widget(Label(text=f'Tooth #{tooth_number}', font_size='20sp', bold=True))
-        content.add_widget(Label(text='Condition: Healthy', font_size='16sp'))
-        content.add_widget(Label(text='Last Check: N/A', font_size='16sp'))
-        
-        close_btn = Button(text='Close', size_hint_y=None, height=50)
-        popup = Popup(title=f'Tooth #{tooth_number} Details', content=content, size_hint=(0.7, 0.5))
-        close_btn.bind(on_press=popup.dismiss)
-        content.add_widget(close_btn)
-        popup.open()
+    def show_patient(self, patient_id):
+        """Load a patient's chart and tooth history and recolour the chart"""
+        if not patient_id:
+            return
+        self.data_io.call(self._load_patient_chart, patient_id,
+                          callback=lambda result: self._on_chart_loaded(patient_id, *result))
+        
+    def _load_patient_chart(self, patient_id):
+        patient, chart = load_chart(self.data_mgr, patient_id)
+        if patient is None:
+            return None, None, {}, set()
+        _, treatments = shared_indexes(self.data_mgr).patient_history(patient_id)
+        by_tooth = {}
+        for treatment in treatments.values():
+            if treatment.get('tooth'):
+                by_tooth.setdefault(int(treatment['tooth']), []).append(treatment)
+        for history in by_tooth.values():
+            history.sort(key=lambda t: t.get('date', ''), reverse=True)
+        return patient, chart, by_tooth, set(treatments)
+        
+    def _on_chart_loaded(self, patient_id, patient, chart, by_tooth, treatment_ids):
+        if patient is None:
+            self.patient_label.text = f'No patient {patient_id}'
+            return
+        self.patient_id = patient_id
+        self.patient_input.text = patient_id
+        self.patient_label.text = patient['name']
+        self.tooth_treatments = by_tooth
+        self.treatment_ids = treatment_ids
+        self.chart_widget.set_chart(chart)
+        
+    def show_tooth_info(self, tooth_number, surface=None):
+        dialog_pool.acquire('tooth').open(
+            tooth_number, surface,
+            self.chart_widget.chart if self.patient_id is not None else None,
+            self.tooth_treatments.get(tooth_number, []),
+            self.set_condition, lambda: self.chart_widget.select(None))
+        
+    def set_condition(self, tooth_number, condition, surfaces, popup):
+        chart = ToothChart(self.chart_widget.chart.data)
+        chart.set(tooth_number, condition, surfaces)
+        self.chart_widget.set_chart(chart)
+        self.data_io.call(save_chart, self.data_mgr, self.patient_id, chart,
+                          key=('chart', self.patient_id))
+        popup.dismiss()
         
     def go_back(self):
         self.manager.current = 'home'
@@ -492,8 +1382,26 @@ class TreatmentsScreen(Screen):
         super().__init__(**kwargs)
         self.name = 'treatments'
         self.data_mgr = DataManager()
+        self.data_io = AsyncDataManager(self.data_mgr, io_worker)
+        self.patient_names = PatientNames(self.data_mgr)
         self.build_ui()
+        self.data_mgr.subscribe(self.data_mgr.treatments_file, self.on_treatments_changed)
+        self.data_mgr.subscribe(self.data_mgr.patients_file, self.on_patients_changed)
+        
+    @mainthread
+    def on_treatments_changed(self, event, record_id, record):
+        if event in (REMOVED, ARCHIVED):
+            self.treatment_list.remove_row(record_id)
+        else:
+            self.treatment_list.upsert_row(Treatment.from_dict(record_id, record))
+            
+    @mainthread
+    def on_patients_changed(self, event, patient_id, patient):
+        """Show a renamed patient's new name on the visible rows"""
+        if self.patient_names.update(event, patient_id, patient):
+            self.treatment_list.refresh_from_data()
         
+    @profiled_build
     def build_ui(self):
         self.clear_widgets()
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
@@ -512,140 +1420,421 @@ class TreatmentsScreen(Screen):
         
         layout.add_widget(header)
         
-        scroll = ScrollView(size_hint=(1, 0.9))
-        self.treatment_list = BoxLayout(orientation='vertical', spacing=5, size_hint_y=None)
-        self.treatment_list.bind(minimum_height=self.treatment_list.setter('height'))
+        self.treatment_list = RecordList(
+            self, TreatmentRow, 100,
+            sort_key=attrgetter('sort_key'),
+            reverse=True,
+            size_hint=(1, 0.9)
+        )
+        layout.add_widget(self.treatment_list)
         
-        treatments = self.data_mgr.get_treatments()
-        sorted_treatments = sorted(treatments.items(), 
-                                   key=lambda x: x[1].get('date', ''), 
-                                   reverse=True)
+        self.add_widget(layout)
+        self.data_io.call(self._load_rows, callback=self.treatment_list.set_rows)
         
-        for treatment_id, treatment in sorted_treatments:
-            self.add_treatment_item(treatment_id, treatment)
-            
-        scroll.add_widget(self.treatment_list)
-        layout.add_widget(scroll)
+    def _load_rows(self):
+        self.patient_names.load_all()
+        return self.data_mgr.load_records('treatments')
         
-        self.add_widget(layout)
+    def show_add_treatment_dialog(self):
+        dialog_pool.acquire('treatment_form').open(self.save_treatment)
         
-    def add_treatment_item(self, treatment_id, treatment):
-        item = BoxLayout(orientation='vertical', size_hint_y=None, height=100, padding=10, spacing=5)
+    def save_treatment(self, values, popup):
+        patient_id = values['patient_id']
+        set_saving(popup, True)
+        self.data_io.call(self._create_treatment, patient_id, values['procedure'], values['date'],
+                          values['cost'], values['notes'], values['tooth'], values['surfaces'],
+                          callback=lambda treatment_id: finish_saving(popup, treatment_id,
+                                                                      f'No patient {patient_id}'),
+                          error_callback=lambda error: fail_saving(popup, 'treatment', error))
         
-        with item.canvas.before:
-            Color(1, 1, 1, 1)
-            item.rect = Rectangle(pos=item.pos, size=item.size)
-        item.bind(pos=lambda i, v: setattr(i.rect, 'pos', v),
-                 size=lambda i, v: setattr(i.rect, 'size', v))
+    def _create_treatment(self, patient_id, procedure, date, cost, notes, tooth='', surfaces=''):
+        patient, chart = load_chart(self.data_mgr, patient_id)
         
-        item.add_widget(Label(
-            text=f"{treatment['patient_name']} - {treatment['procedure']}",
-            font_size='16sp',
-            bold=True,
-            halign='left',
-            size_hint_y=0.4
-        ))
-        item.add_widget(Label(
-            text=f"Date: {treatment['date']} | Cost: ${treatment['cost']}",
-            font_size='14sp',
-            halign='left',
-            size_hint_y=0.3
-        ))
-        item.add_widget(Label(
-            text=f"Notes: {treatment.get('notes', 'N/A')}",
-            font_size='12sp',
-            halign='left',
-            size_hint_y=0.3
-        ))
-        
-        self.treatment_list.add_widget(item)
+        if not patient:
+            return None
+            
+        treatment = {
+            'patient_id': patient_id,
+            'procedure': procedure,
+            'date': date,
+            'cost': cost,
+            'notes': notes,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        if tooth:
+            # Parsed before an ID is allocated so bad input saves nothing
+            treatment['tooth'] = parse_tooth(tooth)
+            treatment['surfaces'] = ''.join(parse_surfaces(surfaces))
+            
+        treatment_id = self.data_mgr.next_treatment_id()
+        self.data_mgr.put_treatment(treatment_id, treatment)
         
-    def show_add_treatment_dialog(self):
-        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
+        if tooth and chart.apply_procedure(treatment['tooth'], procedure, treatment['surfaces']) is not None:
+            save_chart(self.data_mgr, patient_id, chart)
+        return treatment_id
         
-        content.add_widget(Label(text='Patient ID:', size_hint_y=None, height=30))
-        patient_input = TextInput(multiline=False, size_hint_y=None, height=40, hint_text='e.g., P0001')
-        content.add_widget(patient_input)
+    def go_back(self):
+        self.manager.current = 'home'
+
+
+class ReportsScreen(Screen):
+    """Revenue reports by month, procedure and patient"""
+    
+    PERIODS = ('This month', 'This year', 'All time')
+    MONTH_ROWS = 24
+    PATIENT_ROWS = 10
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.name = 'reports'
+        self.data_mgr = DataManager()
+        self.data_io = AsyncDataManager(self.data_mgr, io_worker)
+        self.period = 'This month'
+        self.analytics = None
+        self._refresh_trigger = Clock.create_trigger(self.refresh)
+        self.build_ui()
+        io_worker.submit(TreatmentAnalytics, self.data_mgr, callback=self._on_analytics_ready)
+        self.data_mgr.subscribe(self.data_mgr.treatments_file, self.on_treatments_changed)
         
-        content.add_widget(Label(text='Procedure:', size_hint_y=None, height=30))
-        procedure_input = TextInput(multiline=False, size_hint_y=None, height=40)
-        content.add_widget(procedure_input)
+    def _on_analytics_ready(self, analytics):
+        self.analytics = analytics
+        self.refresh()
         
-        content.add_widget(Label(text='Date:', size_hint_y=None, height=30))
-        date_input = TextInput(multiline=False, size_hint_y=None, height=40, hint_text='YYYY-MM-DD')
-        content.add_widget(date_input)
+    def on_treatments_changed(self, event, treatment_id, treatment):
+        if self.manager is not None and self.manager.current == self.name:
+            self._refresh_trigger()
+            
+    def on_enter(self):
+        self.refresh()
         
-        content.add_widget(Label(text='Cost:', size_hint_y=None, height=30))
-        cost_input = TextInput(multiline=False, size_hint_y=None, height=40)
-        content.add_widget(cost_input)
+    @profiled_build
+    def build_ui(self):
+        from kivy.uix.scrollview import ScrollView
+        from kivy.uix.togglebutton import ToggleButton
         
-        content.add_widget(Label(text='Notes:', size_hint_y=None, height=30))
-        notes_input = TextInput(multiline=True, size_hint_y=None, height=60)
-        content.add_widget(notes_input)
+        layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
-        buttons = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        header = BoxLayout(size_hint_y=0.1, spacing=10)
+        back_btn = Button(text='← Back', size_hint_x=0.3, background_color=(0.5, 0.5, 0.5, 1))
+        back_btn.bind(on_press=lambda x: self.go_back())
+        header.add_widget(back_btn)
         
-        popup = Popup(title='Add Treatment Record', content=content, size_hint=(0.9, 0.8))
+        title = Label(text='Reports', font_size='24sp', bold=True)
+        header.add_widget(title)
         
-        save_btn = Button(text='Save', background_color=(0.3, 0.7, 0.3, 1))
-        save_btn.bind(on_press=lambda x: self.save_treatment(
-            patient_input.text, procedure_input.text, date_input.text, 
-            cost_input.text, notes_input.text, popup))
-        buttons.add_widget(save_btn)
+        layout.add_widget(header)
         
-        cancel_btn = Button(text='Cancel', background_color=(0.7, 0.3, 0.3, 1))
-        cancel_btn.bind(on_press=popup.dismiss)
-        buttons.add_widget(cancel_btn)
+        periods = BoxLayout(size_hint_y=0.08, spacing=10)
+        for period in self.PERIODS:
+            button = ToggleButton(text=period, group='report_period',
+                                  state='down' if period == self.period else 'normal',
+                                  allow_no_selection=False)
+            button.bind(on_press=lambda x, p=period: self.set_period(p))
+            periods.add_widget(button)
+        layout.add_widget(periods)
+        
+        self.summary_label = Label(text='Loading…', font_size='18sp', bold=True,
+                                   color=(0.2, 0.4, 0.7, 1), size_hint_y=0.07)
+        layout.add_widget(self.summary_label)
+        
+        self.tables = GridLayout(cols=3, spacing=4, size_hint_y=None, row_default_height=30,
+                                 row_force_default=True)
+        self.tables.bind(minimum_height=self.tables.setter('height'))
+        scroll = ScrollView(size_hint_y=0.75)
+        scroll.add_widget(self.tables)
+        layout.add_widget(scroll)
         
-        content.add_widget(buttons)
-        popup.open()
+        self.add_widget(layout)
         
-    def save_treatment(self, patient_id, procedure, date, cost, notes, popup):
-        if not patient_id or not procedure or not date or not cost:
-            return
-            
-        patients = self.data_mgr.get_patients()
-        patient = patients.get(patient_id)
+    def set_period(self, period):
+        self.period = period
+        self.refresh()
         
-        if not patient:
-            return
-            
-        treatments = self.data_mgr.get_treatments()
-        treatment_id = f"T{len(treatments) + 1:04d}"
+    def _period_bounds(self):
+        today = datetime.now().date()
+        if self.period == 'This month':
+            return window_bounds(today, 'month')
+        if self.period == 'This year':
+            return today.replace(month=1, day=1), today.replace(year=today.year + 1, month=1, day=1)
+        return None, None
         
-        treatments[treatment_id] = {
-            'patient_id': patient_id,
-            'patient_name': patient['name'],
-            'procedure': procedure,
-            'date': date,
-            'cost': cost,
-            'notes': notes,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    def refresh(self, *args):
+        if self.analytics is None:
+            return
+        start, end = self._period_bounds()
+        self.data_io.call(self._build_report, start, end, callback=self._show_report)
+        
+    def _build_report(self, start, end):
+        analytics = self.analytics
+        patients = [
+            (self.data_mgr.patient_name_for({'patient_id': patient_id}), cents, count)
+            for patient_id, cents, count in analytics.revenue_by_patient(start, end, self.PATIENT_ROWS)
+        ]
+        return {
+            'total': analytics.total(start, end),
+            'months': analytics.revenue_by_month(start, end)[-self.MONTH_ROWS:],
+            'procedures': analytics.revenue_by_procedure(start, end),
+            'patients': patients,
         }
         
-        self.data_mgr.save_treatments(treatments)
-        popup.dismiss()
-        self.build_ui()
-        
+    def _show_report(self, report):
+        cents, count = report['total']
+        self.summary_label.text = f"{self.period}: ${format_cents(cents)} from {count} treatments"
+        
+        grid = self.tables
+        grid.clear_widgets()
+        
+        def add_row(cells, heading=False):
+            for index, text in enumerate(cells):
+                grid.add_widget(Label(
+                    text=str(text), bold=heading, font_size='15sp' if heading else '14sp',
+                    color=(0.2, 0.4, 0.7, 1) if heading else (0.2, 0.2, 0.2, 1),
+                    halign='left' if index == 0 else 'right'))
+                
+        for heading, rows in (('Month', report['months']),
+                              ('Procedure', report['procedures']),
+                              ('Top patients', report['patients'])):
+            add_row((heading, 'Revenue', 'Treatments'), heading=True)
+            for name, row_cents, row_count in rows:
+                add_row((name or '(none)', f"${format_cents(row_cents)}", row_count))
+            if not rows:
+                add_row(('No treatments', '', ''))
+                
     def go_back(self):
         self.manager.current = 'home'
 
 
+class FrameMonitor:
+    """Measures the time between frames on the main thread
+
+    Frame statistics are recorded with the profiler once a second, and
+    any gap of STALL_SECONDS or more is recorded straight away as a stall,
+    so a slow callback or layout shows up next to the data calls around it.
+    """
+    
+    STALL_SECONDS = 0.1
+    REPORT_SECONDS = 1.0
+    
+    def __init__(self):
+        self.fps = 0.0
+        self.mean_frame = 0.0
+        self.worst_frame = 0.0
+        self.longest_stall = 0.0
+        self._last = self._window_start = time.perf_counter()
+        self._frames = 0
+        self._worst = 0.0
+        Clock.schedule_interval(self._on_frame, 0)
+        
+    def _on_frame(self, dt):
+        now = time.perf_counter()
+        gap = now - self._last
+        self._last = now
+        self._frames += 1
+        self._worst = max(self._worst, gap)
+        if gap >= self.STALL_SECONDS:
+            self.longest_stall = max(self.longest_stall, gap)
+            profiler.record('stall', 'main thread', gap)
+            
+        elapsed = now - self._window_start
+        if elapsed >= self.REPORT_SECONDS:
+            self.fps = self._frames / elapsed
+            self.mean_frame = elapsed / self._frames
+            self.worst_frame = self._worst
+            profiler.record('frames', 'main thread', elapsed, frames=self._frames,
+                            worst_ms=round(self._worst * 1000, 3))
+            self._window_start, self._frames, self._worst = now, 0, 0.0
+
+
+def describe_event(event):
+    """One overlay line for a profiler event"""
+    text = f"{event['kind']} {event['name']} {event['ms']:.1f} ms"
+    if event.get('bytes'):
+        text += f"  {event['bytes'] / 1024:,.0f} KB"
+    for field in ('parse_ms', 'write_ms'):
+        if field in event:
+            text += f"  {field[:-3]} {event[field]:.1f} ms"
+    for field in ('rows', 'widgets'):
+        if field in event:
+            text += f"  {event[field]:,} {field}"
+    return text
+
+
+class PerformanceOverlay(Label):
+    """On-screen readout of frame times and the latest profiled calls"""
+    
+    EVENTS = 8
+    
+    def __init__(self, monitor, **kwargs):
+        super().__init__(size_hint=(None, None), halign='left', valign='top', font_size='12sp',
+                         color=(1, 1, 1, 1), padding=(8, 6), **kwargs)
+        self.monitor = monitor
+        with self.canvas.before:
+            Color(0, 0, 0, 0.75)
+            self.rect = Rectangle(pos=self.pos, size=self.size)
+        self.bind(texture_size=self._resize, pos=self._update_rect, size=self._update_rect)
+        Window.bind(size=self._resize)
+        self._refresh_event = None
+        
+    def _resize(self, *args):
+        self.size = self.texture_size
+        self.pos = (0, Window.height - self.height)
+        
+    def _update_rect(self, *args):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+        
+    def show(self):
+        Window.add_widget(self)
+        self.refresh()
+        self._refresh_event = Clock.schedule_interval(self.refresh, 0.5)
+        
+    def hide(self):
+        self._refresh_event.cancel()
+        Window.remove_widget(self)
+        
+    def refresh(self, *args):
+        monitor = self.monitor
+        lines = [f"{monitor.fps:.0f} fps  frame {monitor.mean_frame * 1000:.1f} ms  "
+                 f"worst {monitor.worst_frame * 1000:.0f} ms  "
+                 f"longest stall {monitor.longest_stall * 1000:.0f} ms"]
+        events = [event for event in reversed(profiler.recent) if event['kind'] != 'frames']
+        lines.extend(describe_event(event) for event in events[:self.EVENTS])
+        self.text = '\n'.join(lines)
+
+
+class LazyScreenManager(ScreenManager):
+    """ScreenManager that builds registered screens on first navigation"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._factories = {}
+        
+    def register(self, name, factory):
+        self._factories[name] = factory
+        
+    def ensure_screen(self, name):
+        factory = self._factories.pop(name, None)
+        if factory is not None:
+            started = time.perf_counter()
+            screen = factory()
+            self.add_widget(screen)
+            elapsed = time.perf_counter() - started
+            Logger.info(f'Startup: built {name} screen in {elapsed * 1000:.1f} ms')
+            if profiler.enabled:
+                profiler.record('screen', name, elapsed, widgets=count_widgets(screen))
+            
+    def on_current(self, instance, value):
+        if value is not None:
+            self.ensure_screen(value)
+        super().on_current(instance, value)
+        
+    def prewarm(self, *args):
+        """Build the remaining screens, one per frame, so navigation is instant"""
+        if self._factories:
+            self.ensure_screen(next(iter(self._factories)))
+            Clock.schedule_once(self.prewarm, 0)
+
+
 class DentalApp(App):
     """Main application class"""
     
+    # Build the screens and dialogs that have not been opened yet in the
+    # frames after the first one; set DENTAL_PREWARM=0 to build strictly on
+    # demand.
+    prewarm_screens = os.environ.get('DENTAL_PREWARM', '1') != '0'
+    
+    # F12 toggles the performance overlay while profiling; set
+    # DENTAL_PROFILE_OVERLAY=1 to show it from the start.
+    show_overlay = os.environ.get('DENTAL_PROFILE_OVERLAY', '0') == '1'
+    
+    # Set DENTAL_SYNC_URL to the address of a `dental sync-server` to
+    # exchange changes with other devices every DENTAL_SYNC_INTERVAL seconds.
+    sync_url = os.environ.get('DENTAL_SYNC_URL')
+    sync_interval = os.environ.get('DENTAL_SYNC_INTERVAL')
+    
+    # Set DENTAL_ARCHIVE_DAYS to move appointments and treatments dated more
+    # than that many days ago into the archive (see dental.archive) once the
+    # app has started.
+    archive_days = os.environ.get('DENTAL_ARCHIVE_DAYS')
+    
     def build(self):
         self.title = 'Dental Practice Manager'
-        
-        sm = ScreenManager()
-        sm.add_widget(HomeScreen())
-        sm.add_widget(PatientsScreen())
-        sm.add_widget(AppointmentsScreen())
-        sm.add_widget(DentalChartScreen())
-        sm.add_widget(TreatmentsScreen())
-        
+        self.overlay = None
+        self.sync_client = None
+        if profiler.enabled:
+            self.overlay = PerformanceOverlay(FrameMonitor())
+            Window.bind(on_keyboard=self._on_keyboard)
+        
+        sm = LazyScreenManager()
+        sm.register('home', HomeScreen)
+        sm.register('patients', PatientsScreen)
+        sm.register('appointments', AppointmentsScreen)
+        sm.register('dental_chart', DentalChartScreen)
+        sm.register('treatments', TreatmentsScreen)
+        sm.register('reports', ReportsScreen)
+        sm.current = 'home'
+        
+        startup_timer.mark('build')
         return sm
+        
+    def on_start(self):
+        Window.bind(on_flip=self._on_first_frame)
+        
+    def _on_first_frame(self, *args):
+        Window.unbind(on_flip=self._on_first_frame)
+        startup_timer.mark('first frame')
+        startup_timer.report()
+        if self.prewarm_screens:
+            Clock.schedule_once(self.root.prewarm, 0)
+            Clock.schedule_once(dialog_pool.prewarm, 0)
+        if self.overlay is not None and self.show_overlay:
+            self.toggle_overlay()
+        if self.sync_url:
+            # Imported here so that the sync protocol and its HTTP client
+            # are only loaded on devices that sync
+            from dental import sync
+            self.sync_client = sync.SyncClient(
+                DataManager(),
+                sync.HttpTransport(self.sync_url, token=os.environ.get('DENTAL_SYNC_TOKEN')))
+            Clock.schedule_interval(self._sync, float(self.sync_interval or sync.DEFAULT_INTERVAL))
+            self._sync()
+        if self.archive_days:
+            data_mgr = DataManager()
+            io_worker.submit(shared_archive(data_mgr).archive, data_mgr,
+                             archive_horizon(int(self.archive_days)), key='archive',
+                             error_callback=lambda error: Logger.warning(f'Archive: {error}'))
+            
+    def _sync(self, *args):
+        # Runs on the I/O worker so that applying remote changes is ordered
+        # with the app's own writes; listeners refresh the screens.
+        io_worker.submit(self.sync_client.sync, key='sync',
+                         error_callback=lambda error: Logger.warning(f'Sync: {error}'))
+            
+    def toggle_overlay(self):
+        if self.overlay.parent is None:
+            self.overlay.show()
+        else:
+            self.overlay.hide()
+            
+    def _on_keyboard(self, window, key, *args):
+        if key == 293:  # F12
+            self.toggle_overlay()
+            return True
+        return False
+        
+    def on_stop(self):
+        io_worker.stop()
+        if self.sync_client is not None:
+            self.sync_client.close()
+        get_default_backend().close()
+        if profiler.enabled:
+            Logger.info(f'Profile: {profiler.summary()}')
+            profiler.disable()
 
 
-if __name__ == '__main__':
+def main():
     DentalApp().run()
+
+
+if __name__ == '__main__':
+    main()
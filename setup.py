@@ -20,6 +20,7 @@ setup(
     author_email='contact@dentalapp.com',
     url='https://github.com/dentalapp/dental-mobile-app',
     py_modules=['main'],
+    packages=find_packages(include=['dental', 'dental.*']),
     install_requires=requirements,
     python_requires='>=3.7',
     classifiers=[
@@ -37,7 +38,8 @@ setup(
     keywords='dental healthcare mobile application kivy practice-management',
     entry_points={
         'console_scripts': [
-            'dental-app=main:DentalApp',
+            'dental-app=main:main',
+            'dental=dental.cli:main',
         ],
     },
 )
@@ -0,0 +1,17 @@
+import pytest
+
+from dental.storage import ChangeNotifier, DataManager, DataStore, JsonFileBackend
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path / 'data')
+
+
+@pytest.fixture
+def data_mgr(data_dir):
+    """A DataManager on its own backend and notifier, so nothing is shared between tests"""
+    data_mgr = DataManager(data_dir, backend=JsonFileBackend(DataStore(fsync=False)),
+                           notifier=ChangeNotifier())
+    yield data_mgr
+    data_mgr.backend.close()
@@ -0,0 +1,58 @@
+from datetime import date
+
+from dental.analytics import TreatmentAnalytics, TreatmentColumns, month_starts
+from dental.archive import shared_archive
+
+TREATMENTS = {
+    'T0001': {'patient_id': 'P0001', 'procedure': 'Filling', 'date': '2024-01-15', 'cost': '100'},
+    'T0002': {'patient_id': 'P0002', 'procedure': 'filling', 'date': '2024-03-02', 'cost': '$50.50'},
+    'T0003': {'patient_id': 'P0001', 'procedure': 'Crown', 'date': '2024-01-03', 'cost': '800'},
+    'T0004': {'patient_id': 'P0002', 'procedure': 'Cleaning', 'date': 'unknown', 'cost': 'n/a'},
+}
+
+
+def test_month_starts():
+    assert [date.fromordinal(day) for day in month_starts(
+        date(2023, 12, 20).toordinal(), date(2024, 2, 1).toordinal())] == [
+        date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1)]
+
+
+def test_column_reports():
+    columns = TreatmentColumns(TREATMENTS)
+    assert list(columns.dates) == sorted(columns.dates)
+    assert columns.total() == (95050, 4)
+    assert columns.total(date(2024, 1, 1), date(2024, 2, 1)) == (90000, 2)
+    assert columns.by_month() == [('2024-01', 90000, 2), ('2024-02', 0, 0), ('2024-03', 5050, 1)]
+    assert columns.by_procedure() == [('Crown', 80000, 1), ('Filling', 15050, 2),
+                                      ('Cleaning', 0, 1)]
+    assert columns.by_patient(limit=1) == [('P0001', 90000, 2)]
+
+
+def test_append_only_in_date_order():
+    columns = TreatmentColumns(TREATMENTS)
+    assert columns.append({'date': '2024-04-01', 'cost': '10', 'procedure': 'CROWN'})
+    assert not columns.append({'date': '2023-01-01', 'cost': '10'})
+    assert columns.by_procedure()[0] == ('Crown', 81000, 2)
+
+
+def test_reports_follow_changes(data_mgr):
+    data_mgr.save_treatments(TREATMENTS)
+    analytics = TreatmentAnalytics(data_mgr)
+    assert analytics.total() == (95050, 4)
+    assert analytics.total() is analytics.total()
+
+    data_mgr.put_treatment('T0005', {'procedure': 'Crown', 'date': '2024-05-01', 'cost': '700'})
+    assert analytics.total() == (165050, 5)
+    data_mgr.delete_record(data_mgr.treatments_file, 'T0003')
+    assert analytics.revenue_by_procedure(limit=1) == [('Crown', 70000, 1)]
+
+
+def test_all_time_reports_include_archived_treatments(data_mgr):
+    data_mgr.save_treatments(TREATMENTS)
+    analytics = TreatmentAnalytics(data_mgr)
+    shared_archive(data_mgr).archive(data_mgr, date(2024, 2, 1))
+    assert set(data_mgr.get_treatments()) == {'T0002', 'T0004'}
+    assert analytics.total() == (95050, 4)
+    assert analytics.total(date(2024, 3, 1)) == (5050, 1)
+    assert analytics.revenue_by_month(date(2024, 1, 1), date(2024, 2, 1)) == [
+        ('2024-01', 90000, 2)]
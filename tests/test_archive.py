@@ -0,0 +1,67 @@
+from datetime import date
+
+from dental.archive import Archive, horizon, record_date
+from dental.storage import ARCHIVED
+
+APPOINTMENTS = {
+    'APT0001': {'patient_id': 'P0001', 'date': '2021-03-04', 'time': '09:00'},
+    'APT0002': {'patient_id': 'P0002', 'date': '2021-03-20', 'time': '10:00'},
+    'APT0003': {'patient_id': 'P0001', 'date': '2021-05-02', 'time': '09:00'},
+    'APT0004': {'patient_id': 'P0001', 'date': '2023-01-10', 'time': '09:00'},
+    'APT0005': {'patient_id': 'P0002', 'date': 'someday', 'time': '09:00'},
+}
+
+
+def test_record_date_and_horizon():
+    assert record_date({'date': '2021-03-04'}) == (date(2021, 3, 4), '2021-03')
+    assert record_date({'date': 'someday'}) is None
+    assert record_date({}) is None
+    assert horizon(10, date(2024, 1, 5)) == date(2023, 12, 26)
+
+
+def test_archive_moves_old_records_into_monthly_segments(data_mgr):
+    data_mgr.save_appointments(APPOINTMENTS)
+    events = []
+    data_mgr.subscribe(data_mgr.appointments_file,
+                       lambda event, record_id, record: events.append((event, record_id)))
+    archive = Archive(data_mgr.data_dir)
+    assert archive.before is None and not archive.covers(None)
+
+    assert archive.archive(data_mgr, date(2022, 1, 1)) == {'appointments': 3, 'treatments': 0}
+    assert sorted(data_mgr.get_appointments()) == ['APT0004', 'APT0005']
+    assert sorted(events) == [(ARCHIVED, 'APT0001'), (ARCHIVED, 'APT0002'), (ARCHIVED, 'APT0003')]
+    assert archive.periods('appointments') == ['2021-03', '2021-05']
+    assert archive.get('appointments', 'APT0002') == APPOINTMENTS['APT0002']
+    assert archive.get('appointments', 'APT0004') is None
+    assert sorted(archive.patient_records('appointments', 'P0001')) == ['APT0001', 'APT0003']
+    assert sorted(archive.records_between('appointments', date(2021, 3, 10),
+                                          date(2021, 5, 2))) == ['APT0002']
+    assert archive.covers(date(2021, 12, 31)) and not archive.covers(date(2022, 1, 1))
+    # Archived IDs are never handed out again
+    assert data_mgr.next_appointment_id() == 'APT0006'
+
+
+def test_archiving_again_merges_and_is_seen_by_other_instances(data_mgr):
+    data_mgr.save_appointments(APPOINTMENTS)
+    archive = Archive(data_mgr.data_dir)
+    archive.archive(data_mgr, date(2021, 4, 1))
+    other = Archive(data_mgr.data_dir)
+    assert other.periods('appointments') == ['2021-03']
+
+    # An archived record saved again with a new date moves segments on the next run
+    data_mgr.put_appointment('APT0001', dict(APPOINTMENTS['APT0001'], date='2021-05-09'))
+    assert archive.archive(data_mgr, date(2022, 1, 1))['appointments'] == 2
+    assert other.before == date(2022, 1, 1)
+    assert sorted(other.segment('appointments', '2021-03')) == ['APT0002']
+    assert sorted(other.segment('appointments', '2021-05')) == ['APT0001', 'APT0003']
+    # A run with an earlier horizon does not move the horizon back
+    archive.archive(data_mgr, date(2020, 1, 1))
+    before, collections = other.status()
+    assert before == date(2022, 1, 1)
+    assert collections['appointments'][:2] == (3, 2)
+
+
+def test_archive_never_reaches_past_today(data_mgr):
+    data_mgr.save_appointments({'APT0001': {'patient_id': 'P0001', 'date': '2999-01-01'}})
+    assert Archive(data_mgr.data_dir).archive(data_mgr, date(3000, 1, 1))['appointments'] == 0
+    assert Archive(data_mgr.data_dir).before == date.today()
@@ -0,0 +1,59 @@
+import io
+import json
+import os
+
+import pytest
+
+from dental import compact
+from dental.compact import CompactFormatError, dumps, is_compact, loads
+
+RECORDS = {
+    'P0001': {'name': 'Ada', 'phone': '555', 'age': 36, 'teeth': None},
+    'P0002': {'name': 'Grace', 'phone': '555', 'age': 85, 'teeth': None},
+    'P0003': {'name': 'Zoë\x00', 'tags': ['a', {'b': 1.5}], 'flag': True},
+    'P0004': {},
+}
+
+
+def test_round_trip_keeps_values_and_key_order():
+    raw = dumps(RECORDS)
+    assert is_compact(raw)
+    data = loads(raw)
+    assert data == RECORDS
+    assert [list(record) for record in data.values()] == [list(record) for record in RECORDS.values()]
+
+
+def test_many_records_of_one_shape():
+    records = {f'T{i:05d}': {'procedure': 'Cleaning', 'cost': str(i % 7), 'tooth': i % 32}
+               for i in range(5000)}
+    raw = dumps(records)
+    assert loads(raw) == records
+    assert len(raw) < len(json.dumps(records)) / 3
+
+
+def test_empty_collection():
+    assert loads(dumps({})) == {}
+
+
+def test_truncated_or_foreign_data_is_refused():
+    raw = dumps(RECORDS)
+    with pytest.raises(CompactFormatError):
+        loads(raw[:-3])
+    with pytest.raises(CompactFormatError):
+        loads(b'{"P0001": {}}')
+
+
+def test_load_reads_either_format():
+    assert compact.load(io.BytesIO(dumps(RECORDS))) == RECORDS
+    assert compact.load(io.BytesIO(json.dumps(RECORDS).encode('utf-8'))) == RECORDS
+
+
+def test_convert_rewrites_collection_files(tmp_path):
+    path = tmp_path / 'patients.json'
+    path.write_text(json.dumps(RECORDS, indent=2))
+    sizes = compact.convert(str(tmp_path), 'compact')
+    assert set(sizes) == {'patients'}
+    assert is_compact(path.read_bytes()[:len(compact.MAGIC)])
+    compact.convert(str(tmp_path), 'json')
+    assert json.loads(path.read_text()) == RECORDS
+    assert not os.path.exists(str(path) + '.tmp')
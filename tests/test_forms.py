@@ -0,0 +1,42 @@
+import pytest
+
+from dental.forms import (APPOINTMENT_FORM, PATIENT_FORM, TREATMENT_FORM, validate_cost,
+                          validate_duration, validate_phone, validate_time)
+from dental.schedule import DEFAULT_CHAIR, DEFAULT_DURATION
+
+
+def test_validators():
+    assert validate_time('9:30 am') == '09:30'
+    assert validate_cost(' $99.50 ') == '$99.50'
+    assert validate_phone('+1 (555) 010-1234') == '+1 (555) 010-1234'
+    for validate, text in [(validate_cost, '-5'), (validate_phone, '555-01'),
+                           (validate_phone, 'call me'), (validate_duration, '0'),
+                           (validate_time, 'noon')]:
+        with pytest.raises(ValueError):
+            validate(text)
+
+
+def test_patient_form_reports_every_error_in_order():
+    values, errors = PATIENT_FORM.validate({'name': '  ', 'phone': 'x', 'dob': '1990/01/02'})
+    assert list(errors) == ['name', 'phone', 'dob']
+    assert errors['name'] == 'Patient Name is required'
+    assert values == {'email': ''}
+
+
+def test_appointment_form_fills_defaults_from_rows():
+    values, errors = APPOINTMENT_FORM.validate({'patient_id': 'P0001', 'date': '2024-03-05',
+                                                'time': '14:05'})
+    assert errors == {}
+    assert values == {'patient_id': 'P0001', 'date': '2024-03-05', 'time': '14:05',
+                      'duration': DEFAULT_DURATION, 'chair': DEFAULT_CHAIR, 'reason': ''}
+
+
+def test_treatment_form_cleans_tooth_and_surfaces():
+    texts = {'patient_id': 'P0001', 'procedure': 'Filling', 'date': '2024-03-05',
+             'cost': '120', 'tooth': '14', 'surfaces': 'mod'}
+    values, errors = TREATMENT_FORM.validate(texts)
+    assert errors == {}
+    assert (values['tooth'], values['surfaces']) == (14, 'MOD')
+    _, errors = TREATMENT_FORM.validate(dict(texts, tooth='40', surfaces='X'))
+    assert errors['tooth'] == 'The tooth number must be between 1 and 32'
+    assert 'surfaces' in errors
@@ -0,0 +1,70 @@
+import multiprocessing
+import threading
+
+from dental.ids import IdAllocator, format_id, id_sort_key, parse_id
+from dental.locking import file_lock
+
+
+def allocate(data_dir, count):
+    allocator = IdAllocator(data_dir)
+    return [allocator.next_id('patients') for _ in range(count)]
+
+
+def test_id_helpers():
+    assert format_id('appointments', 7) == 'APT0007'
+    assert parse_id('P10000') == ('P', 10000)
+    assert parse_id('legacy') is None
+    assert sorted(['P10000', 'P9999', 'legacy'], key=id_sort_key) == ['P9999', 'P10000', 'legacy']
+
+
+def test_numbering_continues_after_existing_ids_and_never_reuses(tmp_path):
+    allocator = IdAllocator(str(tmp_path))
+    assert allocator.next_id('patients', lambda: ['P0003', 'P0010', 'odd']) == 'P0011'
+    # The sequence file is the authority from now on: deletions do not free IDs
+    assert allocator.next_id('patients', lambda: []) == 'P0012'
+    assert allocator.next_ids('treatments', 3) == ['T0001', 'T0002', 'T0003']
+
+
+def test_reserve_moves_the_sequence_past_imported_ids(tmp_path):
+    allocator = IdAllocator(str(tmp_path))
+    allocator.reserve('patients', 'P0042')
+    allocator.reserve('patients', 'P0007')
+    allocator.reserve('patients', 'T9999')
+    assert allocator.next_id('patients') == 'P0043'
+
+
+def test_threads_and_processes_never_share_an_id(tmp_path):
+    data_dir = str(tmp_path)
+    allocated = []
+
+    def run():
+        allocated.extend(allocate(data_dir, 20))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    with multiprocessing.get_context('spawn').Pool(2) as pool:
+        results = pool.starmap_async(allocate, [(data_dir, 20), (data_dir, 20)])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for ids in results.get(timeout=60):
+            allocated.extend(ids)
+    assert len(allocated) == len(set(allocated)) == 100
+
+
+def test_file_lock_is_reentrant_and_exclusive(tmp_path):
+    path = str(tmp_path / 'data.lock')
+    entered = threading.Event()
+
+    def hold():
+        with file_lock(path):
+            entered.set()
+
+    other = threading.Thread(target=hold)
+    with file_lock(path):
+        with file_lock(path):
+            pass
+        other.start()
+        assert not entered.wait(0.2)
+    assert entered.wait(5)
+    other.join()
@@ -0,0 +1,32 @@
+from datetime import date
+
+from dental.archive import shared_archive
+from dental.indexes import RecordIndexes
+
+
+def test_patient_ids_follow_changes(data_mgr):
+    data_mgr.put_appointment('A0001', {'patient_id': 'P0001', 'date': '2024-03-05'})
+    data_mgr.put_treatment('T0001', {'patient_id': 'P0001', 'date': '2024-03-05'})
+    indexes = RecordIndexes(data_mgr)
+    assert indexes.appointment_ids_for('P0001') == {'A0001'}
+    assert indexes.treatment_ids_for('P0001') == {'T0001'}
+
+    data_mgr.put_appointment('A0001', {'patient_id': 'P0002', 'date': '2024-03-05'})
+    data_mgr.put_treatment('T0002', {'patient_id': 'P0001', 'date': '2024-03-06'})
+    data_mgr.delete_record(data_mgr.treatments_file, 'T0001')
+    assert indexes.appointment_ids_for('P0001') == set()
+    assert indexes.appointment_ids_for('P0002') == {'A0001'}
+    assert indexes.treatment_ids_for('P0001') == {'T0002'}
+    assert 'P0001' not in indexes.appointments_by_patient
+
+
+def test_patient_history_includes_archived_records(data_mgr):
+    data_mgr.put_treatment('T0001', {'patient_id': 'P0001', 'date': '2019-01-10'})
+    data_mgr.put_treatment('T0002', {'patient_id': 'P0001', 'date': '2024-03-05'})
+    data_mgr.put_treatment('T0003', {'patient_id': 'P0002', 'date': '2019-01-10'})
+    indexes = RecordIndexes(data_mgr)
+    shared_archive(data_mgr).archive(data_mgr, date(2020, 1, 1))
+    assert indexes.treatment_ids_for('P0001') == {'T0002'}
+    appointments, treatments = indexes.patient_history('P0001')
+    assert appointments == {}
+    assert set(treatments) == {'T0001', 'T0002'}
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from dental.journal import COMPACTING_SUFFIX, JOURNAL_SUFFIX, JournalBackend
+from dental.storage import JsonFileBackend, StaleDataError, create_backend
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'patients.json')
+
+
+def reopen(path):
+    backend = JournalBackend(fsync=False)
+    try:
+        return backend.load(path)
+    finally:
+        backend.close()
+
+
+def test_writes_are_appended_and_replayed(path):
+    backend = JournalBackend(fsync=False)
+    backend.put(path, 'P0001', {'name': 'Ada'})
+    backend.put_many(path, {'P0002': {'name': 'Grace'}, 'P0003': {'name': 'Mary'}})
+    backend.delete(path, 'P0003')
+    backend.close()
+    assert not os.path.exists(path)
+    with open(path + JOURNAL_SUFFIX) as f:
+        assert [json.loads(line)['op'] for line in f] == ['put', 'put', 'put', 'del']
+    assert reopen(path) == {'P0001': {'name': 'Ada'}, 'P0002': {'name': 'Grace'}}
+
+
+def test_save_journals_only_the_differences(path):
+    backend = JournalBackend(fsync=False)
+    backend.save(path, {'P0001': {'name': 'Ada'}, 'P0002': {'name': 'Grace'}})
+    version = backend.version(path)
+    backend.save(path, {'P0001': {'name': 'Ada'}, 'P0003': {'name': 'Mary'}},
+                 expected_version=version)
+    with pytest.raises(StaleDataError):
+        backend.save(path, {}, expected_version=version)
+    backend.close()
+    with open(path + JOURNAL_SUFFIX) as f:
+        assert len(f.readlines()) == 4
+    assert reopen(path) == {'P0001': {'name': 'Ada'}, 'P0003': {'name': 'Mary'}}
+
+
+def test_torn_last_line_is_cut_off(path):
+    with open(path + JOURNAL_SUFFIX, 'wb') as f:
+        f.write(b'{"op":"put","id":"P0001","record":{"name":"Ada"}}\n{"op":"put","id":"P00')
+    backend = JournalBackend(fsync=False)
+    backend.put(path, 'P0002', {'name': 'Grace'})
+    backend.close()
+    assert reopen(path) == {'P0001': {'name': 'Ada'}, 'P0002': {'name': 'Grace'}}
+
+
+def test_compaction_writes_a_snapshot_the_json_backend_reads(path):
+    backend = JournalBackend(compact_threshold=3, fsync=False)
+    for number in range(7):
+        backend.put(path, f'P{number:04d}', {'name': str(number)})
+    backend.compact(path)
+    backend.close()
+    assert not os.path.exists(path + COMPACTING_SUFFIX)
+    assert os.path.getsize(path + JOURNAL_SUFFIX) == 0
+    assert len(JsonFileBackend().load(path)) == 7
+
+
+def test_interrupted_compaction_is_replayed(path):
+    backend = JournalBackend(fsync=False)
+    backend.put(path, 'P0001', {'name': 'Ada'})
+    backend.close()
+    os.replace(path + JOURNAL_SUFFIX, path + COMPACTING_SUFFIX)
+    backend = JournalBackend(fsync=False)
+    backend.put(path, 'P0002', {'name': 'Grace'})
+    backend.compact(path)
+    backend.close()
+    assert not os.path.exists(path + COMPACTING_SUFFIX)
+    assert reopen(path) == {'P0001': {'name': 'Ada'}, 'P0002': {'name': 'Grace'}}
+
+
+def test_backends_by_name():
+    assert isinstance(create_backend('journal'), JournalBackend)
+    with pytest.raises(ValueError):
+        create_backend('floppy')
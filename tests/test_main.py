@@ -0,0 +1,130 @@
+import os
+import random
+import subprocess
+import sys
+from operator import attrgetter
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('SDL_VIDEODRIVER', 'offscreen')
+main = pytest.importorskip('main')
+
+from dental.records import Treatment  # noqa: E402
+from dental.storage import ADDED, ARCHIVED, REMOVED, UPDATED  # noqa: E402
+
+# The @mainthread handler itself, called directly rather than on the next frame
+on_treatments_changed = main.DentalChartScreen.on_treatments_changed.__wrapped__
+
+
+def chart_screen(patient_id, treatment_ids=()):
+    screen = SimpleNamespace(patient_id=patient_id, treatment_ids=set(treatment_ids), shown=[])
+    screen.show_patient = screen.shown.append
+    return screen
+
+
+def test_chart_redraws_when_a_shown_treatment_is_removed():
+    screen = chart_screen('P0001', {'T0001'})
+    on_treatments_changed(screen, REMOVED, 'T0001', None)
+    assert screen.shown == ['P0001']
+
+
+def test_chart_ignores_removals_of_other_patients_treatments():
+    screen = chart_screen('P0001', {'T0001'})
+    on_treatments_changed(screen, REMOVED, 'T0002', None)
+    assert screen.shown == []
+
+
+def test_chart_redraws_for_a_new_treatment_of_its_patient():
+    screen = chart_screen('P0001')
+    on_treatments_changed(screen, ADDED, 'T0003', {'patient_id': 'P0001'})
+    on_treatments_changed(screen, ADDED, 'T0004', {'patient_id': 'P0002'})
+    assert screen.shown == ['P0001']
+
+
+def test_chart_redraws_when_a_treatment_moves_to_another_patient():
+    screen = chart_screen('P0001', {'T0001'})
+    on_treatments_changed(screen, UPDATED, 'T0001', {'patient_id': 'P0002'})
+    assert screen.shown == ['P0001']
+
+
+def test_chart_without_a_patient_ignores_changes():
+    screen = chart_screen(None)
+    on_treatments_changed(screen, REMOVED, 'T0001', None)
+    on_treatments_changed(screen, ARCHIVED, 'T0001', {'patient_id': 'P0001'})
+    assert screen.shown == []
+
+
+def test_deleting_a_treatment_sends_removed_without_a_record(data_mgr):
+    events = []
+    data_mgr.put_treatment('T0001', {'patient_id': 'P0001', 'procedure': 'Filling'})
+    data_mgr.subscribe(data_mgr.treatments_file, lambda *event: events.append(event))
+    data_mgr.delete_record(data_mgr.treatments_file, 'T0001')
+    assert events == [(REMOVED, 'T0001', None)]
+
+
+def test_sync_is_only_imported_when_configured():
+    env = dict(os.environ)
+    env.pop('DENTAL_SYNC_URL', None)
+    result = subprocess.run(
+        [sys.executable, '-c', "import sys, main; print('dental.sync' in sys.modules)"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env,
+        capture_output=True, text=True, timeout=60)
+    assert result.stdout.strip().splitlines()[-1] == 'False'
+
+
+def treatment(number, day):
+    return Treatment.from_dict(f'T{number:04d}', {'date': f'2024-03-{day:02d}'})
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_record_list_stays_sorted_through_upserts_and_removals(reverse):
+    sort_key = attrgetter('sort_key')
+    rows = main.RecordList(None, main.TreatmentRow, 100, sort_key=sort_key, reverse=reverse)
+    rows.set_rows([treatment(number, number % 5 + 1) for number in range(20)])
+    shuffle = random.Random(7)
+    for step in range(200):
+        number = shuffle.randrange(30)
+        if shuffle.random() < 0.3:
+            rows.remove_row(f'T{number:04d}')
+        else:
+            rows.upsert_row(treatment(number, shuffle.randrange(1, 8)))
+        assert [sort_key(row) for row in rows.data] == sorted(
+            (sort_key(row) for row in rows.data), reverse=reverse)
+        assert {row.id for row in rows.data} == set(rows.rows)
+    assert len(rows.data) == len(rows.rows)
+
+
+def test_record_list_ranked_rows_keep_their_order():
+    rows = main.RecordList(None, main.TreatmentRow, 100, sort_key=attrgetter('sort_key'))
+    rows.set_ranked_rows([treatment(2, 1), treatment(1, 9)])
+    rows.upsert_row(treatment(2, 5))
+    rows.upsert_row(treatment(3, 1))
+    rows.remove_row('T0001')
+    assert [row.id for row in rows.data] == ['T0002', 'T0003']
+    rows.set_rows(rows.data)
+    assert [row.id for row in rows.data] == ['T0003', 'T0002']
+
+
+def test_failed_save_shows_the_error_and_reenables_the_dialog():
+    popup = SimpleNamespace(save_btn=SimpleNamespace(text='Save', disabled=False),
+                            error_label=SimpleNamespace(text=''))
+    main.set_saving(popup, True)
+    main.fail_saving(popup, 'patient', OSError('disk full'))
+    assert (popup.save_btn.text, popup.save_btn.disabled) == ('Save', False)
+    assert popup.error_label.text == 'Could not save the patient: disk full'
+
+
+@pytest.mark.parametrize('cost, shown', [('$1,200', '$1,200.00'), ('80', '$80.00'),
+                                         ('n/a', 'n/a'), (None, 'N/A')])
+def test_treatment_row_formats_the_cost(cost, shown):
+    row = SimpleNamespace(title_label=SimpleNamespace(), detail_label=SimpleNamespace(),
+                          notes_label=SimpleNamespace(),
+                          owner=SimpleNamespace(patient_names=SimpleNamespace(
+                              name_for=lambda record: 'Ada')))
+    fields = {'date': '2024-03-05', 'procedure': 'Filling'}
+    if cost is not None:
+        fields['cost'] = cost
+    main.TreatmentRow.bind_record(row, Treatment.from_dict('T0001', fields))
+    assert row.detail_label.text == f'Date: 2024-03-05 | Cost: {shown}'
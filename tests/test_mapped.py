@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from dental.mapped import INDEX_SUFFIX, MappedCollection, build_index
+from dental.storage import DataStore
+
+RECORDS = {
+    'P0001': {'name': 'Ada', 'phone': '555'},
+    'P0002': {'name': 'Zoë "Z"', 'notes': []},
+    'P\\3': {'name': 'escaped key'},
+}
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'patients.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(RECORDS, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def test_reads_records_without_parsing_the_file(path):
+    mapped = MappedCollection.open(path)
+    try:
+        assert len(mapped) == 3
+        assert mapped.get('P0002') == RECORDS['P0002']
+        assert mapped.get('P\\3') == RECORDS['P\\3']
+        assert mapped.get('P9999') is None
+        assert 'P0001' in mapped and 'P0009' not in mapped
+        assert list(mapped.keys()) == list(RECORDS)
+        assert dict(mapped.items()) == RECORDS
+    finally:
+        mapped.close()
+    assert os.path.exists(path + INDEX_SUFFIX)
+
+
+def test_saved_index_is_reused(path):
+    MappedCollection.open(path).close()
+    mapped = MappedCollection.open(path)
+    try:
+        assert mapped._index_map is not None
+        assert dict(mapped.items()) == RECORDS
+    finally:
+        mapped.close()
+
+
+def test_unmappable_files(tmp_path):
+    empty = tmp_path / 'empty.json'
+    empty.write_bytes(b'')
+    assert MappedCollection.open(str(empty)) is None
+    listing = tmp_path / 'list.json'
+    listing.write_bytes(b'[1, 2]')
+    assert MappedCollection.open(str(listing)) is None
+    with pytest.raises(ValueError):
+        build_index(b'[1, 2]')
+
+
+def test_iteration_outlives_close(path):
+    mapped = MappedCollection.open(path)
+    items = mapped.items()
+    mapped.close()
+    assert dict(items) == RECORDS
+    assert mapped._data.closed
+    with pytest.raises(ValueError):
+        mapped.keys()
+
+
+def test_dropped_iteration_releases_the_mapping(path):
+    mapped = MappedCollection.open(path)
+    keys = mapped.keys()
+    assert next(keys) == 'P0001'
+    mapped.close()
+    assert not mapped._data.closed
+    del keys
+    assert mapped._data.closed
+
+
+def test_iteration_survives_a_save_of_the_same_file(path):
+    store = DataStore(fsync=False)
+    items = store.iter_records(path)
+    ids = store.record_ids(path)
+    assert store.mapped_reads == 2
+    assert next(items) == ('P0001', RECORDS['P0001'])
+    store.put(path, {'P0001': {'name': 'Replaced'}})
+    assert list(items) == list(RECORDS.items())[1:]
+    assert list(ids) == list(RECORDS)
+    assert dict(store.iter_records(path)) == {'P0001': {'name': 'Replaced'}}
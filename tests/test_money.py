@@ -0,0 +1,16 @@
+from dental.money import format_cents, parse_cents
+
+
+def test_parse_cents():
+    assert parse_cents('150') == 15000
+    assert parse_cents('$1,200.5') == 120050
+    assert parse_cents(99) == 9900
+    assert parse_cents(99.5) == 9950
+    assert parse_cents('free') is None
+    assert parse_cents(None) is None
+    assert parse_cents(True) is None
+
+
+def test_format_cents():
+    assert format_cents(120050) == '1,200.50'
+    assert format_cents(-5) == '-0.05'
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from dental.profiling import Profiler, TraceWriter, enable_from_env, profiler
+
+
+@pytest.fixture
+def enabled(tmp_path):
+    trace_path = str(tmp_path / 'logs' / 'trace.jsonl')
+    profiler.recent.clear()
+    profiler.totals.clear()
+    profiler.enable(trace_path)
+    yield trace_path
+    profiler.disable()
+
+
+def test_spans_nest_and_collect_details():
+    timings = Profiler()
+    outer = timings.start('load', 'patients.json')
+    timings.detail('parse', 'patients.json', 0.002, bytes=100)
+    timings.detail('parse', 'patients.json', 0.001, bytes=50)
+    inner = timings.start('build', 'row')
+    timings.stop(inner)
+    event = timings.stop(outer, rows=3)
+    assert (event['kind'], event['name'], event['rows']) == ('load', 'patients.json', 3)
+    assert (event['parse_ms'], event['bytes']) == (3.0, 150)
+    # Outside a span a detail is an event of its own
+    timings.detail('parse', 'other.json', 0.5)
+    assert [e['kind'] for e in timings.recent] == ['build', 'load', 'parse']
+    assert timings.summary()['parse'] == {'count': 1, 'total_ms': 500.0, 'max_ms': 500.0}
+
+
+def test_trace_file_rotates(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    writer = TraceWriter(path, max_bytes=60, backups=2)
+    writer.put({'n': 0})
+    writer.close()
+    for index in range(1, 5):
+        writer._write(json.dumps({'n': index, 'pad': 'x' * 30}) + '\n')
+    assert [json.loads(line)['n'] for line in open(path)] == [4]
+    assert [json.loads(line)['n'] for line in open(path + '.1')] == [3]
+    assert [json.loads(line)['n'] for line in open(path + '.2')] == [2]
+    assert not (tmp_path / 'trace.jsonl.3').exists()
+
+
+def test_data_manager_calls_are_timed(enabled, data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    data_mgr.get_patients()
+    profiler.disable()
+    kinds = [event['kind'] for event in profiler.recent]
+    assert 'put' in kinds and 'load' in kinds
+    with open(enabled) as f:
+        traced = [json.loads(line) for line in f]
+    assert [event['kind'] for event in traced] == kinds
+
+
+def test_enable_from_env(monkeypatch):
+    monkeypatch.setenv('DENTAL_PROFILE', 'off')
+    assert not enable_from_env()
+    monkeypatch.setenv('DENTAL_PROFILE', '1')
+    monkeypatch.setenv('DENTAL_PROFILE_FILE', '')
+    try:
+        assert enable_from_env()
+        assert profiler.enabled and profiler._writer is None
+    finally:
+        profiler.disable()
@@ -0,0 +1,70 @@
+from datetime import date, time
+
+import pytest
+
+from dental.records import Appointment, Patient, Treatment
+
+
+def test_round_trip_keeps_non_canonical_values():
+    stored = {'patient_id': 'P0001', 'procedure': 'Filling', 'date': '2024-03-05',
+              'cost': '$1,200', 'tooth': 14, 'custom': [1, 2]}
+    treatment = Treatment.from_dict('T0001', stored)
+    assert treatment.date == date(2024, 3, 5)
+    assert treatment.cents == 120000
+    assert treatment.notes is None
+    assert treatment.extra == {'cost': '$1,200', 'custom': [1, 2]}
+    assert treatment.to_dict() == stored
+
+
+def test_canonical_values_are_parsed_and_not_kept():
+    appointment = Appointment.from_dict('A0001', {'date': '2024-03-05', 'time': '09:30',
+                                                  'duration': 45, 'status': 'pending'})
+    assert appointment.time == time(9, 30)
+    assert appointment.extra is None
+    assert appointment.start.hour == 9
+
+
+def test_unparseable_values_are_kept_as_stored():
+    appointment = Appointment.from_dict('A0001', {'date': 'soon', 'time': '9:30 AM'})
+    assert appointment.date is None
+    assert appointment.time == time(9, 30)
+    assert appointment.to_dict() == {'date': 'soon', 'time': '9:30 AM'}
+    assert appointment.sort_key == (1, 'soon', '9:30 AM')
+
+
+def test_get_reads_the_stored_form():
+    treatment = Treatment.from_dict('T0001', {'date': '2024-03-05', 'cost': '80.50',
+                                              'size_hint': [1, None]})
+    assert treatment.get('cost') == '80.50'
+    assert treatment.get('date') == '2024-03-05'
+    assert treatment.get('notes', 'none') == 'none'
+    assert treatment.get('size_hint') == [1, None]
+    assert treatment.get('height') is None
+
+
+def test_replace_drops_stale_stored_forms():
+    treatment = Treatment.from_dict('T0001', {'cost': '$80', 'procedure': 'Cleaning'})
+    changed = treatment.replace(cents=9000)
+    assert changed.to_dict() == {'cost': '90', 'procedure': 'Cleaning'}
+    assert treatment.to_dict() == {'cost': '$80', 'procedure': 'Cleaning'}
+    with pytest.raises(TypeError):
+        treatment.replace(colour='red')
+
+
+def test_equality_and_constructor():
+    patient = Patient('P0001', name='Ada', dob=date(1990, 1, 2))
+    assert patient.to_dict() == {'name': 'Ada', 'dob': '1990-01-02'}
+    assert patient == Patient.from_dict('P0001', {'name': 'Ada', 'dob': '1990-01-02'})
+    assert patient != Patient('P0002', name='Ada', dob=date(1990, 1, 2))
+    with pytest.raises(TypeError):
+        Patient('P0001', colour='red')
+
+
+def test_typed_records_from_the_data_manager(data_mgr):
+    data_mgr.put_record(data_mgr.treatments_file, 'T0001',
+                        {'patient_id': 'P0001', 'date': '2024-03-05', 'cost': 80})
+    treatment, = data_mgr.load_records('treatments')
+    assert treatment.cents == 8000
+    assert data_mgr.load_records('treatments')[0] is treatment
+    assert data_mgr.get_typed('treatments', 'T0001') == treatment
+    assert data_mgr.get_typed('treatments', 'T0009') is None
@@ -0,0 +1,54 @@
+from datetime import date, datetime
+
+import pytest
+
+from dental.schedule import (AppointmentSchedule, SchedulingConflict, parse_start, parse_time,
+                             shift_window, window_bounds)
+
+
+def appointment(day, start, duration=30, chair='1', status='pending'):
+    return {'patient_id': 'P0001', 'date': day, 'time': start, 'duration': duration,
+            'chair': chair, 'status': status}
+
+
+def test_parsing_and_windows():
+    assert parse_start('2024-03-05', '09:30') == datetime(2024, 3, 5, 9, 30)
+    assert parse_start('2024-03-05', '9:30 am') == datetime(2024, 3, 5, 9, 30)
+    with pytest.raises(ValueError):
+        parse_time('half past nine')
+    assert window_bounds(date(2024, 3, 6), 'week') == (date(2024, 3, 4), date(2024, 3, 11))
+    assert window_bounds(date(2024, 12, 6), 'month') == (date(2024, 12, 1), date(2025, 1, 1))
+    assert shift_window(date(2024, 12, 6), 'month', 1) == date(2025, 1, 1)
+    assert shift_window(date(2024, 3, 6), 'day', -1) == date(2024, 3, 5)
+
+
+def test_book_refuses_an_overlap_and_offers_free_slots(data_mgr):
+    schedule = AppointmentSchedule(data_mgr)
+    schedule.book('A0001', appointment('2024-03-05', '09:00', duration=60))
+    with pytest.raises(SchedulingConflict) as raised:
+        schedule.book('A0002', appointment('2024-03-05', '09:30'))
+    assert raised.value.conflicts == ['A0001']
+    assert raised.value.free_slots[0] == (datetime(2024, 3, 5, 10, 0), datetime(2024, 3, 5, 10, 30))
+
+    schedule.book('A0002', appointment('2024-03-05', '09:30', chair='2'))
+    schedule.book('A0003', appointment('2024-03-05', '09:30', status='cancelled'))
+    assert set(data_mgr.get_appointments()) == {'A0001', 'A0002', 'A0003'}
+    with pytest.raises(ValueError):
+        schedule.check(appointment('someday', '09:00'))
+
+
+def test_ids_between_follows_changes(data_mgr):
+    data_mgr.put_appointment('A0001', appointment('2024-03-05', '11:00'))
+    data_mgr.put_appointment('A0002', appointment('2024-03-05', '09:00', chair='2'))
+    data_mgr.put_appointment('A0003', appointment('2024-03-05', '10:00', status='cancelled'))
+    data_mgr.put_appointment('A0004', appointment('whenever', '10:00'))
+    schedule = AppointmentSchedule(data_mgr)
+    day = (datetime(2024, 3, 5), datetime(2024, 3, 6))
+    assert schedule.ids_between(*day) == ['A0002', 'A0003', 'A0001']
+
+    data_mgr.put_appointment('A0001', appointment('2024-03-06', '11:00'))
+    data_mgr.put_appointment('A0003', appointment('2024-03-05', '08:00'))
+    data_mgr.delete_record(data_mgr.appointments_file, 'A0002')
+    assert schedule.ids_between(*day) == ['A0003']
+    assert schedule.conflicts('1', datetime(2024, 3, 5, 8, 15), datetime(2024, 3, 5, 8, 45)) == [
+        'A0003']
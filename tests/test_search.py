@@ -0,0 +1,45 @@
+from dental.search import PatientSearchIndex, tokenize, within_one_edit
+
+PATIENTS = {
+    'P0001': {'name': 'Ada Lovelace', 'phone': '(555) 123-4567', 'email': 'ada@example.com'},
+    'P0002': {'name': 'Grace Hopper', 'phone': '555 987 6543', 'email': 'grace@navy.mil'},
+    'P0003': {'name': 'Adam Smith', 'phone': '', 'email': None},
+}
+
+
+def make_index():
+    index = PatientSearchIndex()
+    index.add_many(PATIENTS.items())
+    return index
+
+
+def test_tokenize_and_edit_distance():
+    assert tokenize('Ada  LOVELACE-King') == ['ada', 'lovelace', 'king']
+    assert tokenize(None) == []
+    assert within_one_edit('hopper', 'hoper')
+    assert within_one_edit('hopper', 'hopepr')
+    assert not within_one_edit('hopper', 'hooper1')
+
+
+def test_exact_prefix_and_typo_matches():
+    index = make_index()
+    assert index.search('ada') == ['P0001', 'P0003']
+    assert index.search('ad') == ['P0001', 'P0003']
+    assert index.search('ada smith') == ['P0003']
+    assert index.search('hoper') == ['P0002']
+    assert index.search('5551234567') == ['P0001']
+    assert index.search('navy') == ['P0002']
+    assert index.search('nobody') == []
+    assert index.search('   ') == []
+
+
+def test_changes_update_the_index(data_mgr):
+    data_mgr.save_patients(PATIENTS)
+    index = PatientSearchIndex(data_mgr)
+    assert len(index) == 3
+    data_mgr.put_patient('P0002', {'name': 'Grace Brewster'})
+    data_mgr.delete_record(data_mgr.patients_file, 'P0003')
+    assert index.search('hopper') == []
+    assert index.search('brewster') == ['P0002']
+    assert index.search('smith') == []
+    assert len(index) == 2
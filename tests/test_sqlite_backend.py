@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+from dental.sqlite_backend import DB_NAME, ITER_BATCH, SqliteBackend, migrate_json_to_sqlite
+from dental.storage import ChangeNotifier, DataManager, StaleDataError
+
+
+@pytest.fixture
+def data_mgr(data_dir):
+    data_mgr = DataManager(data_dir, backend=SqliteBackend(), notifier=ChangeNotifier())
+    yield data_mgr
+    data_mgr.backend.close()
+
+
+def test_json_files_are_imported_once(data_dir):
+    os.makedirs(data_dir)
+    with open(os.path.join(data_dir, 'patients.json'), 'w') as f:
+        json.dump({'P0001': {'name': 'Ada'}}, f)
+    db_path = os.path.join(data_dir, DB_NAME)
+    assert migrate_json_to_sqlite(data_dir, db_path) == {
+        'patients': 1, 'appointments': 0, 'treatments': 0}
+    assert migrate_json_to_sqlite(data_dir, db_path) == {}
+
+    backend = SqliteBackend()
+    try:
+        assert backend.load(os.path.join(data_dir, 'patients.json')) == {'P0001': {'name': 'Ada'}}
+    finally:
+        backend.close()
+
+
+def test_records_round_trip(data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    data_mgr.put_patient('P0002', {'name': 'Grace'})
+    data_mgr.delete_record(data_mgr.patients_file, 'P0001')
+    assert data_mgr.get_patients() == {'P0002': {'name': 'Grace'}}
+    assert data_mgr.get_patient('P0001') is None
+    assert list(data_mgr.backend.keys(data_mgr.patients_file)) == ['P0002']
+
+
+def test_items_are_paged_when_not_cached(data_dir):
+    path = os.path.join(data_dir, 'treatments.json')
+    os.makedirs(data_dir)
+    backend = SqliteBackend()
+    try:
+        records = {f'T{i:05d}': {'procedure': 'Cleaning'} for i in range(ITER_BATCH * 2 + 3)}
+        backend.save(path, records)
+    finally:
+        backend.close()
+    backend = SqliteBackend()
+    try:
+        assert dict(backend.items(path)) == records
+    finally:
+        backend.close()
+
+
+def test_find_uses_indexed_and_scanned_fields(data_mgr):
+    data_mgr.put_record(data_mgr.appointments_file, 'A0001',
+                        {'patient_id': 'P0001', 'date': '2024-03-05', 'reason': 'Pain'})
+    data_mgr.put_record(data_mgr.appointments_file, 'A0002',
+                        {'patient_id': 'P0002', 'date': '2024-03-05', 'reason': 'Check'})
+    assert set(data_mgr.find_records(data_mgr.appointments_file, 'date', '2024-03-05')) == {
+        'A0001', 'A0002'}
+    assert list(data_mgr.find_records(data_mgr.appointments_file, 'patient_id', 'P0002')) == [
+        'A0002']
+    assert list(data_mgr.find_records(data_mgr.appointments_file, 'reason', 'Pain')) == ['A0001']
+
+
+def test_stale_save_is_refused(data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    data, version = data_mgr.load_versioned(data_mgr.patients_file)
+    data_mgr.put_patient('P0002', {'name': 'Grace'})
+    with pytest.raises(StaleDataError):
+        data_mgr.backend.save(data_mgr.patients_file, {**data, 'P0003': {'name': 'Mary'}},
+                              expected_version=version)
@@ -0,0 +1,31 @@
+from dental.stats import PracticeStats
+
+
+def test_counters_follow_changes(data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    data_mgr.put_appointment('A0001', {'date': '2024-03-05', 'status': 'pending'})
+    data_mgr.put_treatment('T0001', {'date': '2024-03-05', 'cost': '80'})
+    stats = PracticeStats(data_mgr)
+    changes = []
+    stats.add_listener(lambda: changes.append(1))
+    assert (stats.patients_total, stats.appointments_on('2024-03-05'),
+            stats.revenue_on('2024-03-05')) == (1, 1, 8000)
+
+    data_mgr.put_patient('P0002', {'name': 'Grace'})
+    data_mgr.put_appointment('A0001', {'date': '2024-03-06', 'status': 'pending'})
+    data_mgr.put_treatment('T0001', {'date': '2024-03-05', 'cost': '$1,000'})
+    data_mgr.put_treatment('T0002', {'date': '2024-03-05', 'cost': 'n/a'})
+    assert stats.patients_total == 2
+    assert stats.appointments_on('2024-03-05') == 0
+    assert stats.appointments_on('2024-03-06') == 1
+    data_mgr.put_appointment('A0002', {'date': '2024-03-06', 'status': 'cancelled'})
+    data_mgr.put_appointment('A0001', {'date': '2024-03-06', 'status': 'confirmed'})
+    assert [stats.appointments_with_status(status)
+            for status in ('pending', 'confirmed', 'cancelled')] == [0, 1, 1]
+    assert stats.revenue_on('2024-03-05') == 100000
+
+    data_mgr.delete_record(data_mgr.patients_file, 'P0001')
+    data_mgr.archive_records(data_mgr.treatments_file, ['T0001'])
+    assert stats.patients_total == 1
+    assert stats.revenue_on('2024-03-05') == 0
+    assert len(changes) == 8
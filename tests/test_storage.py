@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+
+import pytest
+
+from dental.storage import (ADDED, ARCHIVED, REMOVED, UPDATED, DataStore, StaleDataError,
+                            diff_records, read_data_file)
+
+
+def test_empty_file_is_an_empty_collection_without_retrying(tmp_path):
+    path = tmp_path / 'patients.json'
+    path.write_bytes(b'')
+    started = time.perf_counter()
+    assert read_data_file(str(path)) == {}
+    assert time.perf_counter() - started < 0.05
+
+
+def test_damaged_file_is_never_read_as_empty(tmp_path):
+    path = tmp_path / 'patients.json'
+    path.write_text('{"P0001": {"name": ')
+    with pytest.raises(ValueError, match='could not be decoded'):
+        read_data_file(str(path), retries=1)
+
+
+def test_put_replaces_the_cached_copy_and_moves_the_version(tmp_path):
+    path = str(tmp_path / 'patients.json')
+    store = DataStore(fsync=False)
+    store.put(path, {'P0001': {'name': 'Ada'}})
+    version = store.version(path)
+    store.put(path, {'P0001': {'name': 'Bob'}})
+    assert store.version(path) != version
+    assert store.get(path) == {'P0001': {'name': 'Bob'}}
+    assert not os.path.exists(path + '.tmp')
+    assert DataStore(fsync=False).get_record(path, 'P0001') == {'name': 'Bob'}
+
+
+def test_other_writers_are_noticed(tmp_path):
+    path = str(tmp_path / 'patients.json')
+    ours, theirs = DataStore(fsync=False), DataStore(fsync=False)
+    ours.put(path, {'P0001': {'name': 'Ada'}})
+    theirs.put(path, {'P0002': {'name': 'Grace'}})
+    assert ours.get(path) == {'P0002': {'name': 'Grace'}}
+
+
+def test_stale_save_is_refused(data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    data, version = data_mgr.load_versioned(data_mgr.patients_file)
+    data_mgr.put_patient('P0002', {'name': 'Grace'})
+    data['P0003'] = {'name': 'Mary'}
+    with pytest.raises(StaleDataError):
+        data_mgr.save_data(data_mgr.patients_file, data, expected_version=version)
+    assert set(data_mgr.get_patients()) == {'P0001', 'P0002'}
+
+
+def test_concurrent_record_writes_keep_every_record(data_mgr):
+    def write(start):
+        for number in range(start, start + 20):
+            data_mgr.put_patient(f'P{number:04d}', {'name': str(number)})
+
+    threads = [threading.Thread(target=write, args=(start,)) for start in (0, 100, 200)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(data_mgr.get_patients()) == 60
+
+
+def test_listeners_get_each_change(data_mgr):
+    events = []
+    data_mgr.subscribe(data_mgr.patients_file, lambda *change: events.append(change))
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    data_mgr.put_patient('P0001', {'name': 'Ada L'})
+    data_mgr.save_patients({'P0002': {'name': 'Grace'}})
+    assert events[:2] == [(ADDED, 'P0001', {'name': 'Ada'}), (UPDATED, 'P0001', {'name': 'Ada L'})]
+    assert sorted(events[2:]) == [(ADDED, 'P0002', {'name': 'Grace'}), (REMOVED, 'P0001', None)]
+
+
+def test_archived_records_are_reported_as_archived(data_mgr):
+    events = []
+    data_mgr.put_treatment('T0001', {'date': '2020-01-01'})
+    data_mgr.subscribe(data_mgr.treatments_file, lambda *change: events.append(change))
+    data_mgr.archive_records(data_mgr.treatments_file, ['T0001'])
+    assert events == [(ARCHIVED, 'T0001', {'date': '2020-01-01'})]
+    assert data_mgr.get_treatments() == {}
+
+
+def test_change_during_subscribe_and_load_is_applied_after_the_load(data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    lock = threading.RLock()
+    seen = {}
+    arrived = threading.Event()
+
+    def on_change(event, patient_id, patient):
+        if event is not None:
+            arrived.set()
+        with lock:
+            seen[patient_id] = patient
+
+    writer = threading.Thread(target=data_mgr.put_patient, args=('P0002', {'name': 'Grace'}))
+
+    def load(patients):
+        # The writer's event is delivered while the records are being loaded
+        writer.start()
+        assert arrived.wait(5)
+        assert 'P0002' not in seen
+        seen.update(patients)
+
+    data_mgr.subscribe_and_load(data_mgr.patients_file, on_change, lock, load)
+    writer.join()
+    assert seen == {'P0001': {'name': 'Ada'}, 'P0002': {'name': 'Grace'}}
+
+    replayed = {}
+    data_mgr.subscribe_and_load(data_mgr.patients_file,
+                                lambda event, patient_id, patient: replayed.update(
+                                    {patient_id: event}), lock)
+    assert replayed == {'P0001': None, 'P0002': None}
+
+
+def test_diff_records():
+    old = {'A': {'x': 1}, 'B': {'x': 2}}
+    new = {'B': {'x': 3}, 'C': {'x': 4}}
+    assert sorted(diff_records(old, new)) == [
+        (ADDED, 'C', {'x': 4}), (REMOVED, 'A', None), (UPDATED, 'B', {'x': 3})]
@@ -0,0 +1,171 @@
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from dental import sync
+from dental.storage import ChangeNotifier, DataManager, DataStore, JsonFileBackend
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = sync.SyncServer(str(tmp_path / 'server'))
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def devices(tmp_path, server):
+    """Two devices with their own data directories, syncing through server"""
+    clients = []
+    for name in ('a', 'b'):
+        data_mgr = DataManager(str(tmp_path / name), backend=JsonFileBackend(DataStore(fsync=False)),
+                               notifier=ChangeNotifier())
+        clients.append(sync.SyncClient(data_mgr, sync.LocalTransport(server)))
+    yield clients
+    for client in clients:
+        client.close()
+        client.data_mgr.backend.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Edit timestamps that only move when the test says so"""
+    now = [1000.0]
+    monkeypatch.setattr(sync.time, 'time', lambda: now[0])
+    return now
+
+
+def test_version_vectors():
+    assert sync.dominates({'a': 2, 'b': 1}, {'a': 1})
+    assert not sync.dominates({'a': 1}, {'b': 1})
+    assert sync.merge_vectors({'a': 2, 'b': 1}, {'a': 1, 'c': 3}) == {'a': 2, 'b': 1, 'c': 3}
+    assert sync.wins({'ts': 2, 'origin': 'a'}, {'ts': 1, 'origin': 'z'})
+    assert sync.wins({'ts': 1, 'origin': 'z'}, {'ts': 1, 'origin': 'a'})
+
+
+def test_records_created_on_one_device_reach_the_other(devices):
+    a, b = devices
+    a.data_mgr.put_patient('P0001', {'name': 'Ada', 'phone': '0123456'})
+    a.sync()
+    result = b.sync()
+    assert result['pulled'] == 1
+    assert b.data_mgr.get_patient('P0001') == {'name': 'Ada', 'phone': '0123456'}
+    # Applying a pulled record is not a local edit to push back
+    assert b.sync()['pushed'] == 0
+
+
+def test_create_collision_moves_the_second_record_and_its_references(devices):
+    a, b = devices
+    a.data_mgr.put_patient(a.data_mgr.next_patient_id(), {'name': 'Ada'})
+    b_id = b.data_mgr.next_patient_id()
+    b.data_mgr.put_patient(b_id, {'name': 'Bob'})
+    b.data_mgr.put_appointment('APT0001', {'patient_id': b_id, 'date': '2024-01-02', 'time': '09:00'})
+    assert b_id == 'P0001'
+    a.sync()
+
+    result = b.sync()
+    assert result['renamed'] == 1
+    patients = b.data_mgr.get_patients()
+    assert patients['P0001'] == {'name': 'Ada'}
+    bob_id = next(patient_id for patient_id, patient in patients.items() if patient['name'] == 'Bob')
+    assert bob_id != 'P0001'
+    assert b.data_mgr.get_appointments()['APT0001']['patient_id'] == bob_id
+
+    a.sync()
+    assert a.data_mgr.get_patient(bob_id) == {'name': 'Bob'}
+    # Neither device hands out a taken ID again
+    assert a.data_mgr.next_patient_id() not in patients
+
+
+def test_concurrent_edits_resolve_to_the_later_one_on_both_devices(devices, clock):
+    a, b = devices
+    a.data_mgr.put_patient('P0001', {'name': 'Ada'})
+    a.sync()
+    b.sync()
+
+    clock[0] += 1
+    a.data_mgr.put_patient('P0001', {'name': 'Ada Lovelace'})
+    clock[0] += 1
+    b.data_mgr.put_patient('P0001', {'name': 'Ada King'})
+    a.sync()
+    result = b.sync()
+    a.sync()
+
+    assert result['conflicts'] == 1
+    assert a.data_mgr.get_patient('P0001') == {'name': 'Ada King'}
+    assert b.data_mgr.get_patient('P0001') == {'name': 'Ada King'}
+
+
+def test_earlier_concurrent_edit_loses(devices, clock):
+    a, b = devices
+    a.data_mgr.put_patient('P0001', {'name': 'Ada'})
+    a.sync()
+    b.sync()
+
+    clock[0] += 1
+    b.data_mgr.put_patient('P0001', {'name': 'Earlier'})
+    clock[0] += 1
+    a.data_mgr.put_patient('P0001', {'name': 'Later'})
+    a.sync()
+    b.sync()
+    a.sync()
+    assert a.data_mgr.get_patient('P0001') == b.data_mgr.get_patient('P0001') == {'name': 'Later'}
+
+
+def test_delete_is_propagated(devices):
+    a, b = devices
+    a.data_mgr.put_treatment('T0001', {'patient_id': 'P0001', 'procedure': 'Filling'})
+    a.sync()
+    b.sync()
+    assert b.data_mgr.get_record(b.data_mgr.treatments_file, 'T0001') is not None
+
+    a.data_mgr.delete_record(a.data_mgr.treatments_file, 'T0001')
+    a.sync()
+    b.sync()
+    assert b.data_mgr.get_record(b.data_mgr.treatments_file, 'T0001') is None
+
+
+def test_unpushed_changes_survive_a_restart(tmp_path, server):
+    data_mgr = DataManager(str(tmp_path / 'c'), backend=JsonFileBackend(DataStore(fsync=False)),
+                           notifier=ChangeNotifier())
+    client = sync.SyncClient(data_mgr, sync.LocalTransport(server))
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    client.close()
+
+    restarted = sync.SyncClient(data_mgr, sync.LocalTransport(server))
+    try:
+        assert restarted.sync()['pushed'] == 1
+    finally:
+        restarted.close()
+        data_mgr.backend.close()
+
+
+def test_server_refuses_a_lan_bind_without_a_token(server):
+    with pytest.raises(ValueError):
+        sync.make_http_server(server, '0.0.0.0', 0)
+    assert sync.is_loopback('127.0.0.1') and sync.is_loopback('localhost')
+    assert not sync.is_loopback('192.168.1.10')
+
+
+def test_http_server_requires_the_token(server):
+    http_server = sync.make_http_server(server, '127.0.0.1', 0, token='s3cret')
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{http_server.server_address[1]}'
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + '/status', timeout=5)
+        assert error.value.code == 401
+
+        transport = sync.HttpTransport(url, token='s3cret')
+        reply = transport.push('device-a', [])
+        assert reply['accepted'] == 0
+        request = urllib.request.Request(url + '/status',
+                                         headers={'Authorization': 'Bearer s3cret'})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            assert json.load(response)['records'] == 0
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
@@ -0,0 +1,56 @@
+from datetime import date
+
+import pytest
+
+from dental import bench
+from dental.schedule import AppointmentSchedule
+from dental.synthetic import counts_for, generate, parse_scale, populate
+
+TODAY = date(2024, 6, 3)
+
+
+def test_parse_scale():
+    assert parse_scale('10k') == 10_000
+    assert parse_scale('1.5M') == 1_500_000
+    assert parse_scale('2500') == 2500
+    with pytest.raises(ValueError):
+        parse_scale('lots')
+    with pytest.raises(ValueError):
+        parse_scale('0')
+    assert counts_for(1000) == {'patients': 250, 'appointments': 1000, 'treatments': 1000}
+
+
+def test_generation_is_seeded():
+    first = generate(400, seed=3, today=TODAY)
+    assert first == generate(400, seed=3, today=TODAY)
+    assert first != generate(400, seed=4, today=TODAY)
+    assert {name: len(records) for name, records in first.items()} == counts_for(400)
+
+
+def test_generated_records_are_consistent():
+    data = generate(400, seed=1, today=TODAY)
+    patient_ids = set(data['patients'])
+    assert all(apt['patient_id'] in patient_ids for apt in data['appointments'].values())
+    dates = [treatment['date'] for treatment in data['treatments'].values()]
+    assert dates == sorted(dates)
+    assert max(dates) <= TODAY.isoformat()
+
+
+def test_populate_books_without_overlaps(data_mgr):
+    assert populate(data_mgr, 400, seed=2, today=TODAY)['appointments'] == 400
+    schedule = AppointmentSchedule(data_mgr)
+    for apt_id, apt in data_mgr.get_appointments().items():
+        schedule.check(apt, apt_id)
+    assert data_mgr.next_appointment_id() == 'APT0401'
+
+
+def test_bench_case_and_compare(data_dir):
+    populate(bench.BenchContext(data_dir, 'json', 40).data_manager(), 40, today=TODAY)
+    result = bench.measure('load', bench.BenchContext(data_dir, 'json', 40), repeat=2)
+    assert (result['case'], result['scale'], result['runs']) == ('load', '40', 2)
+    assert result['peak_kb'] is not None
+
+    slower = dict(result, median=result['median'] * 2)
+    lines, regressions = bench.compare({'results': [result]}, {'results': [slower]})
+    assert regressions == [('load', '40', 'json')]
+    assert lines[-1].endswith('slower')
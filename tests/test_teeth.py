@@ -0,0 +1,58 @@
+import pytest
+
+from dental.teeth import (CARIES, CROWN, FILLED, HEALTHY, IMPLANT, MISSING, SURFACES, ToothChart,
+                          load_chart, parse_surfaces, parse_tooth, procedure_condition, save_chart)
+
+
+def test_parsing():
+    assert parse_tooth('14') == 14
+    with pytest.raises(ValueError):
+        parse_tooth(33)
+    assert parse_surfaces('mod') == ('M', 'O', 'D')
+    assert parse_surfaces('') == SURFACES
+    with pytest.raises(ValueError):
+        parse_surfaces('MX')
+    assert procedure_condition('Implant crown') == IMPLANT
+    assert procedure_condition('Composite filling') == FILLED
+    assert procedure_condition('Cleaning') is None
+
+
+def test_surface_and_whole_tooth_conditions():
+    chart = ToothChart()
+    chart.set(3, CARIES, ('O',))
+    chart.set(3, FILLED, ('M',))
+    assert chart.surfaces(3) == (FILLED, CARIES, HEALTHY, HEALTHY, HEALTHY)
+    assert chart.condition(3) == CARIES
+    chart.set(3, CROWN, ('O',))
+    assert chart.surfaces(3) == (CROWN,) * 5
+    # A surface charted on a crowned tooth replaces the crown
+    chart.set(3, CARIES, ('D',))
+    assert chart.surfaces(3) == (HEALTHY, HEALTHY, CARIES, HEALTHY, HEALTHY)
+    assert chart.apply_procedure(30, 'Extraction') == MISSING
+    assert chart.condition(30) == MISSING
+    with pytest.raises(ValueError):
+        chart.set(1, 99)
+
+
+def test_encoding_round_trip():
+    chart = ToothChart()
+    chart.set(32, IMPLANT)
+    text = chart.encode()
+    assert len(text) == 320
+    assert ToothChart.decode(text) == chart
+    assert ToothChart.decode('') == ToothChart()
+    assert ToothChart.from_record({'teeth': 'not hex'}) == ToothChart()
+    with pytest.raises(ValueError):
+        ToothChart(b'short')
+
+
+def test_chart_is_saved_on_the_patient(data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    patient, chart = load_chart(data_mgr, 'P0001')
+    chart.set(8, FILLED, ('B',))
+    save_chart(data_mgr, 'P0001', chart)
+    assert data_mgr.get_patient('P0001')['name'] == 'Ada'
+    assert load_chart(data_mgr, 'P0001')[1].get(8, 'B') == FILLED
+    assert load_chart(data_mgr, 'P0009') == (None, None)
+    with pytest.raises(KeyError):
+        save_chart(data_mgr, 'P0009', chart)
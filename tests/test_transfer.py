@@ -0,0 +1,129 @@
+import io
+import json
+import os
+import subprocess
+import sys
+from datetime import date
+
+from dental import cli
+from dental.archive import Archive, shared_archive
+from dental.transfer import Importer, export_records, format_for, read_rows
+
+PATIENTS_CSV = """id,name,phone,email,dob
+,Ada Lovelace,555-0101,ada@example.com,1815-12-10
+,Grace Hopper,555 0102,,
+P0042,Mary Jackson,5550103,,1921-04-09
+,ada  LOVELACE,(555) 0101,,
+,No Phone,,,
+,Bad Dob,5550104,,10/12/1990
+"""
+
+
+def import_text(data_mgr, collection, text, fmt='csv', **options):
+    return Importer(data_mgr, collection, **options).run(read_rows(io.StringIO(text), fmt))
+
+
+def test_import_validates_dedupes_and_allocates_ids(data_mgr):
+    importer = import_text(data_mgr, 'patients', PATIENTS_CSV, batch_size=2)
+    assert (importer.imported, importer.duplicates) == (3, 1)
+    assert [line for line, _ in importer.errors] == [6, 7]
+    assert sorted(data_mgr.get_patients()) == ['P0001', 'P0002', 'P0042']
+    # IDs given in the file move the sequence past them
+    assert data_mgr.next_patient_id() == 'P0043'
+
+
+def test_dry_run_writes_nothing(data_mgr):
+    importer = import_text(data_mgr, 'patients', PATIENTS_CSV, dry_run=True)
+    assert importer.imported == 3
+    assert data_mgr.get_patients() == {}
+
+
+def test_update_replaces_records_by_id(data_mgr):
+    import_text(data_mgr, 'patients', PATIENTS_CSV)
+    rows = '{"id": "P0042", "name": "Mary Jackson", "phone": "555-9999"}\n'
+    assert import_text(data_mgr, 'patients', rows, 'jsonl').duplicates == 1
+    importer = import_text(data_mgr, 'patients', rows, 'jsonl', update=True)
+    assert importer.updated == 1
+    assert data_mgr.get_patient('P0042')['phone'] == '555-9999'
+
+
+def test_appointments_need_a_patient_and_a_free_chair(data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada', 'phone': '1'})
+    rows = '\n'.join(json.dumps(row) for row in [
+        {'patient_id': 'P0001', 'date': '2024-03-05', 'time': '9:00 am', 'duration': 60},
+        {'patient_id': 'P0001', 'date': '2024-03-05', 'time': '09:30'},
+        {'patient_id': 'P0001', 'date': '2024-03-05', 'time': '09:30', 'chair': '2'},
+        {'patient_id': 'P0009', 'date': '2024-03-05', 'time': '11:00'},
+        {'patient_id': 'P0001', 'date': '2024-03-05', 'time': '12:00', 'status': 'maybe'},
+    ]) + '\nnot json\n'
+    importer = import_text(data_mgr, 'appointments', rows, 'jsonl')
+    assert importer.imported == 2
+    messages = dict(importer.errors)
+    assert 'already booked' in messages[2]
+    assert messages[4] == 'unknown patient P0009'
+    assert 'status must be one of' in messages[5]
+    assert messages[6].startswith('invalid JSON')
+    assert {apt['time'] for apt in data_mgr.get_appointments().values()} == {'09:00', '09:30'}
+    importer.close()
+    assert not data_mgr.notifier.has_listeners(data_mgr.appointments_file)
+
+
+def test_export_writes_records_in_id_order(data_mgr):
+    data_mgr.put_patient('P0010', {'name': 'Ten', 'phone': '10'})
+    data_mgr.put_patient('P0002', {'name': 'Two', 'phone': '2', 'teeth': 'ff'})
+    out = io.StringIO()
+    assert export_records(data_mgr, 'patients', out, 'csv') == 2
+    lines = out.getvalue().splitlines()
+    assert lines[0] == 'id,name,phone,email,dob,created_at'
+    assert [line.split(',')[0] for line in lines[1:]] == ['P0002', 'P0010']
+    out = io.StringIO()
+    export_records(data_mgr, 'patients', out, 'jsonl')
+    assert json.loads(out.getvalue().splitlines()[0])['teeth'] == 'ff'
+
+
+def test_export_streams_archived_records_in_id_order(data_mgr, monkeypatch):
+    data_mgr.save_treatments({
+        'T0001': {'patient_id': 'P0001', 'date': '2020-05-01'},
+        'T0002': {'patient_id': 'P0001', 'date': '2024-01-01'},
+        'T0003': {'patient_id': 'P0002', 'date': '2020-01-01'},
+    })
+    shared_archive(data_mgr).archive(data_mgr, date(2021, 1, 1))
+
+    def load_everything(*args):
+        raise AssertionError('the archive was loaded as a whole')
+    monkeypatch.setattr(Archive, 'records_between', load_everything)
+    out = io.StringIO()
+    assert export_records(data_mgr, 'treatments', out, 'jsonl', include_archive=True) == 3
+    assert [json.loads(line)['date'] for line in out.getvalue().splitlines()] == [
+        '2020-05-01', '2024-01-01', '2020-01-01']
+
+
+def test_format_for():
+    assert format_for('records.ndjson') == 'jsonl'
+    assert format_for('records.txt') == 'csv'
+    assert format_for('records.txt', 'jsonl') == 'jsonl'
+
+
+def test_cli_round_trip(tmp_path, capsys):
+    data_dir = str(tmp_path / 'data')
+    source = tmp_path / 'patients.csv'
+    source.write_text(PATIENTS_CSV)
+    assert cli.main(['--data-dir', data_dir, 'import', 'patients', str(source)]) == 1
+    captured = capsys.readouterr()
+    assert 'imported 3, updated 0, skipped 1 duplicates, rejected 2' in captured.out
+    assert f'{source}:6: missing phone' in captured.err
+
+    target = tmp_path / 'patients.jsonl'
+    assert cli.main(['--data-dir', data_dir, 'export', 'patients', str(target)]) == 0
+    assert [json.loads(line)['id'] for line in target.read_text().splitlines()] == [
+        'P0001', 'P0002', 'P0042']
+
+
+def test_cli_only_imports_sync_for_the_sync_commands(tmp_path):
+    code = ("import sys; from dental import cli; "
+            f"cli.main(['--data-dir', {str(tmp_path)!r}, 'export', 'patients', '-']); "
+            "print('dental.sync' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            timeout=60)
+    assert result.stdout.strip().splitlines()[-1] == 'False'
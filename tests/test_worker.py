@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from dental.worker import AsyncDataManager, IoWorker
+
+
+@pytest.fixture
+def worker():
+    worker = IoWorker(name='test-io')
+    yield worker
+    worker.stop(timeout=5)
+
+
+def block(worker):
+    """Keep the worker busy until the returned event is set"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def wait():
+        started.set()
+        release.wait(5)
+    worker.submit(wait)
+    started.wait(5)
+    return release
+
+
+def test_tasks_run_in_submission_order(worker):
+    seen = []
+    for number in range(5):
+        worker.submit(seen.append, number)
+    assert worker.wait_idle(5)
+    assert seen == [0, 1, 2, 3, 4]
+
+
+def test_result_goes_to_callback(worker):
+    results = []
+    worker.submit(lambda a, b: a + b, 2, 3, callback=results.append)
+    assert worker.wait_idle(5)
+    assert results == [5]
+
+
+def test_failure_goes_to_error_callback(worker):
+    errors = []
+    worker.submit(lambda: 1 / 0, error_callback=errors.append)
+    assert worker.wait_idle(5)
+    assert isinstance(errors[0], ZeroDivisionError)
+
+
+def test_queued_task_with_same_key_is_replaced_and_every_caller_called_back(worker):
+    release = block(worker)
+    runs, results = [], []
+    worker.submit(runs.append, 'first', key='save', callback=results.append)
+    worker.submit(runs.append, 'second', key='save', callback=results.append)
+    release.set()
+    assert worker.wait_idle(5)
+    assert runs == ['second']
+    assert results == [None, None]
+
+
+def test_dispatch_receives_callbacks(worker):
+    dispatched = []
+    worker.dispatch = lambda fn: (dispatched.append(fn), fn())
+    results = []
+    worker.submit(lambda: 'done', callback=results.append)
+    assert worker.wait_idle(5)
+    assert len(dispatched) == 1 and results == ['done']
+
+
+def test_stopped_worker_rejects_tasks(worker):
+    worker.submit(lambda: None)
+    worker.stop(timeout=5)
+    with pytest.raises(RuntimeError):
+        worker.submit(lambda: None)
+
+
+def test_async_data_manager_calls_on_the_worker(worker, data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    names = []
+    AsyncDataManager(data_mgr, worker).call(
+        lambda: data_mgr.get_patient('P0001')['name'], callback=names.append)
+    assert worker.wait_idle(5)
+    assert names == ['Ada']
+
+
+def test_queued_saves_of_one_record_are_coalesced(worker, data_mgr):
+    data_mgr.put_patient('P0001', {'name': 'Ada'})
+    writes = []
+    data_mgr.subscribe(data_mgr.patients_file, lambda *change: writes.append(change[2]))
+    data_io = AsyncDataManager(data_mgr, worker)
+    release = block(worker)
+    for teeth in ('a', 'b', 'c'):
+        data_io.call(lambda record: data_mgr.put_patient('P0001', record),
+                     {'name': 'Ada', 'teeth': teeth}, key=('chart', 'P0001'))
+    release.set()
+    assert worker.wait_idle(5)
+    assert writes == [{'name': 'Ada', 'teeth': 'c'}]